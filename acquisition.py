@@ -0,0 +1,39 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Helpers to read several sensors at the same time. Every sensor is
+connected to its own UART, so the reads can run in parallel and one
+acquisition phase only takes as long as the slowest sensor.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def read_sensors(jobs, concurrent=True):
+    """
+        Description: Runs one read job per sensor, either in parallel (one thread per sensor)
+                     or one after another
+        Parameters: jobs: dict which maps a sensor name to a callable without arguments,
+                          e.g. {'O3': lambda: sensor.read_bulk(delay=0.2, iterations=5)}
+                    concurrent: if False the jobs are executed sequentially
+        Return: tuple (results, timings); results maps the sensor name to the return value
+                of its job, timings maps the sensor name to (started_at, finished_at) as
+                unix timestamps
+    """
+    def timed(job):
+        started_at = time.time()
+        result = job()
+        return result, (started_at, time.time())
+
+    if concurrent and len(jobs) > 1:
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            futures = {name: executor.submit(timed, job) for name, job in jobs.items()}
+            outcomes = {name: future.result() for name, future in futures.items()}
+    else:
+        outcomes = {name: timed(job) for name, job in jobs.items()}
+
+    results = {name: outcome[0] for name, outcome in outcomes.items()}
+    timings = {name: outcome[1] for name, outcome in outcomes.items()}
+    return results, timings
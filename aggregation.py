@@ -0,0 +1,462 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Aggregation of the raw samples of one read_bulk call with the
+C implemented builtins and the statistics module. median() and trimmed_mean()
+work on any sequence of floats.
+
+RunningStats aggregates a stream of samples in constant memory: count, mean
+and variance (Welford), min, max and quantiles. Up to `capacity` samples are
+kept, so short reads give exact results; longer streams continue in a
+QuantileSketch with a relative error of the quantiles of at most `accuracy`.
+Two RunningStats merge exactly (Chan et al.) for count, mean, variance, min
+and max, so the statistics of threads, sensors or time buckets can be
+computed separately and combined.
+
+SamplingPolicy decides when a read_bulk call has enough samples: as soon as
+the confidence interval of the mean is within a tolerance, or when the time
+budget is used up. The interval uses the quantile of Student's t distribution,
+with three samples it is more than twice as wide as with the normal quantile.
+"""
+
+import math
+import statistics
+import functools
+from array import array
+
+
+# aggregations of RunningStats.aggregate(), the "aggregate" of the read_bulk calls
+AGGREGATIONS = ('mean', 'median', 'trimmed_mean', 'std', 'min', 'max')
+
+
+def median(samples):
+    """
+        Description: Median, not affected by single outliers
+    """
+    return float(statistics.median(samples))
+
+
+def trimmed_mean(samples, proportion=0.2):
+    """
+        Description: Mean without the smallest and largest samples
+        Parameters: samples: sequence of floats
+                    proportion: part of the samples cut off at each end
+        Return: float
+    """
+    ordered = sorted(samples)
+    cut = int(len(ordered) * proportion)
+    if 2 * cut >= len(ordered):
+        return median(ordered)
+    return statistics.fmean(ordered[cut:len(ordered) - cut])
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with logarithmic buckets (as DDSketch).
+    """
+    __slots__ = ('accuracy', 'max_bins', 'gamma', '_log_gamma', 'positive', 'negative', 'zeros',
+                 'count')
+
+    def __init__(self, accuracy=0.01, max_bins=1024):
+        """
+            ### Constructor ###
+            Parameters: accuracy: relative error of the quantiles
+                        max_bins: upper limit of the buckets, beyond it the buckets of the
+                                  smallest magnitudes are combined
+        """
+        self.accuracy = accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {} # bucket index -> count
+        self.negative = {} # bucket index of -value -> count
+        self.zeros = 0
+        self.count = 0
+
+
+    def _index(self, value):
+        return math.ceil(math.log(value) / self._log_gamma)
+
+
+    def _value(self, index):
+        """
+            Description: Value of a bucket with at most accuracy relative error
+        """
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+
+    def add(self, value, count=1):
+        """
+            Description: Adds a value count times
+        """
+        if value > 1e-12:
+            index = self._index(value)
+            self.positive[index] = self.positive.get(index, 0) + count
+        elif value < -1e-12:
+            index = self._index(-value)
+            self.negative[index] = self.negative.get(index, 0) + count
+        else:
+            self.zeros += count
+        self.count += count
+        if len(self.positive) + len(self.negative) > self.max_bins:
+            self._collapse()
+
+
+    def _collapse(self):
+        """
+            Description: Combines the two buckets of the smallest magnitude
+        """
+        while len(self.positive) + len(self.negative) > self.max_bins:
+            bins = self.positive if len(self.positive) >= len(self.negative) else self.negative
+            lowest, second = sorted(bins)[:2]
+            bins[second] += bins.pop(lowest)
+
+
+    def merge(self, other):
+        """
+            Description: Adds the values of another sketch with the same accuracy
+            Return: self
+        """
+        if other.gamma != self.gamma:
+            raise ValueError('Only sketches with the same accuracy can be merged')
+        for bins, other_bins in [(self.positive, other.positive), (self.negative, other.negative)]:
+            for index, count in other_bins.items():
+                bins[index] = bins.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self._collapse()
+        return self
+
+
+    def buckets(self):
+        """
+            Description: Values and counts of all buckets in ascending order
+            Return: list of tuples (value, count)
+        """
+        return ([(-self._value(index), self.negative[index]) for index in sorted(self.negative, reverse=True)]
+                + ([(0.0, self.zeros)] if self.zeros else [])
+                + [(self._value(index), self.positive[index]) for index in sorted(self.positive)])
+
+
+    def quantile(self, q):
+        """
+            Description: Approximate q-quantile, 0 <= q <= 1
+        """
+        if not self.count:
+            raise ValueError('The sketch is empty')
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in self.buckets():
+            seen += count
+            if seen > rank:
+                return value
+        return value
+
+
+class RunningStats:
+    """
+    Statistics of a stream of samples in constant memory.
+    """
+    __slots__ = ('capacity', 'accuracy', 'count', 'mean', 'm2', 'min', 'max', '_samples',
+                 '_sketch', '_quantiles')
+
+    def __init__(self, capacity=64, accuracy=0.01):
+        """
+            ### Constructor ###
+            Parameters: capacity: number of samples kept for exact quantiles
+                        accuracy: relative error of the quantiles beyond capacity samples
+        """
+        self.capacity = capacity
+        self.accuracy = accuracy
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # sum of the squared deviations from the mean
+        self.min = math.inf
+        self.max = -math.inf
+        self._samples = array('d') # exact samples until the capacity is exceeded
+        self._sketch = None
+        self._quantiles = True # False for statistics created from moments
+
+
+    @classmethod
+    def from_moments(cls, count=0, mean=0.0, m2=0.0, minimum=math.inf, maximum=-math.inf):
+        """
+            Description: Statistics without quantiles, e.g. of a rollup bucket. add() and
+                         merge() only update the moments, min and max.
+        """
+        stats = cls()
+        stats.count, stats.mean, stats.m2 = count, mean, m2
+        stats.min, stats.max = minimum, maximum
+        stats._quantiles = False
+        return stats
+
+
+    def add(self, value):
+        """
+            Description: Adds one sample
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+        if not self._quantiles:
+            return
+        if self._sketch is not None:
+            self._sketch.add(value)
+        else:
+            self._samples.append(value)
+            if len(self._samples) > self.capacity:
+                self._spill()
+
+
+    def _spill(self):
+        """
+            Description: Moves the kept samples into a sketch
+        """
+        if self._sketch is None:
+            self._sketch = QuantileSketch(self.accuracy)
+        for value in self._samples:
+            self._sketch.add(value)
+        self._samples = array('d')
+
+
+    def merge(self, other):
+        """
+            Description: Adds the samples of another RunningStats
+            Return: self
+        """
+        if not other.count:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+        self._quantiles = self._quantiles and other._quantiles
+        if self._sketch is None and other._sketch is None \
+                and len(self._samples) + len(other._samples) <= self.capacity:
+            self._samples.extend(other._samples)
+        else:
+            self._spill()
+            if other._sketch is not None:
+                self._sketch.merge(other._sketch)
+            for value in other._samples:
+                self._sketch.add(value)
+        return self
+
+
+    @property
+    def exact(self):
+        """
+            Description: True while all samples are kept and the quantiles are exact
+        """
+        return self._sketch is None and self._quantiles
+
+
+    @property
+    def variance(self):
+        """
+            Description: Sample variance, 0 for less than two samples
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+
+    @property
+    def std(self):
+        """
+            Description: Sample standard deviation, 0 for less than two samples
+        """
+        return math.sqrt(self.variance)
+
+
+    def quantile(self, q):
+        """
+            Description: q-quantile, exact for at most capacity samples
+        """
+        if not self._quantiles:
+            raise ValueError('No quantiles for statistics created from moments')
+        if self._sketch is None:
+            if not self._samples:
+                raise ValueError('No samples')
+            ordered = sorted(self._samples)
+            position = q * (len(ordered) - 1)
+            lower = math.floor(position)
+            upper = min(lower + 1, len(ordered) - 1)
+            return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+        return min(max(self._sketch.quantile(q), self.min), self.max)
+
+
+    def trimmed_mean(self, proportion=0.2):
+        """
+            Description: Mean without the smallest and largest samples, see trimmed_mean()
+        """
+        if self._sketch is None:
+            if not self._quantiles:
+                raise ValueError('No quantiles for statistics created from moments')
+            return trimmed_mean(self._samples, proportion)
+
+        # buckets between the two cut off ranks
+        cut = int(self.count * proportion)
+        if 2 * cut >= self.count:
+            return self.quantile(0.5)
+        total = 0.0
+        seen = 0
+        for value, count in self._sketch.buckets():
+            kept = min(seen + count, self.count - cut) - max(seen, cut)
+            if kept > 0:
+                total += value * kept
+            seen += count
+        return total / (self.count - 2 * cut)
+
+
+    def aggregate(self, method='mean'):
+        """
+            Description: Value of one of the AGGREGATIONS
+        """
+        if method == 'mean':
+            return self.mean
+        if method == 'median':
+            return self.quantile(0.5)
+        if method == 'trimmed_mean':
+            return self.trimmed_mean()
+        if method == 'std':
+            return self.std
+        if method == 'min':
+            return float(self.min)
+        if method == 'max':
+            return float(self.max)
+        raise ValueError(f'Unknown aggregation "{method}", use one of {", ".join(AGGREGATIONS)}')
+
+
+    def __len__(self):
+        return self.count
+
+
+def merge(stats):
+    """
+        Description: Combines several RunningStats into a new one
+        Parameters: stats: iterable of RunningStats
+        Return: RunningStats
+    """
+    result = RunningStats()
+    for other in stats:
+        result.merge(other)
+    return result
+
+
+def t_probability(t, df):
+    """
+        Description: Probability that |T| <= t for Student's t distribution with an integer
+                     number of degrees of freedom (Abramowitz & Stegun 26.7.3 and 26.7.4)
+        Parameters: t: non-negative float
+                    df: degrees of freedom, at least 1
+        Return: float
+    """
+    theta = math.atan(t / math.sqrt(df))
+    sin, cos = math.sin(theta), math.cos(theta)
+    total = 0.0
+    if df % 2:
+        term = cos
+        for j in range(1, (df - 1) // 2 + 1):
+            total += term
+            term *= cos * cos * 2 * j / (2 * j + 1)
+        return 2 / math.pi * (theta + sin * total)
+    term = 1.0
+    for j in range(1, df // 2 + 1):
+        total += term
+        term *= cos * cos * (2 * j - 1) / (2 * j)
+    return sin * total
+
+
+@functools.lru_cache(maxsize=None)
+def t_quantile(confidence, df):
+    """
+        Description: Half width of the two-sided confidence interval of Student's t distribution
+                     in standard errors, e.g. 4.303 for confidence 0.95 and two degrees of
+                     freedom. Bisection of t_probability(); beyond 100 degrees of freedom
+                     the expansion of Abramowitz & Stegun 26.7.5 around the normal quantile,
+                     which is exact to about 1e-9 there.
+        Parameters: confidence: probability of the interval, between 0 and 1
+                    df: degrees of freedom, at least 1
+        Return: float
+    """
+    if df > 100:
+        z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+        terms = [(z ** 3 + z) / 4,
+                 (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96,
+                 (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384,
+                 (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160]
+        return z + sum(term / df ** power for power, term in enumerate(terms, 1))
+
+    lower, upper = 0.0, 1.0
+    while t_probability(upper, df) < confidence:
+        lower, upper = upper, 2 * upper
+    for _ in range(60):
+        middle = (lower + upper) / 2
+        if t_probability(middle, df) < confidence:
+            lower = middle
+        else:
+            upper = middle
+    return (lower + upper) / 2
+
+
+class SamplingPolicy:
+    """
+    Stopping rule of adaptive sampling.
+    """
+
+    def __init__(self, tolerance, confidence=0.95, min_samples=3, budget=10):
+        """
+            ### Constructor ###
+            Parameters: tolerance: half width of the confidence interval of the mean which is
+                                   enough, in the unit of the samples
+                        confidence: confidence level of the interval
+                        min_samples: samples which are always taken
+                        budget: maximal sampling time in seconds
+        """
+        if tolerance <= 0 or not 0 < confidence < 1 or min_samples < 2:
+            raise ValueError('Sampling needs a positive tolerance, a confidence between 0 and 1 '
+                             'and at least two samples')
+        self.tolerance = tolerance
+        self.confidence = confidence
+        self.min_samples = min_samples
+        self.budget = budget
+
+
+    def half_width(self, stats):
+        """
+            Description: Half width of the confidence interval of the mean
+            Parameters: stats: RunningStats of the samples
+            Return: float, inf for less than two samples
+        """
+        if stats.count < 2:
+            return math.inf
+        return t_quantile(self.confidence, stats.count - 1) * stats.std / math.sqrt(stats.count)
+
+
+    def done(self, stats, elapsed, taken=None):
+        """
+            Description: Checks whether sampling can stop
+            Parameters: stats: RunningStats of the samples so far
+                        elapsed: sampling time so far in seconds
+                        taken: samples taken within elapsed, default stats.count; less if
+                               stats holds samples from before, e.g. the history of a Cozir
+            Return: True if the interval is within the tolerance or the next sample would
+                    exceed the budget, never before min_samples
+        """
+        if stats.count < self.min_samples:
+            return False
+        taken = stats.count if taken is None else taken
+        # time of the next sample estimated from the samples taken so far
+        next_sample = elapsed / taken if taken else 0.0
+        return (self.half_width(stats) <= self.tolerance
+                or elapsed + next_sample > self.budget)
@@ -0,0 +1,355 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Columnar archive of closed months for long-horizon analysis. The
+export writes one file per station and month (UTC) with the columns of every
+channel next to each other:
+
+    time   uint32 difference to the previous time in ms (0 for the first row)
+    value  float32
+    std    float32, NaN if unknown
+
+plus a small index (index.json) with the offsets, the number of rows and the
+absolute time at the start of every block of BLOCK rows. The reader maps the
+files into memory: the values are NumPy views of the file without any copy, the
+times are decoded only for the blocks of the requested range. Loading years of
+several stations therefore neither creates Python objects per row nor reads
+data outside of the range.
+
+Only months which are over are exported. A month is exported again if the
+database holds more rows for it, e.g. after late uploads. A month of which
+retention.py deleted rows is never exported again: the archive keeps its
+complete copy.
+
+The channel "node 1/NO2" of a collector database (collector.py) belongs to the
+station "node 1"; the channels of a station database have no station prefix
+and are archived under the name given with --station.
+
+Usage: python archive.py export --db <database> --archive <folder> [--station "node 1"]
+       python archive.py info --archive <folder>
+"""
+
+import os
+import json
+import mmap
+import logging
+from datetime import datetime, timezone
+
+import numpy as np
+
+# rows per block of the time index
+BLOCK = 4096
+
+COLUMNS = [('time', np.dtype('<u4')), ('value', np.dtype('<f4')), ('std', np.dtype('<f4'))]
+
+
+def month_range(month):
+    """
+        Description: Start and end of a month 'YYYY-MM' (UTC) as unix time in ms
+    """
+    start = datetime.strptime(month, '%Y-%m').replace(tzinfo=timezone.utc)
+    end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return round(start.timestamp() * 1000), round(end.timestamp() * 1000)
+
+
+def month_of(time_ms):
+    """
+        Description: Month 'YYYY-MM' (UTC) of a unix time in ms
+    """
+    return datetime.fromtimestamp(time_ms / 1000, timezone.utc).strftime('%Y-%m')
+
+
+def encode(times, values, stds):
+    """
+        Description: Columns of one channel in the archive format
+        Parameters: times: sorted int64 array of unix times in ms
+                    values, stds: float arrays of the same length, NaN for unknown std
+        Return: tuple (dict column name -> bytes, list of the times at the block starts)
+        Raises: ValueError if two times are more than 49 days apart
+    """
+    deltas = np.diff(times, prepend=times[:1])
+    if len(deltas) and deltas.max() > np.iinfo(np.uint32).max:
+        raise ValueError('Gap of more than 49 days within a partition')
+    data = {'time': deltas.astype('<u4').tobytes(),
+            'value': np.asarray(values, dtype='<f4').tobytes(),
+            'std': np.asarray(stds, dtype='<f4').tobytes()}
+    return data, times[::BLOCK].tolist()
+
+
+class ArchiveWriter:
+    """
+    Export of closed months from a sqlite database.
+    """
+
+    def __init__(self, path):
+        """
+            ### Constructor ###
+            Parameters: path: folder of the archive, created if necessary
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.index = read_index(path)
+
+
+    def export(self, con, station=None, until=None) -> list:
+        """
+            Description: Writes the months before until which are missing or incomplete
+            Parameters: con: sqlite3 connection to a database of local_db.py or collector.py
+                        station: station name of channels without station prefix
+                        until: unix time in ms, default the start of the current month (UTC)
+            Return: list of the written partitions (station, month)
+        """
+        until = month_range(month_of(datetime.now(timezone.utc).timestamp() * 1000))[0] \
+            if until is None else until
+
+        # channel id -> (station, channel name in the archive, unit)
+        channels = {}
+        for channel, sensor, quantity, unit in con.execute(
+                'SELECT id, sensor, quantity, unit FROM channel'):
+            owner, _, name = sensor.rpartition('/')
+            owner = owner or station
+            if owner is None:
+                raise ValueError(f'Channel {sensor} has no station prefix, give a station name')
+            channels[channel] = (owner, f'{name}/{quantity}', unit)
+
+        # rows per station, month and channel
+        counts = {}
+        for channel, month, count in con.execute(
+                """SELECT channel_id, strftime('%Y-%m', time / 1000, 'unixepoch') AS month, count(*)
+                   FROM measurement WHERE time < ? GROUP BY channel_id, month""", (until,)):
+            owner, name, _ = channels[channel]
+            counts.setdefault((owner, month), {})[channel] = count
+
+        written = []
+        for (owner, month), channel_counts in sorted(counts.items()):
+            stored = {name: entry['rows'] for name, entry in self.index['partitions']
+                      .get(owner, {}).get(month, {}).get('channels', {}).items()}
+            rows = {channels[channel][1]: count for channel, count in channel_counts.items()}
+            if rows == stored:
+                continue
+            shrunk = [name for name, count in stored.items() if rows.get(name, 0) < count]
+            if shrunk:
+                # rewriting would lose the rows which were deleted from the database
+                logging.warning(f"{owner} {month}: the database holds fewer rows of "
+                                f"{', '.join(shrunk)} than the archive, the month is kept")
+                continue
+            self._write_partition(con, owner, month,
+                                  {channel: channels[channel] for channel in channel_counts})
+            written.append((owner, month))
+
+        if written:
+            write_json(os.path.join(self.path, 'index.json'), self.index)
+        return written
+
+
+    def _write_partition(self, con, station, month, channels):
+        """
+            Description: Writes the file of one station and month and its index entry
+        """
+        start, end = month_range(month)
+        relative = os.path.join(station, f'{month}.bin')
+        os.makedirs(os.path.join(self.path, station), exist_ok=True)
+
+        entries = {}
+        offset = 0
+        temporary = os.path.join(self.path, relative + '.tmp')
+        with open(temporary, 'wb') as file:
+            for channel, (_, name, unit) in sorted(channels.items(), key=lambda item: item[1][1]):
+                rows = con.execute("""SELECT time, value, std FROM measurement
+                                      WHERE channel_id = ? AND time >= ? AND time < ?
+                                      ORDER BY time""", (channel, start, end)).fetchall()
+                table = np.array(rows, dtype=float).reshape(-1, 3) # None -> NaN
+                times = table[:, 0].astype(np.int64) # ms times are exact in float64
+                data, checkpoints = encode(times, table[:, 1], table[:, 2])
+
+                offsets = {}
+                for column, _ in COLUMNS:
+                    offsets[column] = offset
+                    file.write(data[column])
+                    offset += len(data[column])
+                    padding = -offset % 8 # aligned columns for the views
+                    file.write(bytes(padding))
+                    offset += padding
+                entries[name] = {'unit': unit, 'rows': len(rows), 'first': int(times[0]),
+                                 'last': int(times[-1]), 'offsets': offsets,
+                                 'checkpoints': checkpoints}
+        os.replace(temporary, os.path.join(self.path, relative))
+
+        self.index['partitions'].setdefault(station, {})[month] = {
+            'file': relative, 'start': start, 'end': end, 'channels': entries}
+
+
+def read_index(path) -> dict:
+    try:
+        with open(os.path.join(path, 'index.json'), encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {'version': 1, 'block': BLOCK, 'partitions': {}}
+
+
+def write_json(path, content):
+    """
+        Description: Writes a JSON file, replaces it atomically
+    """
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as file:
+        json.dump(content, file, indent=1, sort_keys=True)
+    os.replace(temporary, path)
+
+
+class Archive:
+    """
+    Memory mapped reader of an archive.
+    """
+
+    def __init__(self, path):
+        """
+            ### Constructor ###
+            Parameters: path: folder of the archive
+        """
+        self.path = path
+        self.index = read_index(path)
+        self.block = self.index['block']
+        self._maps = {} # file -> mmap
+
+
+    def stations(self) -> list:
+        return sorted(self.index['partitions'])
+
+
+    def channels(self, station) -> dict:
+        """
+            Description: Channels of a station
+            Return: dict which maps 'sensor/quantity' to the unit
+        """
+        return {name: entry['unit']
+                for partition in self.index['partitions'].get(station, {}).values()
+                for name, entry in partition['channels'].items()}
+
+
+    def _column(self, partition, entry, column):
+        """
+            Description: View of one column of a partition file without copy
+        """
+        if partition['file'] not in self._maps:
+            with open(os.path.join(self.path, partition['file']), 'rb') as file:
+                self._maps[partition['file']] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        dtype = dict(COLUMNS)[column]
+        return np.frombuffer(self._maps[partition['file']], dtype=dtype, count=entry['rows'],
+                             offset=entry['offsets'][column])
+
+
+    def segments(self, station, sensor, quantity='concentration', start=None, end=None):
+        """
+            Description: Values of a channel in a time range, one segment per month
+            Parameters: station: station name
+                        sensor: sensor name, e.g. 'NO2'
+                        quantity: e.g. 'concentration' or 'raw'
+                        start, end: unix time range in ms, end exclusive, default all
+            Return: yields tuples (times, values, stds): times is an int64 array of unix
+                    times in ms, values and stds are float32 views of the file
+        """
+        start = -2 ** 63 if start is None else start
+        end = 2 ** 63 - 1 if end is None else end
+        name = f'{sensor}/{quantity}'
+        for month, partition in sorted(self.index['partitions'].get(station, {}).items()):
+            entry = partition['channels'].get(name)
+            if entry is None or entry['last'] < start or entry['first'] >= end:
+                continue
+
+            # decode only the blocks which overlap the range
+            checkpoints = np.asarray(entry['checkpoints'], dtype=np.int64)
+            first_block = max(int(np.searchsorted(checkpoints, start, 'right')) - 1, 0)
+            last_block = int(np.searchsorted(checkpoints, end, 'left'))
+            first_row = first_block * self.block
+            last_row = min(last_block * self.block, entry['rows'])
+
+            deltas = self._column(partition, entry, 'time')[first_row:last_row]
+            times = np.cumsum(deltas, dtype=np.int64)
+            times += checkpoints[first_block] - times[0]
+            begin = int(np.searchsorted(times, start, 'left'))
+            stop = int(np.searchsorted(times, end, 'left'))
+            if begin < stop:
+                rows = slice(first_row + begin, first_row + stop)
+                yield (times[begin:stop], self._column(partition, entry, 'value')[rows],
+                       self._column(partition, entry, 'std')[rows])
+
+
+    def read(self, station, sensor, quantity='concentration', start=None, end=None):
+        """
+            Description: Values of a channel in a time range, see segments(). Within one month
+                         the values are views of the file, across months they are copied
+                         into one array.
+            Return: tuple (times, values, stds)
+        """
+        segments = list(self.segments(station, sensor, quantity, start, end))
+        if len(segments) == 1:
+            return segments[0]
+        if not segments:
+            return (np.empty(0, np.int64), np.empty(0, np.float32), np.empty(0, np.float32))
+        return tuple(np.concatenate(column) for column in zip(*segments))
+
+
+    def read_many(self, sensor, stations=None, quantity='concentration', start=None, end=None) -> dict:
+        """
+            Description: Values of one sensor of several stations
+            Parameters: stations: list of station names, default all
+            Return: dict which maps the station name to (times, values, stds)
+        """
+        stations = self.stations() if stations is None else stations
+        return {station: self.read(station, sensor, quantity, start, end) for station in stations
+                if f'{sensor}/{quantity}' in self.channels(station)}
+
+
+    def frame(self, station, sensor, quantity='concentration', start=None, end=None):
+        """
+            Description: Values of a channel as pandas DataFrame with the columns value and std
+                         and the time (UTC) as index
+        """
+        import pandas as pd
+
+        times, values, stds = self.read(station, sensor, quantity, start, end)
+        return pd.DataFrame({'value': values, 'std': stds},
+                            index=pd.to_datetime(times, unit='ms', utc=True).rename('timestamp'),
+                            copy=False)
+
+
+    def close(self):
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps = {}
+
+
+if __name__ == "__main__":
+
+    import sqlite3
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Columnar archive of closed months.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='export the closed months of a database')
+    export_parser.add_argument('--db', required=True)
+    export_parser.add_argument('--archive', required=True)
+    export_parser.add_argument('--station', help='name of channels without station prefix')
+    info_parser = commands.add_parser('info', help='list the archived months')
+    info_parser.add_argument('--archive', required=True)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        connection = sqlite3.connect(args.db)
+        written = ArchiveWriter(args.archive).export(connection, args.station)
+        connection.close()
+        for station, month in written:
+            print(f'{station} {month} written')
+        print(f'{len(written)} partitions written')
+    else:
+        archive = Archive(args.archive)
+        for station in archive.stations():
+            months = archive.index['partitions'][station]
+            rows = sum(entry['rows'] for partition in months.values()
+                       for entry in partition['channels'].values())
+            size = sum(os.path.getsize(os.path.join(args.archive, partition['file']))
+                       for partition in months.values())
+            print(f"{station}: {min(months)} to {max(months)}, {len(archive.channels(station))} channels, "
+                  f"{rows} values, {size / 1e6:.1f} MB")
@@ -0,0 +1,172 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Non-blocking serial port for asyncio and a shared background event
+loop. The sensor drivers do all their serial I/O on this one loop; their
+blocking methods only submit a coroutine to it and wait for the result.
+"""
+
+import asyncio
+import threading
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def background_loop():
+    """
+        Description: Returns the event loop that drives all serial ports and starts it in a
+                     daemon thread on first use
+        Parameters: None
+        Return: asyncio event loop
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='serial-io', daemon=True).start()
+    return _loop
+
+
+def run_sync(coroutine):
+    """
+        Description: Runs a coroutine on the background loop and blocks until it is done.
+                     Must not be called from a coroutine running on that loop.
+        Parameters: coroutine: coroutine object to run
+        Return: return value of the coroutine
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, background_loop()).result()
+
+
+class AsyncSerial:
+    """
+    Serial port which waits for data with the event loop instead of blocking in read().
+    """
+
+    def __init__(self, port, baudrate=9600):
+        """
+            ### Constructor ###
+            Opens the port in non-blocking mode (timeout = 0)
+        """
+        import serial # loaded with the first port, not when the module is imported
+
+        self.ser = serial.Serial(port, baudrate = baudrate,
+                                 parity = serial.PARITY_NONE,
+                                 stopbits = serial.STOPBITS_ONE,
+                                 bytesize = serial.EIGHTBITS,
+                                 timeout = 0)
+        self._buffer = bytearray()
+
+
+    async def _fill(self, timeout):
+        """
+            Description: Waits until the port is readable and moves all available bytes into
+                         the internal buffer
+            Parameters: timeout: maximal waiting time in seconds
+            Return: False if no data arrived within the timeout, True otherwise
+        """
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        fd = self.ser.fileno()
+        loop.add_reader(fd, lambda: readable.done() or readable.set_result(True))
+        # no asyncio.wait_for(): up to Python 3.11 it loses a cancellation which arrives
+        # together with the data, and a cancelled read loop would go on forever
+        timer = loop.call_later(timeout, lambda: readable.done() or readable.set_result(False))
+        try:
+            if not await readable:
+                return False
+        finally:
+            timer.cancel()
+            loop.remove_reader(fd)
+
+        self._buffer += self.ser.read(max(self.ser.in_waiting, 1))
+        return True
+
+
+    async def _read_buffered(self, find_end, timeout):
+        """
+            Description: Collects bytes until find_end returns the end index of the requested
+                         data or the timeout expires
+            Parameters: find_end: function which maps the buffer to an end index or None
+                        timeout: maximal waiting time in seconds
+            Return: bytes up to the end index, or everything received on timeout
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        self._buffer += self.ser.read(self.ser.in_waiting)
+        end = find_end(self._buffer)
+        while end is None:
+            remaining = deadline - loop.time()
+            if remaining <= 0 or not await self._fill(remaining):
+                end = len(self._buffer)
+                break
+            end = find_end(self._buffer)
+
+        data = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return data
+
+
+    async def read(self, size, timeout=1):
+        """
+            Description: Reads size bytes, returns early with fewer bytes on timeout
+            Parameters: size: number of bytes
+                        timeout: maximal waiting time in seconds
+            Return: bytes
+        """
+        return await self._read_buffered(
+            lambda buffer: size if len(buffer) >= size else None, timeout)
+
+
+    async def read_until(self, expected=b'\n', timeout=1):
+        """
+            Description: Reads until the expected sequence is found or the timeout expires
+            Parameters: expected: terminating byte sequence
+                        timeout: maximal waiting time in seconds
+            Return: bytes including the terminator
+        """
+        def find_end(buffer):
+            index = buffer.find(expected)
+            return None if index < 0 else index + len(expected)
+
+        return await self._read_buffered(find_end, timeout)
+
+
+    def unread(self, data):
+        """
+            Description: Puts bytes back in front of the receive buffer, e.g. to search them
+                         again for a frame start
+        """
+        self._buffer[:0] = data
+
+
+    def reset_input_buffer(self):
+        """
+            Description: Discards all received but not yet read bytes
+        """
+        self._buffer.clear()
+        self.ser.reset_input_buffer()
+
+
+    def write(self, data):
+        """
+            Description: Writes data to the port
+        """
+        self.ser.write(data)
+
+
+    def flush(self):
+        """
+            Description: Waits until all written data is transmitted
+        """
+        self.ser.flush()
+
+
+    def close(self):
+        """
+            Description: Closes the port
+        """
+        self.ser.close()
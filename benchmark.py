@@ -0,0 +1,281 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Benchmark of the path acquisition -> storage -> upload on a normal
+Linux machine. The sensors are simulated (simulator.py), the uploads go to a
+local stand-in (upload_standin.py). Measured are
+
+- latency percentiles of every phase of a cycle: ventilation, wait, read of
+  every sensor, database save and flush, spool append and upload
+- throughput of the database writer in rows per second
+- memory growth over the run
+- import time of the entry points (python -X importtime in a fresh process)
+
+The results are written as JSON together with the git commit, so runs of
+different commits can be compared.
+
+Usage: python benchmark.py [--cycles 50] [--output benchmark.json] (see --help)
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from collections import defaultdict
+
+import simulator
+GPIO = simulator.install_fake_gpio() # fans of the simulated station
+
+import local_db
+from db_writer import BatchedWriter
+from db_schema import create_schema, channel_id, INSERT_MEASUREMENT
+from upload_spool import UploadSpool, Uploader
+from upload_standin import StandInTarget
+
+
+def percentiles(samples) -> dict:
+    """
+        Description: Summary of a list of durations
+        Parameters: samples: durations in seconds
+        Return: dict with count, mean, p50, p90, p99 and max in milliseconds
+    """
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def quantile(q):
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000
+
+    return {'count': len(ordered),
+            'mean': statistics.fmean(ordered) * 1000,
+            'p50': quantile(0.5),
+            'p90': quantile(0.9),
+            'p99': quantile(0.99),
+            'max': ordered[-1] * 1000}
+
+
+def bench_cycles(args, directory) -> dict:
+    """
+        Description: Runs measurement cycles against the simulated station
+        Parameters: args: command line arguments
+                    directory: folder for the temporary databases
+        Return: dict with the phase latencies, counters and memory usage
+    """
+    station = simulator.SimulatedStation(latency=args.latency, jitter=args.jitter,
+                                         corruption=args.corruption,
+                                         cozir_period=args.cozir_period, seed=1).start()
+    measurement = local_db.MeasureAirquality(os.path.join(directory, 'airquality.db'),
+                                             ports=station.ports)
+
+    phases = defaultdict(list)
+    target = StandInTarget(latency=args.upload_latency)
+
+    def timed_target(sensor_id, data, timestamp, key):
+        started_at = time.perf_counter()
+        target(sensor_id, data, timestamp, key)
+        phases['upload'].append(time.perf_counter() - started_at)
+
+    spool = UploadSpool(os.path.join(directory, 'upload_spool.db'))
+    uploader = Uploader(spool, {'sensor_node_verbose': timed_target})
+    uploader.start()
+
+    tracemalloc.start()
+    memory_start = None
+    flushes = 0
+
+    for cycle in range(args.cycles):
+        cycle_started_at = time.perf_counter()
+        var = measurement.measurement_cycle(vent_time=args.vent_time, wait_time=args.wait_time,
+                                            iterations=args.iterations)
+        for phase, duration in measurement.station.phase_timings.items():
+            phases[phase].append(duration)
+        for name, (started_at, finished_at) in measurement.station.read_timings.items():
+            phases[f'read_{name}'].append(finished_at - started_at)
+
+        started_at = time.perf_counter()
+        measurement.save(var)
+        phases['db_save'].append(time.perf_counter() - started_at)
+        if measurement.writer.flushes > flushes:
+            flushes = measurement.writer.flushes
+            phases['db_flush'].append(measurement.writer.last_flush_duration)
+
+        started_at = time.perf_counter()
+        spool.put('sensor_node_verbose', 'benchmark',
+                  {key: value for key, value in var.items() if key != 'std'})
+        phases['spool_put'].append(time.perf_counter() - started_at)
+
+        phases['cycle'].append(time.perf_counter() - cycle_started_at)
+        if cycle == 0:
+            memory_start = tracemalloc.get_traced_memory()[0] # after warm-up
+
+    memory_end = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # give the uploader time to drain the spool
+    deadline = time.monotonic() + 10
+    while len(spool) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    result = {'phases': {name: percentiles(samples) for name, samples in phases.items()},
+              'writer': measurement.writer.stats(),
+              'spool_pending': len(spool),
+              'uploaded': target.calls,
+              'corrupt_frames': sum(getattr(sensor, 'corrupt_frames', 0)
+                                    for sensor in measurement.station.sensors.values()),
+              'short_frames': sum(getattr(sensor, 'short_frames', 0)
+                                  for sensor in measurement.station.sensors.values()),
+              'memory': {'traced_start_bytes': memory_start,
+                         'traced_end_bytes': memory_end,
+                         'growth_per_cycle_bytes': (memory_end - memory_start) / max(args.cycles - 1, 1),
+                         'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}
+
+    uploader.stop()
+    spool.close()
+    del measurement
+    station.stop()
+    return result
+
+
+def bench_writer(args, directory) -> dict:
+    """
+        Description: Sustained insert rate of the database writer for several batch sizes
+        Parameters: args: command line arguments
+                    directory: folder for the temporary databases
+        Return: dict which maps the batch size to rows per second
+    """
+    result = {}
+    for flush_rows in [1, 60, 1000]:
+        writer = BatchedWriter(os.path.join(directory, f'writer_{flush_rows}.db'),
+                               flush_rows=flush_rows, flush_interval=3600)
+        create_schema(writer.con)
+        channels = [channel_id(writer.con, f'sensor {i}', 'concentration', 'ppm') for i in range(6)]
+        writer.con.commit()
+
+        started_at = time.perf_counter()
+        for row in range(args.writer_rows):
+            writer.add(INSERT_MEASUREMENT,
+                       (channels[row % 6], 1_600_000_000_000 + row // 6 * 1000, row * 0.001, None))
+        writer.flush()
+        duration = time.perf_counter() - started_at
+
+        result[flush_rows] = {'rows_per_second': args.writer_rows / duration,
+                              'mean_flush_ms': writer.stats()['mean_flush_duration'] * 1000}
+        writer.close()
+    return result
+
+
+# entry point -> (working directory relative to the repository, module)
+ENTRY_POINTS = {'local_db': ('.', 'local_db'),
+                'web_db': ('.', 'web_db'),
+                'rollup': ('.', 'rollup'),
+                'discovery': ('.', 'discovery'),
+                'db_init': ('device_data', 'db_init'),
+                'db_migrate': ('device_data', 'db_migrate')}
+
+
+def bench_imports(args) -> dict:
+    """
+        Description: Import time of the entry points, every module is imported in a new
+                     interpreter with -X importtime, without GPIO hardware
+        Parameters: args: command line arguments
+        Return: dict which maps the entry point to the best cumulative import time and
+                process start time in ms and the slowest imports of that run
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    environment = {**os.environ, 'AIRQUALITY_GPIO': 'null'}
+    result = {}
+    for name, (directory, module) in ENTRY_POINTS.items():
+        best = None
+        for _ in range(args.import_runs):
+            started_at = time.perf_counter()
+            process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                     cwd=os.path.join(root, directory), env=environment,
+                                     capture_output=True, text=True)
+            wall = time.perf_counter() - started_at
+            if process.returncode != 0:
+                best = {'error': process.stderr.strip().splitlines()[-1]}
+                break
+
+            # lines "import time: self [us] | cumulative | module", nested modules indented
+            imports = []
+            for line in process.stderr.splitlines():
+                if line.startswith('import time:') and not line.endswith('imported package'):
+                    own, cumulative, package = line[len('import time:'):].split('|')
+                    if own.strip().isdigit():
+                        imports.append((package.strip(), int(own), int(cumulative)))
+            total = next(cumulative for package, _, cumulative in imports if package == module)
+            if best is None or total < best['import_ms'] * 1000:
+                slowest = sorted(imports, key=lambda entry: entry[1], reverse=True)[:5]
+                best = {'import_ms': total / 1000,
+                        'process_ms': wall * 1000,
+                        'slowest': {package: own / 1000 for package, own, _ in slowest}}
+        result[name] = best
+    return result
+
+
+def git_commit():
+    """
+        Description: Current git commit of the repository, None outside of git
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark acquisition, storage and upload.')
+    parser.add_argument('--cycles', type=int, default=50)
+    parser.add_argument('--vent-time', type=float, default=0.5)
+    parser.add_argument('--wait-time', type=float, default=0.2)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.02, help='sensor answer latency in s')
+    parser.add_argument('--jitter', type=float, default=0.01, help='sensor answer jitter in s')
+    parser.add_argument('--corruption', type=float, default=0.0, help='probability of corrupt frames')
+    parser.add_argument('--cozir-period', type=float, default=0.5)
+    parser.add_argument('--upload-latency', type=float, default=0.05, help='stand-in upload latency in s')
+    parser.add_argument('--writer-rows', type=int, default=20000)
+    parser.add_argument('--import-runs', type=int, default=5, help='runs per entry point, best is kept')
+    parser.add_argument('--output', default='benchmark.json')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {'commit': git_commit(),
+                   'time': time.time(),
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'parameters': vars(args),
+                   'cycles': bench_cycles(args, directory),
+                   'writer': bench_writer(args, directory),
+                   'imports': bench_imports(args)}
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+
+    print(f"{'phase':>16} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  [ms]")
+    for name, summary in results['cycles']['phases'].items():
+        if summary['count']:
+            print(f"{name:>16} {summary['p50']:9.2f} {summary['p90']:9.2f} "
+                  f"{summary['p99']:9.2f} {summary['max']:9.2f}")
+    for flush_rows, summary in results['writer'].items():
+        print(f"writer batch {flush_rows:>5}: {summary['rows_per_second']:10.0f} rows/s")
+    for name, summary in results['imports'].items():
+        if 'error' in summary:
+            print(f"import {name:>10}: {summary['error']}")
+        else:
+            print(f"import {name:>10}: {summary['import_ms']:7.1f} ms"
+                  f" (process {summary['process_ms']:.0f} ms)")
+    print(f"memory growth per cycle: "
+          f"{results['cycles']['memory']['growth_per_cycle_bytes']:.0f} bytes")
+    print(f"results written to {args.output}")
@@ -0,0 +1,320 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Calibration and unit conversion of the gas sensors with NumPy. All
+functions work on scalars and on arrays, so the same code converts the values
+of one live cycle (Station.convert) and reprocesses the raw values of a whole
+database (python calibration.py reprocess).
+
+For every sensor the raw value in the unit of the driver (ppm, ppb) is corrected
+
+    corrected = (raw - zero) * span - sum of k * corrected value of the interfering sensor
+
+where k is the response of the sensor to the interfering gas in ppb per ppb,
+e.g. the NO2 sensor also responds to O3. The corrected value is converted to
+the output unit. Mixing ratios (ppm, ppb) become mass concentrations (µg/m³,
+mg/m³) with the ideal gas law at the measured temperature and the air pressure
+of the station:
+
+    c [µg/m³] = x [ppb] * M [g/mol] * p [Pa] / (R * T [K]) / 1000
+
+At 25 °C and 1013.25 hPa this gives the factors of the course script:
+1.88 for NO2, 1.96 for O3 and 1.15 for CO.
+
+Reprocessing needs the raw values, which retention.py deletes after the raw
+retention period (30 days by default). Concentrations before the retention
+horizon of the raw values keep their old calibration; keep the raw values
+longer ("retention": {"raw": ...} in the station file) if calibrations are
+changed later than that.
+
+Usage: python calibration.py reprocess --db <database> --config <station file>
+                                       [--start 2023-05-01] [--end 2023-06-01]
+       recalculates the stored concentrations from the stored raw values with the
+       calibration of the station file
+"""
+
+import logging
+
+import numpy as np
+
+GAS_CONSTANT = 8.314462618 # J/(mol K)
+
+# conditions of the conversion if nothing was measured
+STANDARD_TEMPERATURE = 25.0 # °C
+STANDARD_PRESSURE = 1013.25 # hPa
+
+# g/mol
+MOLAR_MASSES = {'NO2': 46.0055, 'NO': 30.0061, 'O3': 47.9982, 'CO': 28.0101, 'CO2': 44.0095,
+                'SO2': 64.066, 'H2S': 34.081, 'NH3': 17.0305}
+
+# mole fraction per unit
+MIXING_RATIOS = {'%': 1e-2, 'ppm': 1e-6, 'ppb': 1e-9}
+# g/m³ per unit
+MASS_CONCENTRATIONS = {'mg/m³': 1e-3, 'µg/m³': 1e-6}
+
+
+def conversion_factor(gas, from_unit, to_unit, temperature=STANDARD_TEMPERATURE,
+                      pressure=STANDARD_PRESSURE):
+    """
+        Description: Factor from one unit to another, value [to_unit] = value [from_unit] * factor
+        Parameters: gas: gas name of MOLAR_MASSES, needed between mixing ratio and mass
+                    from_unit, to_unit: units of MIXING_RATIOS or MASS_CONCENTRATIONS
+                    temperature: air temperature in °C, scalar or array
+                    pressure: air pressure in hPa, scalar or array
+        Return: float or array
+        Raises: ValueError if the units cannot be converted
+    """
+    if from_unit == to_unit:
+        return 1.0
+    if from_unit in MIXING_RATIOS and to_unit in MIXING_RATIOS:
+        return MIXING_RATIOS[from_unit] / MIXING_RATIOS[to_unit]
+    if from_unit in MASS_CONCENTRATIONS and to_unit in MASS_CONCENTRATIONS:
+        return MASS_CONCENTRATIONS[from_unit] / MASS_CONCENTRATIONS[to_unit]
+    if gas not in MOLAR_MASSES:
+        raise ValueError(f'Unknown molar mass of {gas}, cannot convert {from_unit} to {to_unit}')
+
+    # g/m³ of the pure gas
+    density = (MOLAR_MASSES[gas] * np.asarray(pressure, dtype=float) * 100
+               / (GAS_CONSTANT * (np.asarray(temperature, dtype=float) + 273.15)))
+    if from_unit in MIXING_RATIOS and to_unit in MASS_CONCENTRATIONS:
+        return MIXING_RATIOS[from_unit] * density / MASS_CONCENTRATIONS[to_unit]
+    if from_unit in MASS_CONCENTRATIONS and to_unit in MIXING_RATIOS:
+        return MASS_CONCENTRATIONS[from_unit] / (density * MIXING_RATIOS[to_unit])
+    raise ValueError(f'Cannot convert {from_unit} to {to_unit}')
+
+
+def convert(values, gas, from_unit, to_unit, temperature=STANDARD_TEMPERATURE,
+            pressure=STANDARD_PRESSURE):
+    """
+        Description: Converts values between units, see conversion_factor()
+        Return: array of the converted values
+    """
+    return np.asarray(values, dtype=float) * conversion_factor(gas, from_unit, to_unit,
+                                                               temperature, pressure)
+
+
+def calibration_settings(sensor) -> dict:
+    """
+        Description: Settings of Calibration for a sensor entry of the station file
+        Parameters: sensor: entry of check_config()['sensors']
+        Return: dict with gas, raw_unit (None: unit of the driver), unit, zero, span and cross
+    """
+    return {'gas': sensor['gas'], 'unit': sensor['unit'], **sensor['calibration']}
+
+
+class Calibration:
+    """
+    Calibration of all sensors of a station.
+    """
+
+    def __init__(self, sensors, temperature='measured', pressure=STANDARD_PRESSURE):
+        """
+            ### Constructor ###
+            Parameters: sensors: dict which maps the sensor name to a dict with gas, raw_unit
+                                 (unit of the driver), unit (output unit), zero, span and cross
+                                 (dict which maps the name of an interfering sensor to k)
+                        temperature: 'measured' to convert at the measured temperature
+                                     (STANDARD_TEMPERATURE if there is none) or a fixed
+                                     temperature in °C
+                        pressure: air pressure at the station in hPa
+            Raises: ValueError for units which cannot be converted, unknown or circular
+                    cross sensitivities
+        """
+        self.sensors = sensors
+        self.temperature = temperature
+        self.pressure = pressure
+
+        for name, settings in sensors.items():
+            conversion_factor(settings['gas'], settings['raw_unit'], settings['unit'])
+            for other in settings['cross']:
+                if other not in sensors:
+                    raise ValueError(f'{name}: cross sensitivity to unknown sensor {other}')
+                if not {settings['raw_unit'], sensors[other]['raw_unit']} <= set(MIXING_RATIOS):
+                    raise ValueError(f'{name}: cross sensitivity needs raw values as mixing ratios')
+
+        # a sensor is corrected after the sensors it is corrected with
+        self.order = []
+        visiting = set()
+
+        def visit(name):
+            if name in visiting:
+                raise ValueError(f'Circular cross sensitivity of {name}')
+            if name not in self.order:
+                visiting.add(name)
+                for other in sensors[name]['cross']:
+                    visit(other)
+                visiting.remove(name)
+                self.order.append(name)
+
+        for name in sensors:
+            visit(name)
+
+
+    def conditions(self, temperature=None):
+        """
+            Description: Temperature and pressure of the unit conversion
+            Parameters: temperature: measured temperature in °C, scalar, array (NaN where
+                                     nothing was measured) or None
+            Return: tuple (temperature, pressure)
+        """
+        if self.temperature != 'measured':
+            return self.temperature, self.pressure
+        if temperature is None:
+            return STANDARD_TEMPERATURE, self.pressure
+        temperature = np.asarray(temperature, dtype=float)
+        return np.where(np.isnan(temperature), STANDARD_TEMPERATURE, temperature), self.pressure
+
+
+    def correct(self, raw) -> dict:
+        """
+            Description: Zero, span and cross sensitivity correction in the raw units
+            Parameters: raw: dict which maps sensor names to raw values, scalars or arrays of
+                             the same shape. A correction with a sensor which is missing in
+                             raw is skipped.
+            Return: dict which maps the sensor names of raw to arrays
+        """
+        corrected = {}
+        for name in self.order:
+            if name not in raw:
+                continue
+            settings = self.sensors[name]
+            value = (np.asarray(raw[name], dtype=float) - settings['zero']) * settings['span']
+            for other, coefficient in settings['cross'].items():
+                if other in corrected:
+                    value = value - coefficient * corrected[other] * conversion_factor(
+                        None, self.sensors[other]['raw_unit'], settings['raw_unit'])
+            corrected[name] = value
+        return corrected
+
+
+    def apply(self, raw, temperature=None) -> dict:
+        """
+            Description: Calibrated values in the output units
+            Parameters: raw: see correct()
+                        temperature: see conditions()
+            Return: dict which maps the sensor names of raw to arrays
+        """
+        temperature, pressure = self.conditions(temperature)
+        return {name: value * self.factor(name, temperature, pressure)
+                for name, value in self.correct(raw).items()}
+
+
+    def factor(self, name, temperature=STANDARD_TEMPERATURE, pressure=STANDARD_PRESSURE):
+        """
+            Description: Unit conversion factor of a sensor from raw to output unit
+        """
+        settings = self.sensors[name]
+        return conversion_factor(settings['gas'], settings['raw_unit'], settings['unit'],
+                                 temperature, pressure)
+
+
+    def std(self, name, std, temperature=None):
+        """
+            Description: Standard deviation of raw values in the output unit, the cross
+                         sensitivity correction is not included
+        """
+        temperature, pressure = self.conditions(temperature)
+        return (np.asarray(std, dtype=float) * abs(self.sensors[name]['span'])
+                * self.factor(name, temperature, pressure))
+
+
+def reprocess(con, config, start=None, end=None) -> dict:
+    """
+        Description: Recalculates the stored concentrations from the stored raw values
+                     (channels with quantity 'raw') and the stored station temperature.
+                     The standard deviations are kept, the rollups of the changed
+                     channels are rebuilt.
+        Parameters: con: sqlite3 connection to a database of local_db.py
+                    config: station configuration, see station.check_config()
+                    start, end: unix time range in ms, default all. The range starts at the
+                                earliest at the retention horizon of the raw values, the
+                                concentrations before it stay unchanged.
+        Return: dict which maps the sensor names to the number of recalculated values
+    """
+    from db_schema import rebuild_rollups
+
+    start = -2 ** 63 if start is None else start
+    end = 2 ** 63 - 1 if end is None else end
+    horizon = con.execute("SELECT horizon FROM retention WHERE resolution = 'raw'").fetchone()
+    if horizon is not None and start < horizon[0]:
+        if start > -2 ** 63:
+            logging.warning('The raw values before the retention horizon are deleted, the '
+                            'concentrations before it are not recalculated')
+        start = horizon[0]
+
+    def load(sensor, quantity):
+        rows = con.execute("""SELECT measurement.time, measurement.value
+                              FROM measurement JOIN channel ON channel.id = measurement.channel_id
+                              WHERE channel.sensor = ? AND channel.quantity = ?
+                                    AND measurement.time BETWEEN ? AND ?
+                              ORDER BY measurement.time""", (sensor, quantity, start, end)).fetchall()
+        return np.array(rows, dtype=float).reshape(-1, 2)
+
+    raw_units = dict(con.execute("SELECT sensor, unit FROM channel WHERE quantity = 'raw'").fetchall())
+    names = [name for name in config['sensors'] if name in raw_units]
+    calibration = Calibration(
+        {name: {**calibration_settings(config['sensors'][name]),
+                'raw_unit': config['sensors'][name]['calibration']['raw_unit'] or raw_units[name]}
+         for name in names},
+        **config['conditions'])
+
+    # all values on one time axis, a cycle stores all sensors with the same time
+    series = {name: load(name, 'raw') for name in names}
+    times = np.unique(np.concatenate([values[:, 0] for values in series.values()] or [[]]))
+    raw = {}
+    for name, values in series.items():
+        raw[name] = np.full(len(times), np.nan)
+        raw[name][np.searchsorted(times, values[:, 0])] = values[:, 1]
+    temperature = load('station', 'temperature')
+    temperature = (np.interp(times, temperature[:, 0], temperature[:, 1])
+                   if len(temperature) else None)
+
+    counts = {}
+    channels = [] # recalculated channels
+    with con:
+        for name, values in calibration.apply(raw, temperature).items():
+            valid = ~np.isnan(values)
+            channel = con.execute("""SELECT id FROM channel WHERE sensor = ? AND quantity = 'concentration'""",
+                                  (name,)).fetchone()
+            if channel is None:
+                continue
+            con.execute('UPDATE channel SET unit = ? WHERE id = ?',
+                        (config['sensors'][name]['unit'], channel[0]))
+            cursor = con.executemany('UPDATE measurement SET value = ? WHERE channel_id = ? AND time = ?',
+                                     zip(values[valid].tolist(), [channel[0]] * int(valid.sum()),
+                                         times[valid].astype(np.int64).tolist()))
+            counts[name] = cursor.rowcount
+            channels.append(channel[0])
+    if len(times):
+        rebuild_rollups(con, channels, int(times[0]), int(times[-1]))
+    return counts
+
+
+if __name__ == "__main__":
+
+    import time
+    import sqlite3
+    import argparse
+    from datetime import datetime
+
+    from station import load_config
+
+    parser = argparse.ArgumentParser(description='Recalculate stored concentrations from raw values.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    reprocess_parser = commands.add_parser('reprocess')
+    reprocess_parser.add_argument('--db', required=True)
+    reprocess_parser.add_argument('--config', required=True)
+    reprocess_parser.add_argument('--start', help='e.g. 2023-05-01')
+    reprocess_parser.add_argument('--end', help='e.g. 2023-06-01')
+    args = parser.parse_args()
+
+    def epoch(text):
+        return None if text is None else round(datetime.fromisoformat(text).timestamp() * 1000)
+
+    started_at = time.perf_counter()
+    with sqlite3.connect(args.db) as con:
+        counts = reprocess(con, load_config(args.config), epoch(args.start), epoch(args.end))
+    for name, count in counts.items():
+        print(f'{name}: {count} values recalculated')
+    print(f'done in {time.perf_counter() - started_at:.1f} s')
@@ -0,0 +1,598 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Collector for a fleet of stations. The stations stream batches of
+measurements over TCP or a Unix socket, the collector writes them into one
+sqlite database with the schema of db_schema.py and acknowledges every batch
+after its commit. A station keeps a batch in its upload spool until the
+acknowledgement arrives, so nothing is lost if the collector or the network
+fails; a batch sent twice is ignored by the primary key of the measurement
+table.
+
+Protocol: one JSON object per line (UTF-8) in both directions.
+
+    station -> collector
+        {"station": "node 1", "batch": 17,
+         "channels": [["NO2", "concentration", "µg/m³"], ["station", "temperature", "°C"]],
+         "rows": [[0, 1697529600000, 41.2, null], [1, 1697529600000, 21.5, null]]}
+        {"stats": true}
+    collector -> station
+        {"ack": 17, "rows": 2}
+        {"nack": 17, "error": "..."}
+        {"stations": {...}, ...}   answer to a stats request, see Collector.stats()
+
+A row is (index into channels, unix time in ms, value, standard deviation or
+null). The channels are stored as sensor "<station>/<sensor>", e.g.
+"node 1/NO2", so the rollups and queries of a single station work unchanged.
+A batch with a value or standard deviation which is not finite (NaN, inf) is
+rejected as a whole with a nack, it could not be stored.
+
+All connections run on one asyncio loop. The batches which arrive while a
+transaction is written are committed together in the next one (group commit),
+so the number of fsyncs does not grow with the number of stations.
+
+Usage: python collector.py serve [--listen tcp:0.0.0.0:7070] [--db device_data/collector.db]
+       python collector.py stats [--address tcp:localhost:7070]
+       python collector.py loadtest [--stations 200] [--interval 1] [--duration 20]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from db_writer import BatchedWriter
+from db_schema import create_schema, channel_id, INSERT_MEASUREMENT
+
+DEFAULT_ADDRESS = 'tcp:0.0.0.0:7070'
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'device_data', 'collector.db')
+
+# longest accepted line, a batch of a few thousand rows
+LINE_LIMIT = 4 * 1024 * 1024
+
+
+def parse_address(address):
+    """
+        Description: Splits an address 'tcp:<host>:<port>' or 'unix:<path>'
+        Return: ('tcp', (host, port)) or ('unix', path)
+        Raises: ValueError for other addresses
+    """
+    kind, _, rest = address.partition(':')
+    if kind == 'unix' and rest:
+        return kind, rest
+    if kind == 'tcp':
+        host, _, port = rest.rpartition(':')
+        if host and port.isdigit():
+            return kind, (host, int(port))
+    raise ValueError(f"Invalid address {address}, expected tcp:<host>:<port> or unix:<path>")
+
+
+def parse_batch(message):
+    """
+        Description: Checks a batch message and resolves the channel indices
+        Parameters: message: decoded JSON object
+        Return: tuple (station, batch number, list of rows (channel, time, value, std)) with
+                channel = (sensor, quantity, unit)
+        Raises: ValueError, TypeError, KeyError or IndexError for invalid batches
+    """
+    station = message['station']
+    if not isinstance(station, str) or not station or '/' in station:
+        raise ValueError(f'Invalid station name {station!r}')
+    channels = []
+    for sensor, quantity, unit in message['channels']:
+        if not all(isinstance(text, str) for text in (sensor, quantity, unit)):
+            raise ValueError('Channel names have to be strings')
+        channels.append((f'{station}/{sensor}', quantity, unit))
+
+    rows = []
+    for index, timestamp, value, std in message['rows']:
+        # bool is a subclass of int, a negative index would count from the end of channels
+        if any(isinstance(number, bool) or not isinstance(number, int) for number in (index, timestamp)):
+            raise ValueError('Channel index and time have to be integers')
+        if index < 0:
+            raise ValueError(f'Negative channel index {index}')
+        if isinstance(value, bool) or isinstance(std, bool):
+            raise ValueError('Value and std have to be numbers')
+        value, std = float(value), None if std is None else float(std)
+        # NaN is not stored (NOT NULL), the row would be dropped after the acknowledgement
+        if not math.isfinite(value) or (std is not None and not math.isfinite(std)):
+            raise ValueError(f'Value {value} with std {std} is not finite')
+        rows.append((channels[index], timestamp, value, std))
+    return station, message['batch'], rows
+
+
+class Collector:
+    """
+    Server which receives the batches of many stations.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, window=10):
+        """
+            ### Constructor ###
+            Parameters: db_path: path to the sqlite database, created if necessary
+                        window: length of the window of the ingest rates in seconds
+        """
+        # the collector flushes explicitly once per group of batches
+        self.writer = BatchedWriter(db_path, flush_rows=sys.maxsize, flush_interval=float('inf'))
+        create_schema(self.writer.con)
+        self.writer.con.commit()
+        self.window = window
+
+        # sqlite is only used by this one thread, the event loop never blocks on the disk
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='collector-db')
+        self._channels = {} # (sensor, quantity, unit) -> channel id
+        self._queue = None
+        self._committer = None
+        self.servers = []
+
+        # statistics
+        self.stations = {} # name -> dict, see _station()
+        self.commits = 0
+        self.committed_batches = 0
+        self.started_at = time.monotonic()
+
+
+    def _station(self, name):
+        if name not in self.stations:
+            self.stations[name] = {'rows': 0, 'batches': 0, 'rejected': 0, 'connections': 0,
+                                   'last_seen': None, 'recent': deque()} # (monotonic time, rows)
+        return self.stations[name]
+
+
+    async def start(self, addresses):
+        """
+            Description: Listens on the given addresses
+            Parameters: addresses: list of addresses, see parse_address()
+        """
+        self._queue = asyncio.Queue()
+        self._committer = asyncio.create_task(self._commit_loop())
+        for address in addresses:
+            kind, target = parse_address(address)
+            if kind == 'unix':
+                if os.path.exists(target): # left over from a previous run
+                    os.remove(target)
+                server = await asyncio.start_unix_server(self._handle, target, limit=LINE_LIMIT)
+            else:
+                server = await asyncio.start_server(self._handle, *target, limit=LINE_LIMIT)
+            self.servers.append(server)
+            logging.info(f'Collector listening on {address}')
+
+
+    async def stop(self):
+        """
+            Description: Closes the servers, writes what is pending and closes the database
+        """
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        if self._committer is not None:
+            self._committer.cancel()
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.writer.close)
+        self._executor.shutdown()
+
+
+    async def _handle(self, reader, writer):
+        """
+            Description: Serves one connection until the station disconnects
+        """
+        def reply(message):
+            writer.write(json.dumps(message).encode() + b'\n')
+
+        loop = asyncio.get_running_loop()
+        names = set() # stations which use this connection
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    reply({'error': 'invalid JSON'})
+                    continue
+
+                if message.get('stats'):
+                    reply(self.stats())
+                    await writer.drain()
+                    continue
+
+                try:
+                    name, batch, rows = parse_batch(message)
+                except (ValueError, TypeError, KeyError, IndexError) as error_message:
+                    if isinstance(message.get('station'), str):
+                        self._station(message['station'])['rejected'] += 1
+                    reply({'nack': message.get('batch'), 'error': f'invalid batch: {error_message}'})
+                    await writer.drain()
+                    continue
+
+                station = self._station(name)
+                if name not in names:
+                    names.add(name)
+                    station['connections'] += 1
+
+                done = loop.create_future()
+                await self._queue.put((rows, done))
+                try:
+                    await done
+                except Exception as error_message:
+                    logging.warning(f'Batch {batch} of {name} not stored: {error_message}')
+                    reply({'nack': batch, 'error': str(error_message)})
+                else:
+                    now = time.monotonic()
+                    station['rows'] += len(rows)
+                    station['batches'] += 1
+                    station['last_seen'] = now
+                    station['recent'].append((now, len(rows)))
+                    metrics.COLLECTOR_ROWS.labels(name).inc(len(rows))
+                    reply({'ack': batch, 'rows': len(rows)})
+                await writer.drain()
+        except (ConnectionError, ValueError): # reset by the station or line longer than LINE_LIMIT
+            pass
+        finally:
+            for name in names:
+                self.stations[name]['connections'] -= 1
+            writer.close()
+
+
+    async def _commit_loop(self):
+        """
+            Description: Writes all queued batches in one transaction and wakes up their
+                         connections
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            while not self._queue.empty():
+                items.append(self._queue.get_nowait())
+
+            started_at = time.perf_counter()
+            try:
+                await loop.run_in_executor(self._executor, self._write, [rows for rows, _ in items])
+            except Exception as error_message:
+                for _, done in items:
+                    if not done.done():
+                        done.set_exception(error_message)
+                continue
+            metrics.COLLECTOR_COMMIT_DURATION.observe(time.perf_counter() - started_at)
+            self.commits += 1
+            self.committed_batches += len(items)
+            for _, done in items:
+                if not done.done():
+                    done.set_result(None)
+
+
+    def _write(self, batches):
+        """
+            Description: Stores batches in one transaction, runs in the database thread.
+                         If the transaction fails the rows stay in the writer and are
+                         written with the next group.
+        """
+        for rows in batches:
+            for channel, timestamp, value, std in rows:
+                if channel not in self._channels:
+                    # committed on its own, a failed flush must not take the channel with it
+                    with self.writer.con:
+                        self._channels[channel] = channel_id(self.writer.con, *channel)
+                self.writer.add(INSERT_MEASUREMENT, (self._channels[channel], timestamp, value, std))
+        self.writer.flush()
+
+
+    def stats(self) -> dict:
+        """
+            Description: Ingest statistics of the collector and of every station
+            Return: dict with the total rows and rate, the mean number of batches per commit
+                    and per station the rows, batches, rejected batches, open connections,
+                    rows per second over the last window seconds and seconds since the last
+                    batch
+        """
+        now = time.monotonic()
+        stations = {}
+        for name, station in self.stations.items():
+            recent = station['recent']
+            while recent and recent[0][0] < now - self.window:
+                recent.popleft()
+            window = min(self.window, now - self.started_at) or 1
+            stations[name] = {
+                'rows': station['rows'], 'batches': station['batches'],
+                'rejected': station['rejected'], 'connections': station['connections'],
+                'rate': sum(rows for _, rows in recent) / window,
+                'last_seen': None if station['last_seen'] is None else now - station['last_seen']}
+
+        return {'stations': stations,
+                'rows': sum(station['rows'] for station in stations.values()),
+                'rate': sum(station['rate'] for station in stations.values()),
+                'connected': sum(1 for station in stations.values() if station['connections']),
+                'commits': self.commits,
+                'batches_per_commit': self.committed_batches / self.commits if self.commits else 0.0,
+                'writer': self.writer.stats()}
+
+
+class CollectorClient:
+    """
+    Blocking connection of a station to the collector.
+    """
+
+    def __init__(self, address, timeout=10):
+        """
+            ### Constructor ###
+            Parameters: address: see parse_address(), connected on the first send
+                        timeout: maximal waiting time for connection and acknowledgement in s
+        """
+        self.kind, self.target = parse_address(address)
+        self.timeout = timeout
+        self._socket = None
+        self._file = None
+        self._batches = itertools.count(1)
+
+
+    def _connect(self):
+        if self._socket is None:
+            family = socket.AF_UNIX if self.kind == 'unix' else socket.AF_INET
+            connection = socket.socket(family, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            try:
+                connection.connect(self.target)
+            except OSError:
+                connection.close()
+                raise
+            self._socket = connection
+            self._file = connection.makefile('rb')
+
+
+    def _request(self, message) -> dict:
+        """
+            Description: Sends one message and waits for the answer, reconnects with the next
+                         request after an error
+        """
+        try:
+            self._connect()
+            self._socket.sendall(json.dumps(message).encode() + b'\n')
+            line = self._file.readline(LINE_LIMIT)
+            if not line:
+                raise ConnectionError('collector closed the connection')
+            return json.loads(line)
+        except (OSError, ValueError):
+            self.close()
+            raise
+
+
+    def send(self, station, rows) -> int:
+        """
+            Description: Sends one batch and waits for its acknowledgement
+            Parameters: station: station name
+                        rows: list of tuples (sensor, quantity, unit, unix time in ms, value, std)
+            Return: number of rows the collector received, rows it already had are ignored
+            Raises: ConnectionError if the batch was not acknowledged, OSError
+        """
+        channels = {}
+        encoded = []
+        for sensor, quantity, unit, timestamp, value, std in rows:
+            index = channels.setdefault((sensor, quantity, unit), len(channels))
+            encoded.append([index, timestamp, value, std])
+
+        batch = next(self._batches)
+        answer = self._request({'station': station, 'batch': batch,
+                                'channels': [list(channel) for channel in channels], 'rows': encoded})
+        if answer.get('ack') != batch:
+            raise ConnectionError(f"batch {batch} not acknowledged: {answer.get('error', answer)}")
+        return answer['rows']
+
+
+    def stats(self) -> dict:
+        """
+            Description: Ingest statistics of the collector, see Collector.stats()
+        """
+        return self._request({'stats': True})
+
+
+    def close(self):
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+        self._socket = None
+        self._file = None
+
+
+class CollectorTarget:
+    """
+    Upload target for upload_spool.Uploader which sends the spooled rows to a collector.
+    """
+
+    def __init__(self, address, channels, timeout=10):
+        """
+            ### Constructor ###
+            Parameters: address: address of the collector, see parse_address()
+                        channels: dict which maps the column of an upload row to a tuple
+                                  (sensor, quantity, unit)
+                        timeout: see CollectorClient
+        """
+        self.client = CollectorClient(address, timeout)
+        self.channels = channels
+
+
+    def __call__(self, sensor_id, data, timestamp, key):
+        self.upload_many([(sensor_id, data, timestamp, key)])
+
+
+    def upload_many(self, rows):
+        """
+            Description: Sends several spooled rows, one batch per station
+            Parameters: rows: list of tuples (sensor_id, data, timestamp, key)
+        """
+        stations = {}
+        for station, data, timestamp, _ in rows:
+            stations.setdefault(station, []).extend(
+                (*self.channels[column], round(timestamp * 1000), value, None)
+                for column, value in data.items() if value is not None)
+        for station, station_rows in stations.items():
+            self.client.send(station, station_rows)
+
+
+def print_stats(stats):
+    print(f"{stats['connected']} stations connected, {stats['rows']} rows, "
+          f"{stats['rate']:.1f} rows/s, {stats['batches_per_commit']:.1f} batches per commit")
+    print(f"{'station':>20} {'rows':>9} {'batches':>8} {'rejected':>8} {'rows/s':>8} {'last seen':>10}")
+    for name, station in sorted(stats['stations'].items()):
+        last_seen = '-' if station['last_seen'] is None else f"{station['last_seen']:.1f} s"
+        print(f"{name:>20} {station['rows']:9} {station['batches']:8} {station['rejected']:8} "
+              f"{station['rate']:8.1f} {last_seen:>10}")
+
+
+async def serve(args):
+    """
+        Description: Runs the collector until it is interrupted, logs the ingest rate
+    """
+    collector = Collector(args.db)
+    await collector.start(args.listen or [DEFAULT_ADDRESS])
+    try:
+        while True:
+            await asyncio.sleep(args.report)
+            stats = collector.stats()
+            logging.info(f"{stats['connected']} stations connected, {stats['rate']:.1f} rows/s, "
+                         f"{stats['batches_per_commit']:.1f} batches per commit")
+    finally:
+        await collector.stop()
+
+
+async def simulated_station(address, name, interval, rows_per_batch, deadline, latencies):
+    """
+        Description: Stand-in for a station, sends a batch every interval seconds like the
+                     upload stage of web_db.py and records the time until the acknowledgement
+    """
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        reader, writer = await asyncio.open_unix_connection(target, limit=LINE_LIMIT)
+    else:
+        reader, writer = await asyncio.open_connection(*target, limit=LINE_LIMIT)
+
+    channels = [['NO2', 'concentration', 'µg/m³'], ['CO', 'concentration', 'mg/m³'],
+                ['O3', 'concentration', 'µg/m³'], ['station', 'temperature', '°C'],
+                ['station', 'humidity', '%rH']]
+    loop = asyncio.get_running_loop()
+    # spread the stations over the interval like a real fleet
+    next_send = loop.time() + interval * (hash(name) % 1000) / 1000
+    for batch in itertools.count(1):
+        await asyncio.sleep(max(next_send - loop.time(), 0))
+        if loop.time() >= deadline:
+            break
+        now_ms = round(time.time() * 1000)
+        rows = [[i % len(channels), now_ms - (rows_per_batch - i // len(channels)) * 1000,
+                 20 + i % 7, None] for i in range(rows_per_batch)]
+
+        started_at = time.perf_counter()
+        writer.write(json.dumps({'station': name, 'batch': batch,
+                                 'channels': channels, 'rows': rows}).encode() + b'\n')
+        await writer.drain()
+        answer = json.loads(await reader.readline())
+        if answer.get('ack') != batch:
+            raise ConnectionError(f'{name}: batch {batch} not acknowledged: {answer}')
+        latencies.append(time.perf_counter() - started_at)
+        next_send += interval
+    writer.close()
+
+
+async def loadtest(args):
+    """
+        Description: Starts a collector in a separate process and lets many simulated
+                     stations send to it
+        Return: dict with the offered and stored rate and the acknowledgement latency
+    """
+    import tempfile
+    import statistics
+
+    with tempfile.TemporaryDirectory() as directory:
+        address = args.address or f"unix:{os.path.join(directory, 'collector.sock')}"
+        db_path = os.path.join(directory, 'collector.db')
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), 'serve', '--listen', address,
+            '--db', db_path, '--report', '3600')
+        try:
+            client = CollectorClient(address.replace('0.0.0.0', '127.0.0.1'))
+            for _ in range(100): # wait until the collector listens
+                try:
+                    client.stats()
+                    break
+                except OSError:
+                    await asyncio.sleep(0.05)
+
+            latencies = []
+            loop = asyncio.get_running_loop()
+            started_at = loop.time()
+            await asyncio.gather(*[
+                simulated_station(address.replace('0.0.0.0', '127.0.0.1'), f'sim {i:04d}',
+                                  args.interval, args.rows, started_at + args.duration, latencies)
+                for i in range(args.stations)])
+            duration = loop.time() - started_at
+            stats = client.stats()
+            client.close()
+        finally:
+            process.terminate()
+            await process.wait()
+
+    rates = [station['rows'] / duration for station in stats['stations'].values()]
+    ordered = sorted(latencies)
+    return {'stations': args.stations,
+            'offered_rows_per_second': args.stations * args.rows / args.interval,
+            'stored_rows_per_second': stats['rows'] / duration,
+            'acknowledged_rows': len(latencies) * args.rows,
+            'stored_rows': stats['rows'],
+            'batches_per_commit': stats['batches_per_commit'],
+            'station_rate_min': min(rates), 'station_rate_max': max(rates),
+            'ack_ms': {'p50': statistics.median(ordered) * 1000,
+                       'p99': ordered[min(int(0.99 * len(ordered)), len(ordered) - 1)] * 1000,
+                       'max': ordered[-1] * 1000}}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Collector for the measurements of many stations.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='receive batches and store them')
+    serve_parser.add_argument('--listen', action='append',
+                              help=f'tcp:<host>:<port> or unix:<path>, repeatable (default {DEFAULT_ADDRESS})')
+    serve_parser.add_argument('--db', default=DEFAULT_DB)
+    serve_parser.add_argument('--metrics-port', type=int, help='serve Prometheus metrics on this port')
+    serve_parser.add_argument('--report', type=float, default=60, help='seconds between log lines')
+
+    stats_parser = commands.add_parser('stats', help='print the ingest rate of every station')
+    stats_parser.add_argument('--address', default='tcp:localhost:7070')
+
+    load_parser = commands.add_parser('loadtest', help='simulated stations against a new collector')
+    load_parser.add_argument('--stations', type=int, default=200)
+    load_parser.add_argument('--interval', type=float, default=1, help='seconds between batches')
+    load_parser.add_argument('--rows', type=int, default=25, help='rows per batch')
+    load_parser.add_argument('--duration', type=float, default=20)
+    load_parser.add_argument('--address', help='default a Unix socket in a temporary folder')
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s: %(message)s", level=logging.INFO, datefmt="%H:%M:%S")
+
+    if args.command == 'serve':
+        if args.metrics_port:
+            metrics.start_server(args.metrics_port)
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == 'stats':
+        print_stats(CollectorClient(args.address).stats())
+    else:
+        result = asyncio.run(loadtest(args))
+        print(f"{result['stations']} stations: offered {result['offered_rows_per_second']:.0f} rows/s, "
+              f"stored {result['stored_rows_per_second']:.0f} rows/s, "
+              f"{result['batches_per_commit']:.1f} batches per commit")
+        print(f"{result['acknowledged_rows']} rows acknowledged, {result['stored_rows']} stored")
+        print(f"rows/s per station: {result['station_rate_min']:.1f} to {result['station_rate_max']:.1f}")
+        print(f"acknowledgement: p50 {result['ack_ms']['p50']:.1f} ms, "
+              f"p99 {result['ack_ms']['p99']:.1f} ms, max {result['ack_ms']['max']:.1f} ms")
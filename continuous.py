@@ -0,0 +1,291 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Continuous sampling. Instead of a burst of reads after every
+ventilation, every sensor is read all the time at the rate it answers (EC
+sensors) or sends (Cozir), and every sample is timestamped. The fans run on
+their own schedule: every "period" seconds (station file) a fan ventilates for
+vent_time and the air settles for wait_time. Every sample is tagged with the
+phase of the fan of its sensor:
+
+    measurement  the fan is off and the air settled
+    ventilation  the fan runs
+    settle       the fan was switched off, the air settles
+
+Depending on "store" of the "continuous" entry of the station file the sampler
+passes on every sample ("samples") or the statistics of every sensor per second
+("seconds", default). A phase change starts a new row, so a row never mixes
+phases. local_db.py stores the concentrations of the measurement phase in the
+channels of the cycles, those taken during ventilation and settling in the
+channels (<sensor>, 'concentration_ventilation') and (<sensor>,
+'concentration_settle'), and the phase of every fan as channel (<fan>, 'phase')
+at every change. Raw values, temperature and humidity are only stored from the
+measurement phase.
+
+The fans and the reads run as tasks on the shared event loop (async_serial.py),
+collect() hands the finished rows to the measurement loop.
+"""
+
+import time
+import asyncio
+import threading
+
+import metrics
+from aggregation import RunningStats
+from async_serial import run_sync
+
+# phase name -> value of the phase channel
+PHASES = {'measurement': 0, 'ventilation': 1, 'settle': 2}
+
+# store settings
+SECONDS = 'seconds'
+SAMPLES = 'samples'
+
+
+class ContinuousSampler:
+    """
+    Background reads of all sensors of a station and independent fan schedule.
+    """
+
+    def __init__(self, station, store=None, sample_interval=None):
+        """
+            ### Constructor ###
+            Parameters: station: Station
+                        store: SECONDS or SAMPLES, default from the station file
+                        sample_interval: minimal time between two reads of an EC sensor in
+                                         seconds, default from the station file (0: as fast
+                                         as the sensor answers)
+        """
+        settings = station.config['continuous']
+        self.station = station
+        self.store = settings['store'] if store is None else store
+        if self.store not in (SECONDS, SAMPLES):
+            raise ValueError(f'Unknown store {self.store}')
+        self.sample_interval = settings['sample_interval'] if sample_interval is None \
+            else sample_interval
+
+        self.phases = {fan: 'measurement' for fan in station.fans}
+        self._lock = threading.Lock()
+        self._rows = [] # finished rows, taken by collect()
+        self._transitions = []
+        self._open = {} # sensor name -> (second, phase, time in ms, list of RunningStats)
+        self._tasks = []
+
+        # statistics
+        self.samples = {name: 0 for name in station.sensors}
+        self.started_at = None
+
+
+    def start(self):
+        """
+            Description: Starts the fan schedule and the reads
+        """
+        self.started_at = time.monotonic()
+        run_sync(self._start())
+
+
+    async def _start(self):
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._run_fan(fan)) for fan in self.station.fans]
+        self._tasks += [loop.create_task(self._read(name)) for name in self.station.sensors]
+
+
+    def stop(self):
+        """
+            Description: Stops the reads, switches the fans off and finishes the open rows
+        """
+        run_sync(self._stop())
+        with self._lock:
+            for name in list(self._open):
+                self._finish(name)
+
+
+    async def _stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for fan in self.station.fans.values():
+            self.station.gpio.output(fan['pin'], False)
+
+
+    def _set_phase(self, fan, phase):
+        with self._lock:
+            self.phases[fan] = phase
+            self._transitions.append((fan, round(time.time() * 1000), phase))
+
+
+    async def _run_fan(self, fan):
+        """
+            Description: Ventilation, settling and measurement phase of a fan in every period,
+                         on a fixed grid of the monotonic clock of the event loop
+        """
+        settings = self.station.fans[fan]
+        loop = asyncio.get_running_loop()
+        slot = loop.time()
+        try:
+            while True:
+                self.station.gpio.output(settings['pin'], True)
+                self._set_phase(fan, 'ventilation')
+                await asyncio.sleep(settings['vent_time'])
+                self.station.gpio.output(settings['pin'], False)
+                self._set_phase(fan, 'settle')
+                await asyncio.sleep(settings['wait_time'])
+                self._set_phase(fan, 'measurement')
+                slot += settings['period']
+                await asyncio.sleep(max(slot - loop.time(), 0))
+        finally:
+            self.station.gpio.output(settings['pin'], False)
+
+
+    async def _read(self, name):
+        """
+            Description: Reads a sensor until the task is cancelled
+        """
+        fan = self.station.settings(name)['fan']
+        sensor = self.station.sensors[name].sensor # the async driver
+        while True:
+            try:
+                async for timestamp, values in sensor.sample_stream(self.sample_interval):
+                    with self._lock:
+                        self.samples[name] += 1
+                        self._add(name, round(timestamp * 1000),
+                                  'measurement' if fan is None else self.phases[fan], values)
+            except asyncio.CancelledError:
+                raise
+            except Exception as error_message:
+                print(f'Reading {name} failed: {error_message}')
+                await asyncio.sleep(1)
+
+
+    def _add(self, name, time_ms, phase, values):
+        """
+            Description: Adds a sample to the rows, the lock is held by the caller
+        """
+        if self.store == SAMPLES:
+            self._rows.append((name, time_ms, phase, values, None))
+            return
+
+        second = time_ms // 1000
+        current = self._open.get(name)
+        if current is not None and current[:2] != (second, phase):
+            self._finish(name)
+        if name not in self._open:
+            # a row starts at the full second unless a phase change split the second
+            start = time_ms if current is not None and current[0] == second else second * 1000
+            self._open[name] = (second, phase, start, [RunningStats() for _ in values])
+        for stats, value in zip(self._open[name][3], values):
+            stats.add(value)
+
+
+    def _finish(self, name):
+        _, phase, start, stats = self._open.pop(name)
+        self._rows.append((name, start, phase, [column.mean for column in stats], stats))
+
+
+    def collect(self) -> tuple:
+        """
+            Description: Takes the rows which are finished since the last call. A row of a
+                         second is finished with the first sample of the next second.
+            Return: tuple (rows, transitions); rows is a list of (sensor name, unix time in ms,
+                    phase, values, stats) with the values in the order of read_bulk() and stats
+                    the list of aggregation.RunningStats of the second (None for samples),
+                    transitions a list of (fan, unix time in ms, phase)
+        """
+        with self._lock:
+            rows, self._rows = self._rows, []
+            transitions, self._transitions = self._transitions, []
+        return rows, transitions
+
+
+    def rates(self) -> dict:
+        """
+            Description: Samples per second of every sensor since start()
+        """
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        return {name: count / elapsed if elapsed else 0.0 for name, count in self.samples.items()}
+
+
+class ContinuousConverter:
+    """
+    Calibration of the rows of ContinuousSampler. The sensors are sampled at
+    different times, so the cross sensitivities and the temperature use the
+    latest value of the other sensors (sample and hold).
+    """
+
+    def __init__(self, station):
+        """
+            ### Constructor ###
+            Parameters: station: Station
+        """
+        self.station = station
+        self.climate_sensors = set(station.climate_sensors())
+        self.raw = {} # sensor name -> latest raw value
+        self.climate = {} # sensor name -> latest (temperature, humidity)
+        self.latest = {} # channel name -> latest calibrated value
+        self._climate_second = None
+        self.rejected = 0
+
+
+    def convert(self, rows, transitions) -> list:
+        """
+            Description: Calibrates the rows and checks them like Station.check()
+            Parameters: rows, transitions: see ContinuousSampler.collect()
+            Return: list of (kind, name, unix time in ms, value, std) sorted by time; kind is
+                    'value' for the sensor names, temperature and humidity, 'raw' for the raw
+                    values and 'phase' for the fans (value of PHASES). Concentrations taken
+                    during ventilation or settling have the phase as kind and do not
+                    change the held values of the measurement phase. Temperature and
+                    humidity are returned once per second.
+        """
+        converted = [('phase', fan, time_ms, PHASES[phase], None)
+                     for fan, time_ms, phase in transitions]
+
+        for name, time_ms, phase, values, stats in sorted(rows, key=lambda row: row[1]):
+            if self.station.check({name: (values, stats)}):
+                self.rejected += 1
+                metrics.QA_REJECTED.inc()
+                continue
+
+            if phase != 'measurement':
+                temperature = self._temperature()
+                value = float(self.station.calibration.apply({**self.raw, name: values[0]},
+                                                             temperature)[name])
+                std = None if stats is None else \
+                    float(self.station.calibration.std(name, stats[0].std, temperature))
+                converted.append((phase, name, time_ms, value, std))
+                continue
+
+            self.raw[name] = values[0]
+            if name in self.climate_sensors:
+                self.climate[name] = values[1:3]
+            temperature = self._temperature()
+
+            value = float(self.station.calibration.apply(self.raw, temperature)[name])
+            std = None if stats is None else \
+                float(self.station.calibration.std(name, stats[0].std, temperature))
+            converted.append(('value', name, time_ms, value, std))
+            converted.append(('raw', name, time_ms, values[0], None))
+            self.latest[name] = value
+
+            second = time_ms // 1000
+            if self.climate and second != self._climate_second:
+                self._climate_second = second
+                self.latest['temperature'] = temperature
+                self.latest['humidity'] = sum(value[1] for value in self.climate.values()) \
+                    / len(self.climate)
+                converted.append(('value', 'temperature', second * 1000, temperature, None))
+                converted.append(('value', 'humidity', second * 1000, self.latest['humidity'], None))
+
+        converted.sort(key=lambda row: row[2])
+        return converted
+
+
+    def _temperature(self):
+        """
+            Description: Mean of the latest temperatures of the climate sensors, None if none
+        """
+        if not self.climate:
+            return None
+        return sum(value[0] for value in self.climate.values()) / len(self.climate)
@@ -6,101 +6,349 @@ Author: Julian Baertschi
 Description: This class can be used to read cozir sensors via UART on a Raspberry pi.
 """
 
-import serial
-from time import sleep
+import asyncio
+import time
+from collections import deque
 
-class CozirSensor:
+import metrics
+import aggregation
+from aggregation import RunningStats
+from async_serial import AsyncSerial, run_sync
+
+
+class AsyncCozirSensor:
+
+    # the only type of this driver, sensor_type is set once the port is open
+    gas = 'CO2'
 
-    def __init__(self, port):
+    def __init__(self, port, buffer_size=60, history=900):
         """
             ### Constructor ###
-            Establishes connection to sensor and checks the sensor type, unit and measurement range
-            Initializes variables
+            Initializes variables, the connection is established with connect()
+            Parameters: buffer_size - number of samples kept by the background reader
+                        history - seconds of statistics kept for read_bulk windows
+        """
+        self.port = port
+        self.ser = None
+        self.sensor_type = None
+        self.unit = 'ppm'
+        self.max_value = 5000
+        self.eol = b'\r\n'
+
+        # ring buffer of (timestamp, concentration_filtered, concentration_unfiltered)
+        self.samples = deque(maxlen=buffer_size)
+        # statistics of every second, (second, [RunningStats filtered, RunningStats unfiltered]),
+        # the memory does not grow with the sample rate or the window of read_bulk
+        self.history = deque(maxlen=history)
+        self._reader = None
+        self._new_sample = None
+        # queues of the consumers of sample_stream()
+        self._subscribers = []
+
+
+    def identity(self):
+        """
+            Description: Sensor type, unit and measurement range, e.g. for a cache
         """
+        return {'driver': 'cozir', 'sensor_type': self.gas, 'unit': self.unit,
+                'max_value': self.max_value}
+
+
+    async def connect(self, identity=None):
+        """
+            Description: Establishes connection to sensor
+            Parameters: identity - cached result of identity(), skips the wait after opening
+            Return: None
+            Raises: ConnectionError if the port cannot be opened after 10 attempts
+        """
+        if identity is not None:
+            self.ser = AsyncSerial(self.port, baudrate = 9600)
+            self.max_value = identity.get('max_value', self.max_value)
+            self.sensor_type = self.gas
+            return
 
         for i in range(0,10): # perform 10 retries if it does not connect
             try:
                 # connect to sensor
-                self.ser = serial.Serial(port,
-                                    baudrate = 9600,
-                                    parity = serial.PARITY_NONE,
-                                    stopbits = serial.STOPBITS_ONE,
-                                    bytesize = serial.EIGHTBITS,
-                                    timeout = 1)
-                sleep(0.1) # sleep before continue
-
-                self.sensor_type = 'CO2'
-                self.unit = 'ppm'
-                self.max_value = 5000
-                self.eol = b'\r\n'
+                self.ser = AsyncSerial(self.port, baudrate = 9600)
+                await asyncio.sleep(0.1) # sleep before continue
 
                 #flush buffer
                 self.ser.flush()
+                self.sensor_type = self.gas
                 break
 
-            except:
-                print('Cannot connect to port {}. Attempt {}'.format(port,i))
-                sleep(0.5)
-                
-    
-    def read(self):
+            except Exception as error_message:
+                print('Cannot connect to port {}. Attempt {}'.format(self.port,i))
+                print("Error: " + str(error_message))
+                if self.ser is not None:
+                    self.ser.close()
+                    self.ser = None
+                await asyncio.sleep(0.5)
+        else:
+            raise ConnectionError(f'Cannot open {self.port}')
+
+
+    def parse(self, sensor_reading):
         """
-            Description: Sensor single readout of gas concentration (filtered and unfiltered)
-            Parameters: None
+            Description: Extracts the concentrations from one line of the sensor output
+            Parameters: sensor_reading - line as bytes, e.g. b' Z 00412 z 00410\\r\\n'
             Return: list of floats containing the sensor values in the following order: concentration_filtered, concentration_unfiltered
         """
-        # Get measurment
-        self.ser.read_until(self.eol)
-        sensor_reading = self.ser.read_until(self.eol)
-
-        # Extract sensor readings
         concentration_filtered = int(sensor_reading[3:8])
         concentration_unfiltered = int(sensor_reading[11:16])
-        
-        sleep(0.1)
-
-        #flush buffer
-        self.ser.flush()
-        
         return [concentration_filtered, concentration_unfiltered]
 
 
-    def read_bulk(self, delay, iterations):
+    async def stream(self):
         """
-            Description: Multiple sensor readout -> returns average value 
-            Parameters: delay - determines delay between each iteration
-                         iterations - determines number of iterations
-            Return: list of averaged sensor values in the following order: concentration_filtered, concentration_unfiltered
+            Description: Endless readout of every line the sensor sends, use with "async for"
+            Parameters: None
+            Return: yields lists in the same order as read()
         """
-        
-        concentration_filtered = 0
-        concentration_unfiltered = 0
-        
-        for _ in range(0,iterations):
-            
-            # read out sensor value
-            var = self.read()
-             
-            # add measured value 
-            concentration_filtered += var[0]
-            concentration_unfiltered += var[1]
-            
-            # sleep for defined time
-            sleep(delay)
-        
-        # divide values by number of iterations
-        concentration_filtered = concentration_filtered/iterations
-        concentration_unfiltered = concentration_unfiltered/iterations
-        
+        # the first line can be incomplete
+        await self.ser.read_until(self.eol)
+        while True:
+            sensor_reading = await self.ser.read_until(self.eol)
+            if not sensor_reading.endswith(self.eol):
+                continue
+            try:
+                values = self.parse(sensor_reading)
+            except ValueError:
+                metrics.CORRUPT_FRAMES.labels(self.sensor_type).inc()
+                continue # skip broken lines
+            yield values
+
+
+    def start(self):
+        """
+            Description: Starts the background reader which stores every sample of the sensor
+                         in the ring buffer. Has to be called from the event loop.
+            Parameters: None
+            Return: None
+        """
+        if self._reader is None:
+            self._new_sample = asyncio.Event()
+            self._reader = asyncio.get_running_loop().create_task(self._read_stream())
+
+
+    async def _read_stream(self):
+        """
+            Description: Background task of start()
+        """
+        while True:
+            try:
+                async for values in self.stream():
+                    now = time.time()
+                    self.samples.append((now, values[0], values[1]))
+                    self._accumulate(now, values)
+                    for subscriber in self._subscribers:
+                        if not subscriber.full(): # a stalled consumer misses samples
+                            subscriber.put_nowait((now, values))
+                    self._new_sample.set()
+                    self._new_sample.clear()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error_message:
+                print(f'Reading {self.port} failed: {error_message}')
+                await asyncio.sleep(1)
+
+
+    def _accumulate(self, timestamp, values):
+        """
+            Description: Adds a sample to the statistics of its second
+        """
+        second = int(timestamp)
+        if not self.history or self.history[-1][0] != second:
+            self.history.append((second, [RunningStats(capacity=8) for _ in values]))
+        for stats, value in zip(self.history[-1][1], values):
+            stats.add(value)
+
+
+    async def sample_stream(self, interval=0):
+        """
+            Description: Every sample the sensor sends, use with "async for"
+            Parameters: interval - unused, the sensor sends at its own rate
+            Return: yields tuples (timestamp, values) with the unix time the line arrived and
+                    the values in the same order as read()
+        """
+        self.start()
+        subscriber = asyncio.Queue(maxsize=1000)
+        self._subscribers.append(subscriber)
+        try:
+            while True:
+                yield await subscriber.get()
+        finally:
+            self._subscribers.remove(subscriber)
+
+
+    async def wait_for_sample(self, timeout=5):
+        """
+            Description: Waits until the next sample is in the buffer
+            Parameters: timeout - maximal waiting time in seconds
+            Return: None
+        """
+        self.start()
+        await asyncio.wait_for(self._new_sample.wait(), timeout)
+
+
+    async def read(self):
+        """
+            Description: Latest sensor readout of gas concentration (filtered and unfiltered),
+                         waits only if no sample was received yet
+            Parameters: None
+            Return: list of floats containing the sensor values in the following order: concentration_filtered, concentration_unfiltered
+        """
+        if not self.samples:
+            await self.wait_for_sample()
+
+        _, concentration_filtered, concentration_unfiltered = self.samples[-1]
         return [concentration_filtered, concentration_unfiltered]
-    
-        
+
+
+    async def read_bulk(self, delay=None, iterations=None, window=None, aggregate='mean', raw=False,
+                        policy=None):
+        """
+            Description: Aggregate of all buffered samples of the last time window
+            Parameters: window - length of the time window in seconds
+                        delay, iterations - old interface, used as window = delay * iterations
+                        aggregate - aggregation of the samples: mean, median, trimmed_mean,
+                                    std, min or max
+                        raw - additionally return the statistics of the samples
+                        policy - aggregation.SamplingPolicy for the filtered concentration: if
+                                 the window is not enough, new samples are added until it is
+                                 satisfied
+            Return: list of aggregated sensor values in the following order: concentration_filtered, concentration_unfiltered.
+                    With raw=True a tuple (values, stats) where stats is a list of two
+                    aggregation.RunningStats in the same order.
+        """
+        if window is None:
+            window = delay * iterations
+        if not self.samples:
+            await self.wait_for_sample()
+
+        since = time.time() - window
+        if self.samples[0][0] <= since or len(self.samples) < self.samples.maxlen:
+            # the ring buffer holds every sample of the window
+            selected = [sample[1:] for sample in self.samples if sample[0] > since]
+            stats = [RunningStats(), RunningStats()]
+            for values in selected:
+                for column, value in zip(stats, values):
+                    column.add(value)
+        else:
+            # longer windows use the statistics per second, they include the samples of the
+            # second in which the window starts, i.e. up to one second before the window
+            selected = [columns for second, columns in self.history if second + 1 > since]
+            stats = [aggregation.merge(column) for column in zip(*selected)]
+        if not selected:
+            stats = [RunningStats(), RunningStats()]
+            stats[0].add(self.samples[-1][1])
+            stats[1].add(self.samples[-1][2])
+
+        started_at = time.monotonic()
+        taken = 0 # the samples of the window took no sampling time
+        while policy is not None and not policy.done(stats[0], time.monotonic() - started_at, taken):
+            await self.wait_for_sample()
+            _, concentration_filtered, concentration_unfiltered = self.samples[-1]
+            stats[0].add(concentration_filtered)
+            stats[1].add(concentration_unfiltered)
+            taken += 1
+
+        values = [column.aggregate(aggregate) for column in stats]
+        return (values, stats) if raw else values
+
+
+    async def close(self):
+        """
+            Description: Stops the background reader and closes the serial connection once the
+                         reader is done with it. Has to run on the event loop of the reader.
+        """
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+        if self.ser is not None: # connect() failed or already closed
+            self.ser.flush()
+            self.ser.close()
+            self.ser = None
+
+
+class CozirSensor:
+    """
+    Blocking wrapper around AsyncCozirSensor, the serial I/O runs on the shared
+    background event loop.
+    """
+
+    def __init__(self, port, identity=None):
+        """
+            ### Constructor ###
+            Establishes connection to sensor and checks the sensor type, unit and measurement range
+            Initializes variables
+            Parameters: identity - cached sensor information (AsyncCozirSensor.identity())
+        """
+        self.sensor = AsyncCozirSensor(port)
+        run_sync(self.sensor.connect(identity))
+        run_sync(self._start())
+
+
+    async def _start(self):
+        """
+            Description: Starts the background reader on the shared event loop
+        """
+        self.sensor.start()
+
+
+    def __getattr__(self, name):
+        """
+            Description: Gives access to sensor_type, unit, max_value, ... of the async sensor
+        """
+        if name == 'sensor':
+            raise AttributeError(name)
+        return getattr(self.sensor, name)
+
+
+    def read(self):
+        """
+            Description: Latest sensor readout of gas concentration (filtered and unfiltered),
+                         waits only if no sample was received yet
+            Parameters: None
+            Return: list of floats containing the sensor values in the following order: concentration_filtered, concentration_unfiltered
+        """
+        return run_sync(self.sensor.read())
+
+
+    def read_bulk(self, delay=None, iterations=None, window=None, aggregate='mean', raw=False,
+                  policy=None):
+        """
+            Description: Aggregate of all buffered samples of the last time window
+            Parameters: window - length of the time window in seconds
+                        delay, iterations - old interface, used as window = delay * iterations
+                        aggregate - aggregation of the samples: mean, median, trimmed_mean,
+                                    std, min or max
+                        raw - additionally return the statistics of the samples
+                        policy - aggregation.SamplingPolicy, extends the window if necessary
+            Return: list of aggregated sensor values in the following order: concentration_filtered, concentration_unfiltered.
+                    With raw=True a tuple (values, stats) where stats is a list of two
+                    aggregation.RunningStats in the same order.
+        """
+        return run_sync(self.sensor.read_bulk(delay, iterations, window, aggregate, raw, policy))
+
+
+    def close(self):
+        """
+            Description: Stops the background reader and closes the serial connection
+        """
+        run_sync(self.sensor.close())
+
+
     def __del__(self):
         """
             ### Destructor ###
         """
-        self.ser.flush()
-        self.ser.close()
+        self.close()
         
         
 # test class
@@ -0,0 +1,183 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Schema of the local sqlite database. All values are stored in one
+measurement table keyed by channel and unix time in milliseconds. A channel is
+one quantity of one sensor (e.g. NO2 concentration in ppm) and is described
+once in the channel table. The primary key of the measurement table is
+(channel_id, time) and the table has no rowid, so the table itself is the
+covering index for time range queries of a channel.
+
+For every resolution in RESOLUTIONS a rollup table holds count, mean, sum of
+squared deviations from the mean (m2), min and max of the values per channel
+and time bucket. The rollups are kept up to date by triggers on the measurement
+table, so every writer (station, migration, imports) maintains them
+automatically. The trigger updates mean and m2 with Welford's method, which
+stays accurate for values with a large offset (e.g. CO2 in ppm) where a sum of
+squares loses the variance; buckets are combined with
+aggregation.RunningStats.merge(). Only the channels of ROLLUP_QUANTITIES are
+rolled up; raw values, sample counts, uncertainties and fan phases are only
+stored in the measurement table.
+
+Old rows are deleted by retention.py. The retention table holds for the raw
+values ('raw') and every rollup table the time before which rows have been
+deleted; rebuild_rollups() never recalculates buckets before the raw horizon,
+as the raw values are missing there.
+"""
+
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel (
+    id INTEGER PRIMARY KEY,
+    sensor TEXT NOT NULL,
+    quantity TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    UNIQUE (sensor, quantity));
+
+CREATE TABLE IF NOT EXISTS measurement (
+    channel_id INTEGER NOT NULL REFERENCES channel (id),
+    time INTEGER NOT NULL,
+    value REAL NOT NULL,
+    std REAL,
+    PRIMARY KEY (channel_id, time)) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS retention (
+    resolution TEXT PRIMARY KEY,
+    horizon INTEGER NOT NULL);
+"""
+
+# resolution name -> bucket length in seconds
+RESOLUTIONS = {'1min': 60, '5min': 300, '1h': 3600, '1d': 86400}
+
+# quantities of the channels which have rollups
+ROLLUP_QUANTITIES = ('concentration', 'temperature', 'humidity')
+
+# ids of the channels which have rollups
+ROLLUP_CHANNELS = "SELECT id FROM channel WHERE quantity IN ({})".format(
+    ', '.join(f"'{quantity}'" for quantity in ROLLUP_QUANTITIES))
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_{name} (
+    channel_id INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    mean REAL NOT NULL,
+    m2 REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (channel_id, bucket)) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS rollup_{name}_insert AFTER INSERT ON measurement
+WHEN NEW.channel_id IN ({channels})
+BEGIN
+    INSERT INTO rollup_{name} (channel_id, bucket, count, mean, m2, min, max)
+    VALUES (NEW.channel_id, NEW.time / {bucket_ms} * {bucket_ms}, 1,
+            NEW.value, 0, NEW.value, NEW.value)
+    ON CONFLICT (channel_id, bucket) DO UPDATE SET
+        count = count + 1,
+        mean = mean + (excluded.mean - mean) / (count + 1.0),
+        m2 = m2 + (excluded.mean - mean) * (excluded.mean - mean) * count / (count + 1.0),
+        min = min(min, excluded.min),
+        max = max(max, excluded.max);
+END;
+"""
+
+# rows which already exist are ignored, a replaced row would be counted twice in the rollups
+INSERT_MEASUREMENT = """INSERT OR IGNORE INTO measurement (channel_id, time, value, std)
+                        VALUES (?,?,?,?)"""
+
+
+def create_schema(con):
+    """
+        Description: Creates all tables which do not exist yet
+        Parameters: con: sqlite3 connection
+        Return: None
+    """
+    # free pages can be returned in small steps (retention.py), only possible for new databases
+    con.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    con.executescript(SCHEMA)
+
+    # rollup tables of older versions hold sum and sum of squares, they are rebuilt
+    if 'sum_sq' in [column[1] for column in con.execute('PRAGMA table_info(rollup_1d)')]:
+        for name in RESOLUTIONS:
+            con.execute(f'DROP TRIGGER IF EXISTS rollup_{name}_insert')
+            con.execute(f'DROP TABLE IF EXISTS rollup_{name}')
+
+    for name, seconds in RESOLUTIONS.items():
+        # triggers of older versions roll up every channel or other quantities
+        trigger = con.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                              (f'rollup_{name}_insert',)).fetchone()
+        if trigger is not None and ROLLUP_CHANNELS not in trigger[0]:
+            con.execute(f'DROP TRIGGER rollup_{name}_insert')
+            con.execute(f'DELETE FROM rollup_{name} WHERE channel_id NOT IN ({ROLLUP_CHANNELS})')
+        con.executescript(ROLLUP_SCHEMA.format(name=name, bucket_ms=seconds * 1000,
+                                               channels=ROLLUP_CHANNELS))
+
+    # rollup tables added to a database which already holds data
+    if (con.execute('SELECT 1 FROM measurement LIMIT 1').fetchone() is not None
+            and con.execute('SELECT 1 FROM rollup_1d LIMIT 1').fetchone() is None):
+        rebuild_rollups(con)
+
+
+def rebuild_rollups(con, channel_ids=None, start=None, end=None):
+    """
+        Description: Recalculates the rollup tables from the measurement table
+        Parameters: con: sqlite3 connection
+                    channel_ids: list of channel ids, default all channels, only those of
+                                 ROLLUP_QUANTITIES are rolled up
+                    start, end: unix time range in ms, default all. The buckets which
+                                overlap the range are recalculated completely, except those
+                                before the retention horizon of the raw values.
+        Return: None
+    """
+    horizon = con.execute("SELECT horizon FROM retention WHERE resolution = 'raw'").fetchone()
+    channels = '' if channel_ids is None else \
+        f"AND channel_id IN ({','.join(str(int(channel)) for channel in channel_ids)})"
+    with con:
+        for name, seconds in RESOLUTIONS.items():
+            bucket_ms = seconds * 1000
+            first = -2 ** 63 if start is None else start // bucket_ms * bucket_ms
+            if horizon is not None: # the first bucket which still has all its raw values
+                first = max(first, -(-horizon[0] // bucket_ms) * bucket_ms)
+            last = 2 ** 63 - 1 if end is None else end
+            con.execute(f'DELETE FROM rollup_{name} WHERE bucket BETWEEN ? AND ? {channels}',
+                        (first, last))
+            # two passes: the mean of every bucket, then the squared deviations from it
+            con.execute(f"""INSERT INTO rollup_{name} (channel_id, bucket, count, mean, m2, min, max)
+                            SELECT b.channel_id, b.bucket, b.count, b.mean,
+                                   sum((m.value - b.mean) * (m.value - b.mean)), b.min, b.max
+                            FROM (SELECT channel_id, time / {bucket_ms} * {bucket_ms} AS bucket,
+                                         count(*) AS count, avg(value) AS mean,
+                                         min(value) AS min, max(value) AS max
+                                  FROM measurement
+                                  WHERE time >= ? AND time / {bucket_ms} * {bucket_ms} <= ? {channels}
+                                        AND channel_id IN ({ROLLUP_CHANNELS})
+                                  GROUP BY channel_id, bucket) AS b
+                            JOIN measurement AS m ON m.channel_id = b.channel_id
+                                 AND m.time >= b.bucket AND m.time < b.bucket + {bucket_ms}
+                            GROUP BY b.channel_id, b.bucket""", (first, last))
+
+
+def channel_id(con, sensor, quantity, unit):
+    """
+        Description: Returns the id of a channel and creates the channel if necessary
+        Parameters: con: sqlite3 connection
+                    sensor: sensor name, e.g. 'NO2' or 'station'
+                    quantity: measured quantity, e.g. 'concentration' or 'temperature'
+                    unit: unit of the stored values
+        Return: int
+    """
+    con.execute('INSERT OR IGNORE INTO channel (sensor, quantity, unit) VALUES (?,?,?)',
+                (sensor, quantity, unit))
+    return con.execute('SELECT id FROM channel WHERE sensor = ? AND quantity = ?',
+                       (sensor, quantity)).fetchone()[0]
+
+
+def epoch_ms(timestamp=None) -> int:
+    """
+        Description: Converts a datetime (default: now) to unix time in milliseconds
+    """
+    timestamp = datetime.now() if timestamp is None else timestamp
+    return round(timestamp.timestamp() * 1000)
@@ -0,0 +1,126 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Buffered writer for the local sqlite database. Rows are collected in
+memory and written with executemany in one transaction once enough rows are
+pending or enough time has passed. Together with WAL mode this replaces one
+fsync per measurement cycle by one per flush, which is much easier on the
+SD card of the Raspberry pi.
+"""
+
+import sqlite3
+import threading
+import time
+
+import metrics
+
+
+class BatchedWriter:
+    """
+    Group commit writer for sqlite.
+    """
+
+    def __init__(self, db_path, flush_rows=48, flush_interval=60, synchronous='NORMAL'):
+        """
+            ### Constructor ###
+            Parameters: db_path: path to sqlite3 database
+                        flush_rows: number of pending rows which triggers a flush
+                        flush_interval: maximal time in seconds a row stays in memory, add()
+                                        checks it, without new rows the owner calls
+                                        flush_due() (e.g. the idle call of a pipeline stage)
+                        synchronous: sqlite synchronous setting, NORMAL is safe in WAL mode
+        """
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+
+        self.con = sqlite3.connect(db_path, check_same_thread=False)
+        # only takes effect for a new file, before WAL mode writes its header (see retention.py)
+        self.con.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        self.con.execute('PRAGMA journal_mode=WAL')
+        # the write-ahead log is cut back to 4 MB after a checkpoint instead of keeping its peak size
+        self.con.execute(f'PRAGMA journal_size_limit={4 * 1024 * 1024}')
+        self.con.execute(f'PRAGMA synchronous={synchronous}')
+
+        self._lock = threading.Lock()
+        self._rows = {} # insert statement -> list of parameter tuples
+        self.pending = 0
+
+        # statistics
+        self.flushes = 0
+        self.rows_written = 0
+        self.last_flush_duration = 0.0
+        self.total_flush_duration = 0.0
+        self._last_flush_at = time.monotonic()
+
+
+    def add(self, query, params):
+        """
+            Description: Buffers one row and flushes if the row or time limit is reached
+            Parameters: query: parametrized insert statement
+                        params: tuple of parameters
+            Return: None
+        """
+        with self._lock:
+            self._rows.setdefault(query, []).append(params)
+            self.pending += 1
+            metrics.DB_PENDING_ROWS.set(self.pending)
+
+        if self.flush_due():
+            self.flush()
+
+
+    def flush_due(self):
+        """
+            Description: Checks whether the pending rows should be written
+            Return: True if a limit is reached
+        """
+        return self.pending >= self.flush_rows or (
+            self.pending > 0 and time.monotonic() - self._last_flush_at >= self.flush_interval)
+
+
+    def flush(self):
+        """
+            Description: Writes all pending rows in one transaction. If the transaction fails
+                         the rows stay in the buffer for the next attempt.
+            Return: None
+        """
+        with self._lock:
+            if not self._rows:
+                return
+
+            started_at = time.perf_counter()
+            with self.con: # commits on success, rolls back on error
+                for query, rows in self._rows.items():
+                    self.con.executemany(query, rows)
+
+            self.rows_written += self.pending
+            self._rows = {}
+            self.pending = 0
+
+            self.last_flush_duration = time.perf_counter() - started_at
+            metrics.DB_FLUSH_DURATION.observe(self.last_flush_duration)
+            metrics.DB_PENDING_ROWS.set(0)
+            self.total_flush_duration += self.last_flush_duration
+            self.flushes += 1
+            self._last_flush_at = time.monotonic()
+
+
+    def stats(self) -> dict:
+        """
+            Description: Current state of the writer
+            Return: dict with pending rows, written rows, number of flushes and flush durations
+        """
+        return {'pending': self.pending,
+                'rows_written': self.rows_written,
+                'flushes': self.flushes,
+                'last_flush_duration': self.last_flush_duration,
+                'mean_flush_duration': self.total_flush_duration / self.flushes if self.flushes else 0.0}
+
+
+    def close(self):
+        """
+            Description: Writes the pending rows and closes the connection
+        """
+        self.flush()
+        self.con.close()
@@ -1,68 +1,27 @@
 '''
 Initialize the sqlite3 database of the airquality station.
 '''
+import os
+import sys
 import sqlite3
 
+# the schema is shared with the measurement scripts in the parent folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db_schema import create_schema
 
-def init_db():
+
+def init_db(db_path='airquality.db'):
     '''
     Method to initialize a sqlite database for the airquality measurement station.
     '''
 
+    sqlite_connection = None
     try:
-        sqlite_connection = sqlite3.connect('airquality.db')
-        cursor = sqlite_connection.cursor()
+        sqlite_connection = sqlite3.connect(db_path)
         print('Established connection to SQLite')
 
-        table_no2 = ''' CREATE TABLE NO2 (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp timestamp NOT NULL,
-                    value REAL NOT NULL,
-                    unit char(3) NOT NULL,
-                    temperature REAL NOT NULL,
-                    humidity REAL NOT NULL); 
-                '''
-
-        table_o3 = ''' CREATE TABLE O3 (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp timestamp NOT NULL,
-                    value REAL NOT NULL,
-                    unit char(3) NOT NULL,
-                    temperature REAL NOT NULL,
-                    humidity REAL NOT NULL); 
-                '''
-
-        table_co = ''' CREATE TABLE CO (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp timestamp NOT NULL,
-                    value REAL NOT NULL,
-                    unit char(3) NOT NULL,
-                    temperature REAL NOT NULL,
-                    humidity REAL NOT NULL); 
-                '''
-        
-        table_co2 = ''' CREATE TABLE CO2 (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp timestamp NOT NULL,
-                    value REAL NOT NULL,
-                    unit char(3) NOT NULL,
-                    temperature REAL NOT NULL,
-                    humidity REAL NOT NULL); 
-                '''
-       
-        cursor.execute(table_no2)
-        print('Created table NO2')
-
-        cursor.execute(table_o3)
-        print('Created table O3')
-
-        cursor.execute(table_co)
-        print('Created table CO')
-
-        cursor.execute(table_co2)
-        print('Created table CO2')
-
-        cursor.close()
+        create_schema(sqlite_connection)
+        print('Created tables channel and measurement')
 
     except sqlite3.Error as error:
         print('Error while initializing SQlite database', error)
@@ -0,0 +1,73 @@
+'''
+Convert an airquality database with the old per gas tables (NO2, O3, CO, CO2)
+into the channel/measurement schema. The conversion happens in place, the old
+tables are dropped and the file is vacuumed afterwards.
+
+The old timestamps were written with datetime.now() and are therefore converted
+from local time of the machine running this script to unix time.
+
+Usage: python db_migrate.py [path to airquality.db]
+'''
+import os
+import sys
+import sqlite3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db_schema import create_schema, channel_id
+
+LEGACY_TABLES = ['NO2', 'O3', 'CO', 'CO2']
+
+# text timestamp (local time) -> unix time in milliseconds
+EPOCH_MS = "CAST(round((julianday(timestamp, 'utc') - 2440587.5) * 86400000.0) AS INTEGER)"
+
+
+def migrate(db_path='airquality.db'):
+    '''
+    Method to migrate a database with the old schema.
+    '''
+
+    sqlite_connection = sqlite3.connect(db_path)
+    try:
+        existing = {row[0] for row in sqlite_connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        tables = [table for table in LEGACY_TABLES if table in existing]
+        if not tables:
+            print('No old tables found, nothing to migrate')
+            return
+
+        size_before = os.path.getsize(db_path)
+
+        with sqlite_connection:
+            create_schema(sqlite_connection)
+
+            for table in tables:
+                unit = sqlite_connection.execute(
+                    f'SELECT unit FROM {table} LIMIT 1').fetchone()
+                gas = channel_id(sqlite_connection, table, 'concentration',
+                                 unit[0] if unit else 'ppm')
+                sqlite_connection.execute(
+                    f'''INSERT OR IGNORE INTO measurement (channel_id, time, value)
+                        SELECT ?, {EPOCH_MS}, value FROM {table}''', (gas,))
+
+                # temperature and humidity were stored in every table, keep them once
+                for quantity, unit in [('temperature', '°C'), ('humidity', '%rH')]:
+                    sqlite_connection.execute(
+                        f'''INSERT OR IGNORE INTO measurement (channel_id, time, value)
+                            SELECT ?, {EPOCH_MS}, {quantity} FROM {table}''',
+                        (channel_id(sqlite_connection, 'station', quantity, unit),))
+
+                sqlite_connection.execute(f'DROP TABLE {table}')
+                print(f'Migrated table {table}')
+
+        sqlite_connection.execute('VACUUM')
+        count = sqlite_connection.execute('SELECT count(*) FROM measurement').fetchone()[0]
+        print(f'{count} values migrated, database size {size_before} -> '
+              f'{os.path.getsize(db_path)} bytes')
+
+    finally:
+        sqlite_connection.close()
+
+
+
+if __name__ == "__main__":
+    migrate(sys.argv[1] if len(sys.argv) > 1 else 'airquality.db')
@@ -0,0 +1,147 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Finds the sensors on the serial ports. All candidate ports are
+probed at the same time: an EC sensor answers the information command 0xD1,
+a Cozir sensor streams lines like ' Z 00412 z 00410'. The identity of every
+sensor (type, unit, range, decimals) is cached on disk by port, so a restart
+connects without any query.
+
+Usage: python discovery.py [port ...]   probes the ports (default all UARTs)
+                                        and updates the cache
+"""
+
+import os
+import sys
+import glob
+import json
+
+# default location of the identity cache
+IDENTITY_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'device_data', 'sensor_identity.json')
+
+
+def candidate_ports() -> list:
+    """
+        Description: UARTs of the Raspberry pi
+    """
+    return sorted(glob.glob('/dev/ttyS[0-9]*') + glob.glob('/dev/ttyAMA[0-9]*'))
+
+
+async def probe(port, timeout=1.5):
+    """
+        Description: Identifies the sensor on a port
+        Parameters: port: serial port
+                    timeout: maximal waiting time for a Cozir line in seconds
+        Return: identity dict (see AsyncEcSensor.identity) or None if no sensor answered
+    """
+    # the drivers are only needed for probing, not for the cache
+    import asyncio
+    from async_serial import AsyncSerial
+    from ecsense import AsyncEcSensor
+    from cozir import AsyncCozirSensor
+
+    try:
+        ser = AsyncSerial(port, baudrate=9600)
+    except Exception:
+        return None
+
+    try:
+        ser.reset_input_buffer()
+        ser.write(b'\xD1')
+        reply = await ser.read(9, timeout=0.5)
+        try:
+            return AsyncEcSensor.parse_identity(reply)
+        except ValueError:
+            ser.unread(reply)
+
+        # a Cozir sensor ignores the command and keeps streaming
+        cozir = AsyncCozirSensor(port)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            line = await ser.read_until(cozir.eol, max(deadline - loop.time(), 0))
+            start = line.find(b' Z ')
+            if line.endswith(cozir.eol) and start >= 0:
+                try:
+                    cozir.parse(line[start:])
+                    return cozir.identity()
+                except ValueError:
+                    pass
+        return None
+    finally:
+        ser.close()
+
+
+def discover(ports=None, timeout=1.5) -> dict:
+    """
+        Description: Probes several ports at the same time
+        Parameters: ports: list of ports, default candidate_ports()
+                    timeout: see probe()
+        Return: dict which maps every port to its identity or None
+    """
+    import asyncio
+    from async_serial import run_sync
+
+    ports = candidate_ports() if ports is None else list(ports)
+
+    async def probe_all():
+        return await asyncio.gather(*[probe(port, timeout) for port in ports])
+
+    return dict(zip(ports, run_sync(probe_all())))
+
+
+class IdentityCache:
+    """
+    Identities of the sensors by port, stored as JSON file.
+    """
+
+    def __init__(self, path=IDENTITY_CACHE):
+        """
+            ### Constructor ###
+            Parameters: path: path of the JSON file, it is created by save()
+        """
+        self.path = path
+        try:
+            with open(path, encoding='utf-8') as file:
+                self.identities = json.load(file)
+        except (OSError, ValueError):
+            self.identities = {}
+
+
+    def get(self, port):
+        return self.identities.get(port)
+
+
+    def put(self, port, identity):
+        self.identities[port] = identity
+
+
+    def remove(self, port):
+        self.identities.pop(port, None)
+
+
+    def save(self):
+        """
+            Description: Writes the cache, replaces the file atomically
+        """
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(self.identities, file, indent=2, sort_keys=True)
+        os.replace(temporary, self.path)
+
+
+if __name__ == "__main__":
+
+    cache = IdentityCache()
+    for port, identity in discover(sys.argv[1:] or None).items():
+        if identity is None:
+            print(f'{port}: no sensor')
+            cache.remove(port)
+        else:
+            print(f"{port}: {identity['sensor_type']} sensor, range {identity['max_value']} "
+                  f"{identity['unit']}")
+            cache.put(port, identity)
+    cache.save()
+    print(f'Identities written to {cache.path}')
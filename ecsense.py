@@ -6,43 +6,109 @@ Author: Daniel Kuehbacher
 Description: This class can be used to read ec sensors via UART on a Raspberry pi.
 """
 
-from time import sleep
-import serial
+import time
+import asyncio
 
+import metrics
+from aggregation import RunningStats
+from async_serial import AsyncSerial, run_sync
 
-class EcSensor:
+
+class AsyncEcSensor:
     """
-    Class for EC-Sensor connection usage.
+    Class for EC-Sensor connection usage with asyncio.
     """
     # sensor types used in the project can be read out
     types = {'0x21': 'NO2', '0x23': 'O3', '0x19': 'CO'}
     units = {'0x2': 'ppm', '0x4': 'ppb', '0x8': '%'}
 
+    # command 6: combined reading of gas concentration, temperature and humidity
+    read_command = b'\xff\x01\x87\x00\x00\x00\x00\x00\x78'
+    frame_length = 13
+
     def __init__(self, port):
         """
             ### Constructor ###
-            Establishes connection to sensor and checks the sensor type, unit and measurement range
-            Initializes variables
+            Initializes variables, the connection is established with connect()
+        """
+        self.port = port
+        self.ser = None
+
+        # number of frames with wrong checksum and of reads that timed out
+        self.corrupt_frames = 0
+        self.short_frames = 0
+
+
+    @staticmethod
+    def checksum(data):
+        """
+            Description: Checksum of the datasheet: sum of the bytes, inverted, plus 1
+            Parameters: data - bytes which are covered by the checksum
+            Return: checksum as int
+        """
+        return (~sum(data) + 1) & 0xFF
+
+
+    @classmethod
+    def parse_identity(cls, info_bin):
+        """
+            Description: Decodes the answer to the sensor information command 0xD1
+            Parameters: info_bin - 9 bytes (8 bytes + checksum)
+            Return: dict with driver, sensor_type, unit, max_value and decimal
+            Raises: ValueError if the answer is incomplete or unknown
+        """
+        if len(info_bin) < 9 or cls.checksum(info_bin[1:8]) != info_bin[8]:
+            raise ValueError(f'Invalid sensor information {bytes(info_bin).hex()}')
+        try:
+            return {'driver': 'ec',
+                    'sensor_type': cls.types[hex(info_bin[0])],
+                    'unit': cls.units[hex(info_bin[3])],
+                    'max_value': (info_bin[1] << 8)+ info_bin[2],
+                    'decimal': info_bin[7]>>4}
+        except KeyError as error_message:
+            raise ValueError(f'Unknown sensor information {bytes(info_bin).hex()}') from error_message
+
+
+    async def identify(self):
+        """
+            Description: Queries the sensor information
+            Return: dict as returned by parse_identity
+        """
+        self.ser.reset_input_buffer()
+        self.ser.write(b'\xD1')
+        return self.parse_identity(await self.ser.read(9))
+
+
+    def identity(self):
+        """
+            Description: Sensor type, unit, measurement range and decimals, e.g. for a cache
+            Return: dict as returned by parse_identity
+        """
+        return {'driver': 'ec', 'sensor_type': self.sensor_type, 'unit': self.unit,
+                'max_value': self.max_value, 'decimal': self.decimal}
+
+
+    async def connect(self, identity = None):
         """
+            Description: Establishes connection to sensor and checks the sensor type, unit and
+                         measurement range
+            Parameters: identity - known result of identify(), skips the query
+            Return: None
+            Raises: ConnectionError if the sensor does not answer after 10 attempts
+        """
+        if identity is not None:
+            self.ser = AsyncSerial(self.port, baudrate = 9600)
+            self._set_identity(identity)
+            return
+
         for i in range(0,10): # perform 10 retries if it does not connect
             try:
-                self.ser = serial.Serial(port, baudrate = 9600,
-                                    parity = serial.PARITY_NONE,
-                                    stopbits = serial.STOPBITS_ONE,
-                                    bytesize = serial.EIGHTBITS,
-                                    timeout = 1)
-
-                sleep(0.1) # sleep before continue
+                self.ser = AsyncSerial(self.port, baudrate = 9600)
 
-                # get sensor information
-                self.ser.write(b'\xD1')
-                sleep(0.1)
-                info_bin = list(self.ser.read(8))
+                await asyncio.sleep(0.1) # sleep before continue
 
-                self.sensor_type = self.types[hex(info_bin[0])]
-                self.unit = self.units[hex(info_bin[3])]
-                self.max_value = (info_bin[1] << 8)+ info_bin[2]
-                self.decimal = info_bin[7]>>4
+                # get sensor information (8 bytes + checksum)
+                self._set_identity(await self.identify())
 
                 #flush buffer
                 self.ser.flush()
@@ -51,56 +117,160 @@ class EcSensor:
             except Exception as error_message:
                 print(f'Cannot connect to the device. Attempt {i}')
                 print("Error: " + str(error_message))
-                sleep(0.5)
+                if self.ser is not None:
+                    self.ser.close() # the next attempt opens the port again
+                    self.ser = None
+                await asyncio.sleep(0.5)
+        else:
+            raise ConnectionError(f'No EC sensor answers on {self.port}')
+
+
+    def _set_identity(self, identity):
+        self.sensor_type = identity['sensor_type']
+        self.unit = identity['unit']
+        self.max_value = identity['max_value']
+        self.decimal = identity['decimal']
+
+
+    async def read_frame(self, timeout = 1):
+        """
+            Description: Waits for the next complete 13 byte answer to command 6. Synchronises
+                         on the 0xFF start byte and drops frames with a wrong checksum.
+            Parameters: timeout - maximal waiting time in seconds
+            Return: frame as bytes or None if no valid frame arrived in time
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while True:
+            remaining = deadline - loop.time()
+            start = await self.ser.read_until(b'\xff', max(remaining, 0))
+            if not start.endswith(b'\xff'):
+                self.short_frames += 1
+                metrics.SHORT_FRAMES.labels(self.sensor_type).inc()
+                return None
+
+            frame = b'\xff' + await self.ser.read(self.frame_length - 1,
+                                                   max(deadline - loop.time(), 0))
+            if len(frame) < self.frame_length:
+                self.short_frames += 1
+                metrics.SHORT_FRAMES.labels(self.sensor_type).inc()
+                return None
 
+            if frame[1] == 0x87 and self.checksum(frame[1:12]) == frame[12]:
+                return frame
 
-    def read(self, delay = 0.1):
+            # search the rest of the frame again for a start byte
+            self.corrupt_frames += 1
+            metrics.CORRUPT_FRAMES.labels(self.sensor_type).inc()
+            self.ser.unread(frame[1:])
+
+
+    def parse(self, frame):
         """
-            Description: Sensor single readout of gas concentration, temperature and humidity
-            Parameters: delay - determines delay between write and read command. default = 0.01s
+            Description: Converts a frame of command 6 into physical values
+            Parameters: frame - 13 bytes as returned by read_frame
             Return: list of floats containing the sensor values in the following order: gas,
                     temperature, humidity
         """
-        self.ser.write(b'\xff\x01\x87\x00\x00\x00\x00\x00\x78')
-        sleep(delay)
-        readout = self.ser.read(13)
+        gas_concentration =  ((frame[6] << 8) + frame[7]) / pow(10, self.decimal)
+        temperature = int.from_bytes(frame[8:10], 'big', signed=True) / 100
+        humidity = ((frame[10] << 8)+ frame[11]) / 100
+        return [gas_concentration, temperature, humidity]
 
-        gas_concentration =  ((readout[7] << 8) + readout[8]) / pow(10, self.decimal)
-        temperature = ((readout[9] << 8)+ readout[10]) / 100
-        humidity = ((readout[11] << 8)+ readout[12]) / 100
 
-        self.ser.flush() #flush serial buffer
-        return [gas_concentration, temperature, humidity]
+    async def read(self, timeout = 1, retries = 3):
+        """
+            Description: Sensor single readout of gas concentration, temperature and humidity.
+                         Returns as soon as a valid answer arrived.
+            Parameters: timeout - maximal waiting time for an answer in seconds
+                        retries - number of times the command is sent before giving up
+            Return: list of floats containing the sensor values in the following order: gas,
+                    temperature, humidity
+        """
+        for attempt in range(0,retries):
+            if attempt > 0:
+                metrics.READ_RETRIES.labels(self.sensor_type).inc()
+
+            # drop answers which arrived after an earlier timeout
+            self.ser.reset_input_buffer()
+            started_at = time.perf_counter()
+            self.ser.write(self.read_command)
+
+            frame = await self.read_frame(timeout)
+            if frame is not None:
+                metrics.FRAME_LATENCY.labels(self.sensor_type).observe(time.perf_counter() - started_at)
+                return self.parse(frame)
+
+        raise TimeoutError(f'No valid answer from {self.port}')
+
 
+    async def stream(self, delay = 0):
+        """
+            Description: Endless sensor readout, use with "async for"
+            Parameters: delay - determines delay between two readouts
+            Return: yields lists in the same order as read()
+        """
+        while True:
+            yield await self.read()
+            await asyncio.sleep(delay)
 
-    def read_bulk(self, delay, iterations):
+
+    async def sample_stream(self, interval = 0):
+        """
+            Description: Endless readout at the rate the sensor answers, use with "async for".
+                         Reads which fail after all retries are skipped.
+            Parameters: interval - minimal time between two commands in seconds
+            Return: yields tuples (timestamp, values) with the unix time of the read and the
+                    values in the same order as read()
         """
-            Description: Multiple sensor readout -> returns average value
+        loop = asyncio.get_running_loop()
+        while True:
+            started_at = loop.time()
+            sent_at = time.time()
+            try:
+                values = await self.read()
+            except TimeoutError as error_message:
+                print(f'Reading {self.port} failed: {error_message}')
+                await asyncio.sleep(1)
+                continue
+            yield (sent_at + time.time()) / 2, values # the sensor measured in between
+            await asyncio.sleep(max(interval - (loop.time() - started_at), 0))
+
+
+    async def read_bulk(self, delay, iterations, aggregate = 'mean', raw = False, policy = None):
+        """
+            Description: Multiple sensor readout -> returns aggregated value
             Parameters: delay - determines delay between each iteration
                          iterations - determines number of iterations
-            Return: list of averaged sensor values in the following order: gas,
-                    temperature, humidity
+                         aggregate - aggregation of the samples: mean, median, trimmed_mean,
+                                     std, min or max
+                         raw - additionally return the statistics of the samples
+                         policy - aggregation.SamplingPolicy for the gas concentration, replaces
+                                  iterations: samples are taken until it is satisfied
+            Return: list of aggregated sensor values in the following order: gas,
+                    temperature, humidity. With raw=True a tuple (values, stats) where
+                    stats is a list of three aggregation.RunningStats in the same order.
         """
+        # constant memory for any number of iterations
+        stats = [RunningStats() for _ in range(0,3)]
 
-        concentration = 0
-        humidity = 0
-        temperature = 0
-
-        for i in range(0,iterations):
-            var = self.read() # read out sensor value
-            concentration += var[0]
-            temperature += var[1]
-            humidity += var[2]
-            sleep(delay)
+        started_at = time.monotonic()
+        i = 0
+        while (i < iterations if policy is None
+               else not policy.done(stats[0], time.monotonic() - started_at)):
+            i += 1
+            var = await self.read() # read out sensor value
+            stats[0].add(var[0])
+            stats[1].add(var[1])
+            stats[2].add(var[2])
+            await asyncio.sleep(delay)
 
-        # divide values by number of iterations
-        concentration = concentration/iterations
-        humidity = humidity/iterations
-        temperature = temperature/iterations
-        return [concentration, temperature, humidity]
+        values = [column.aggregate(aggregate) for column in stats]
+        return (values, stats) if raw else values
 
 
-    def change_led_status(self, status):
+    async def change_led_status(self, status):
         """
         Change sensor led blinking status.
         """
@@ -111,12 +281,85 @@ class EcSensor:
         self.ser.flush()
 
 
+    def close(self):
+        """
+            Description: Closes the serial connection
+        """
+        if self.ser is not None: # connect() failed or already closed
+            self.ser.flush()
+            self.ser.close()
+            self.ser = None
+
+
+class EcSensor:
+    """
+    Class for EC-Sensor connection usage. Blocking wrapper around AsyncEcSensor,
+    the serial I/O runs on the shared background event loop.
+    """
+    types = AsyncEcSensor.types
+    units = AsyncEcSensor.units
+
+    def __init__(self, port, identity = None):
+        """
+            ### Constructor ###
+            Establishes connection to sensor and checks the sensor type, unit and measurement range
+            Initializes variables
+            Parameters: identity - cached sensor information (AsyncEcSensor.identity()), skips
+                                   the query
+        """
+        self.sensor = AsyncEcSensor(port)
+        run_sync(self.sensor.connect(identity))
+
+
+    def __getattr__(self, name):
+        """
+            Description: Gives access to sensor_type, unit, max_value, ... of the async sensor
+        """
+        if name == 'sensor':
+            raise AttributeError(name)
+        return getattr(self.sensor, name)
+
+
+    def read(self, timeout = 1, retries = 3):
+        """
+            Description: Sensor single readout of gas concentration, temperature and humidity.
+                         Returns as soon as a valid answer arrived.
+            Parameters: timeout - maximal waiting time for an answer in seconds
+                        retries - number of times the command is sent before giving up
+            Return: list of floats containing the sensor values in the following order: gas,
+                    temperature, humidity
+        """
+        return run_sync(self.sensor.read(timeout, retries))
+
+
+    def read_bulk(self, delay, iterations, aggregate = 'mean', raw = False, policy = None):
+        """
+            Description: Multiple sensor readout -> returns aggregated value
+            Parameters: delay - determines delay between each iteration
+                         iterations - determines number of iterations
+                         aggregate - aggregation of the samples: mean, median, trimmed_mean,
+                                     std, min or max
+                         raw - additionally return the statistics of the samples
+                         policy - aggregation.SamplingPolicy, replaces iterations
+            Return: list of aggregated sensor values in the following order: gas,
+                    temperature, humidity. With raw=True a tuple (values, stats) where
+                    stats is a list of three aggregation.RunningStats in the same order.
+        """
+        return run_sync(self.sensor.read_bulk(delay, iterations, aggregate, raw, policy))
+
+
+    def change_led_status(self, status):
+        """
+        Change sensor led blinking status.
+        """
+        run_sync(self.sensor.change_led_status(status))
+
+
     def __del__(self):
         """
             ### Destructor ###
         """
-        self.ser.flush()
-        self.ser.close()
+        self.sensor.close()
 
 
 # test class
@@ -0,0 +1,90 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Access to the GPIOs which switch the fans. backend() loads RPi.GPIO
+on first use. Without a Raspberry pi, or with the environment variable
+AIRQUALITY_GPIO=null, a NullGPIO is used which only records the pin states,
+so the measurement scripts can be imported and run anywhere. set_backend()
+installs another backend, e.g. the FakeGPIO of simulator.py.
+
+A backend provides setwarnings, setmode, setup, output, cleanup and the
+constants BCM and OUT like RPi.GPIO.
+"""
+
+import os
+import time
+import logging
+
+_backend = None
+
+
+class NullGPIO:
+    """
+    Backend without hardware, records the pin states.
+    """
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    HIGH = True
+    LOW = False
+
+    def __init__(self):
+        self.mode = None
+        self.pins = {} # pin -> current output state
+        self.history = [] # (monotonic time, pin, state)
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction):
+        self.pins[pin] = False
+
+    def output(self, pin, state):
+        self.pins[pin] = bool(state)
+        self.history.append((time.monotonic(), pin, bool(state)))
+
+    def input(self, pin):
+        return self.pins.get(pin, False)
+
+    def cleanup(self):
+        self.pins = {}
+
+
+def backend():
+    """
+        Description: The GPIO backend, loaded on the first call
+        Return: RPi.GPIO module or NullGPIO
+        Raises: ImportError if AIRQUALITY_GPIO=rpi and RPi.GPIO cannot be loaded
+    """
+    global _backend
+    if _backend is None:
+        choice = os.environ.get('AIRQUALITY_GPIO', 'auto')
+        if choice == 'null':
+            _backend = NullGPIO()
+        else:
+            try:
+                import RPi.GPIO
+                _backend = RPi.GPIO
+            except (ImportError, RuntimeError) as error_message: # RuntimeError: not a pi
+                if choice == 'rpi':
+                    raise ImportError(f'RPi.GPIO is not available: {error_message}')
+                logging.warning(f'RPi.GPIO is not available ({error_message}), '
+                                'the fans are not switched')
+                _backend = NullGPIO()
+    return _backend
+
+
+def set_backend(new_backend):
+    """
+        Description: Replaces the GPIO backend
+        Parameters: new_backend: object with the interface of RPi.GPIO
+        Return: new_backend
+    """
+    global _backend
+    _backend = new_backend
+    return new_backend
@@ -0,0 +1,364 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Live data of the station over HTTP for the touchscreen and the
+LAN, without any access to the database. The measurement loop hands every
+cycle (or every second of the continuous sampling) to publish(); the last
+hours of every channel are kept in a preallocated ring buffer per channel with
+at most one value per second.
+
+    GET /                  page with the latest values, e.g. for a kiosk browser
+    GET /api/channels      channels with unit and number of buffered values
+    GET /api/latest        latest value of every channel
+    GET /api/history?channel=NO2&minutes=60&points=300
+                           values of a channel, averaged to at most points
+                           buckets (with min and max of every bucket)
+    GET /api/stream        Server-Sent Events, one event "cycle" per publish()
+
+The JSON of /api/latest and of every event is built once per publish(), so
+many clients cost a write per client and nothing else. A client which
+reconnects with Last-Event-ID gets the events it missed.
+
+Usage: MeasureAirquality(..., live_port=8080), then http://<station>:8080/
+"""
+
+import json
+import math
+import threading
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+import metrics
+
+# events kept for clients which reconnect
+EVENT_HISTORY = 100
+# time in seconds after which an idle event stream gets a comment, keeps proxies from closing it
+KEEPALIVE = 15
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Air quality</title>
+<style>body{font-family:sans-serif;font-size:4vh;margin:2vh 4vw}td{padding:.5vh 2vw}
+td.value{text-align:right;font-weight:bold}#time{color:gray;font-size:2.5vh}</style></head>
+<body><table id="values"></table><div id="time"></div><script>
+function show(latest) {
+  let rows = '';
+  for (const [name, entry] of Object.entries(latest.values))
+    rows += `<tr><td>${name}</td><td class="value">${entry.value.toFixed(entry.value < 10 ? 4 : 1)}</td>
+             <td>${entry.unit}</td></tr>`;
+  document.getElementById('values').innerHTML = rows;
+  document.getElementById('time').textContent = new Date(latest.time).toLocaleString();
+}
+fetch('/api/latest').then(response => response.json()).then(show);
+new EventSource('/api/stream').addEventListener('cycle', event => show(JSON.parse(event.data)));
+</script></body></html>
+"""
+
+
+class RingBuffer:
+    """
+    Fixed number of (time, value) pairs, the oldest ones are overwritten. Values
+    of the same second are averaged into one pair, so every sample of the
+    continuous sampling does not shorten the buffered time.
+    """
+
+    def __init__(self, capacity):
+        """
+            ### Constructor ###
+            Parameters: capacity: number of values
+        """
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.count = 0 # values written so far
+        self._merged = 0 # values averaged into the latest pair
+
+
+    def append(self, time_ms, value):
+        """
+            Description: Adds a value, averages it into the latest pair if that is of the same
+                         second; the pair keeps the time of its first value
+        """
+        if self.count:
+            last = (self.count - 1) % len(self.times)
+            if self.times[last] // 1000 == time_ms // 1000:
+                self._merged += 1
+                self.values[last] += (value - self.values[last]) / self._merged
+                return
+        position = self.count % len(self.times)
+        self.times[position] = time_ms
+        self.values[position] = value
+        self.count += 1
+        self._merged = 1
+
+
+    def window(self, since=None):
+        """
+            Description: Buffered values in time order
+            Parameters: since: unix time in ms, default all values
+            Return: tuple (times, values) of new arrays
+        """
+        capacity = len(self.times)
+        if self.count <= capacity:
+            times, values = self.times[:self.count], self.values[:self.count]
+        else:
+            start = self.count % capacity
+            times = np.concatenate((self.times[start:], self.times[:start]))
+            values = np.concatenate((self.values[start:], self.values[:start]))
+        first = 0 if since is None else int(np.searchsorted(times, since, 'left'))
+        return times[first:].copy(), values[first:].copy()
+
+
+    def __len__(self):
+        return min(self.count, len(self.times))
+
+
+def downsample(times, values, points):
+    """
+        Description: Averages time ordered values into at most points buckets of equal length
+        Return: dict with the lists time (mean time of every bucket in ms), value (mean),
+                min and max
+    """
+    if len(times) > points:
+        span = int(times[-1] - times[0]) + 1
+        buckets = (times - times[0]) * points // span
+        starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+        counts = np.diff(np.append(starts, len(times)))
+        return {'time': (np.add.reduceat(times, starts) // counts).tolist(),
+                'value': (np.add.reduceat(values, starts) / counts).tolist(),
+                'min': np.minimum.reduceat(values, starts).tolist(),
+                'max': np.maximum.reduceat(values, starts).tolist()}
+    return {'time': times.tolist(), 'value': values.tolist(),
+            'min': values.tolist(), 'max': values.tolist()}
+
+
+class LiveService:
+    """
+    Recent history of all channels and HTTP server.
+    """
+
+    def __init__(self, units, hours=6, capacity=None):
+        """
+            ### Constructor ###
+            Parameters: units: dict which maps the channel names to their units
+                        hours: time the values are kept
+                        capacity: values per channel, default one per second of hours
+        """
+        self.units = dict(units)
+        self.hours = hours
+        capacity = int(hours * 3600) if capacity is None else capacity
+        self.buffers = {name: RingBuffer(capacity) for name in self.units}
+
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=EVENT_HISTORY) # (sequence number, encoded event)
+        self.sequence = 0
+        self._latest = {} # channel -> (time, value)
+        self._latest_json = self._encode_latest()
+        self.closed = False
+        self.server = None
+        self._thread = None
+
+
+    def load(self, con, channels):
+        """
+            Description: Fills the buffers from the database, once at start
+            Parameters: con: sqlite3 connection
+                        channels: dict which maps the channel names to their channel ids
+        """
+        with self._condition:
+            for name, channel in channels.items():
+                if name not in self.buffers:
+                    continue
+                rows = con.execute("""SELECT time, value FROM measurement
+                                      WHERE channel_id = ? AND time >= (SELECT max(time) FROM
+                                          measurement WHERE channel_id = ?) - ?
+                                      ORDER BY time""",
+                                   (channel, channel, int(self.hours * 3600 * 1000))).fetchall()
+                for time_ms, value in rows[-len(self.buffers[name].times):]:
+                    self.buffers[name].append(time_ms, value)
+                if rows:
+                    self._latest[name] = rows[-1]
+            self._latest_json = self._encode_latest()
+
+
+    def publish(self, rows):
+        """
+            Description: Adds new values and sends them to the event streams
+            Parameters: rows: list of (channel name, unix time in ms, value), values of unknown
+                              channels and None values are ignored
+        """
+        values = {}
+        with self._condition:
+            for name, time_ms, value in rows:
+                if name in self.buffers and value is not None:
+                    self.buffers[name].append(time_ms, value)
+                    self._latest[name] = (time_ms, value)
+                    values[name] = (time_ms, value)
+            if not values:
+                return
+            self._latest_json = self._encode_latest()
+            self.sequence += 1
+            data = json.dumps(self._snapshot(values))
+            self._events.append((self.sequence, f'id: {self.sequence}\nevent: cycle\ndata: {data}\n\n'
+                                 .encode('utf-8')))
+            self._condition.notify_all()
+
+
+    def _snapshot(self, latest):
+        return {'time': max((time_ms for time_ms, _ in latest.values()), default=None),
+                'values': {name: {'time': time_ms, 'value': value, 'unit': self.units[name]}
+                           for name, (time_ms, value) in latest.items()}}
+
+
+    def _encode_latest(self):
+        return json.dumps(self._snapshot(self._latest)).encode('utf-8')
+
+
+    def latest(self) -> bytes:
+        """
+            Description: JSON of the latest value of every channel
+        """
+        return self._latest_json
+
+
+    def channels(self) -> dict:
+        with self._condition:
+            return {name: {'unit': self.units[name], 'values': len(buffer)}
+                    for name, buffer in self.buffers.items()}
+
+
+    def history(self, channel, minutes=60, points=300) -> dict:
+        """
+            Description: Downsampled values of a channel
+            Parameters: channel: channel name
+                        minutes: time before the latest value of the channel
+                        points: maximal number of buckets
+            Return: dict with channel, unit and the lists of downsample()
+            Raises: KeyError for unknown channels, ValueError for minutes which are not finite
+        """
+        buffer = self.buffers[channel]
+        if not math.isfinite(minutes):
+            raise ValueError(f'minutes has to be finite, not {minutes}')
+        with self._condition:
+            latest = self._latest.get(channel)
+            since = None if latest is None else latest[0] - int(minutes * 60 * 1000)
+            times, values = buffer.window(since)
+        return {'channel': channel, 'unit': self.units[channel], **downsample(times, values, points)}
+
+
+    def events_after(self, sequence, timeout=KEEPALIVE):
+        """
+            Description: Waits for events after a sequence number
+            Parameters: sequence: last sequence number the client has
+                        timeout: maximal waiting time in seconds
+            Return: tuple (list of encoded events, new sequence number), no events after the
+                    timeout or close()
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.sequence > sequence or self.closed, timeout)
+            events = [event for number, event in self._events if number > sequence]
+            return events, self.sequence
+
+
+    def start_server(self, port=8080, addr=''):
+        """
+            Description: Serves the live data in a background thread
+            Parameters: port: TCP port
+                        addr: address to bind, default all interfaces for the LAN
+        """
+        self.server = ThreadingHTTPServer((addr, port), LiveRequestHandler)
+        self.server.daemon_threads = True
+        self.server.service = self
+        self._thread = threading.Thread(target=self.server.serve_forever, name='live', daemon=True)
+        self._thread.start()
+
+
+    def close(self):
+        """
+            Description: Ends the event streams and stops the server
+        """
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+        if self.server is not None:
+            # shutdown() waits forever for a serve thread which is not running
+            if self._thread.is_alive():
+                self.server.shutdown()
+            self.server.server_close()
+
+
+class LiveRequestHandler(BaseHTTPRequestHandler):
+    """
+    Routes of LiveService.
+    """
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if url.path == '/':
+            self._send(200, PAGE.encode('utf-8'), 'text/html; charset=utf-8')
+        elif url.path == '/api/latest':
+            self._send(200, service.latest())
+        elif url.path == '/api/channels':
+            self._send(200, json.dumps(service.channels()).encode('utf-8'))
+        elif url.path == '/api/history':
+            try:
+                history = service.history(query['channel'], float(query.get('minutes', 60)),
+                                          max(int(query.get('points', 300)), 1))
+            except KeyError:
+                self._send(404, json.dumps({'error': f"unknown channel {query.get('channel')}"})
+                           .encode('utf-8'))
+                return
+            except ValueError as error_message:
+                self._send(400, json.dumps({'error': str(error_message)}).encode('utf-8'))
+                return
+            self._send(200, json.dumps(history).encode('utf-8'))
+        elif url.path == '/api/stream':
+            self._stream(service)
+        else:
+            self._send(404, json.dumps({'error': 'not found'}).encode('utf-8'))
+
+
+    def _send(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def _stream(self, service):
+        """
+            Description: Event stream until the client disconnects or the service closes
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+
+        try:
+            sequence = int(self.headers.get('Last-Event-ID', service.sequence))
+        except ValueError:
+            sequence = service.sequence
+        if sequence > service.sequence: # the station restarted since
+            sequence = service.sequence
+        metrics.LIVE_CLIENTS.inc()
+        try:
+            while not service.closed:
+                events, sequence = service.events_after(sequence)
+                self.wfile.write(b''.join(events) or b': keepalive\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass # the client is gone
+        finally:
+            metrics.LIVE_CLIENTS.dec()
+
+
+    def log_message(self, format, *args):
+        pass # no line per request on the console of the station
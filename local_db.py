@@ -5,124 +5,389 @@ Author: Daniel Kühbacher
 
 Description: This script reads our sensors and saves the measured values in a
 sqlite database.
+
+Usage: python local_db.py                 measurement cycles
+       python local_db.py --continuous    continuous sampling (continuous.py)
 """
 
+import os
+import sys
 import time
+import signal
 import logging
-import sqlite3
 from datetime import datetime
 
-import RPi.GPIO as GPIO
-from ecsense import EcSensor
-from cozir import CozirSensor
+import metrics
+from station import Station, CONFIG_DIR
+from discovery import IDENTITY_CACHE
+from db_writer import BatchedWriter
+from retention import RetentionManager
+from continuous import ContinuousSampler, ContinuousConverter
+from scheduler import Scheduler
+from pipeline import Pipeline, Source, Stage
+from db_schema import create_schema, channel_id, epoch_ms, INSERT_MEASUREMENT
 
 class MeasureAirquality:
     """
     Air-quality measurement class.
     """
 
-    def __init__(self, db_path):
+    def __init__(self, db_path, flush_rows=60, flush_interval=60,
+                 config=os.path.join(CONFIG_DIR, 'station.json'), ports=None, live_port=None,
+                 identity_cache=IDENTITY_CACHE):
         """
             Description: Constructor
             Parameters: db_path: path to sqlite3 database
+                        flush_rows: number of buffered rows after which they are written
+                        flush_interval: maximal time in seconds rows are buffered
+                        config: station file with fans and sensors (see station.py)
+                        ports: dict which maps sensor names to other serial ports than in the
+                               station file (e.g. simulated ports of simulator.py)
+                        live_port: TCP port of the live data service (live.py), default none
+                        identity_cache: path of the sensor identity cache, None disables it
+                                        (see station.Station)
         """
+        self.closed = False
+
+        # fans, sensors and serial ports
+        self.station = Station(config, ports, identity_cache=identity_cache)
 
-        #set GPIO
-        GPIO.setwarnings(False)
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(27,GPIO.OUT)
-
-        #init sensors and serial ports
-        self.ec_o3 = EcSensor('/dev/ttyS0') #O3 Sensor
-        self.ec_co = EcSensor('/dev/ttyAMA1') #CO Sensor
-        self.ec_no2 = EcSensor('/dev/ttyAMA2') #NO2 Sensor
-        self.cozir_co2 = CozirSensor('/dev/ttyAMA3') #CO2 Sensor
-        
-        # connect to database
-        self.con = sqlite3.connect(db_path)
-        self.cursor = self.con.cursor()
+        # connect to database, rows are buffered and written in batches
+        self.writer = BatchedWriter(db_path, flush_rows=flush_rows, flush_interval=flush_interval)
+        create_schema(self.writer.con)
+
+        # ids of the channels in the measurement table
+        self.channels = {name: channel_id(self.writer.con, *channel)
+                         for name, channel in self.station.channels().items()}
+        # raw values for calibration.reprocess()
+        self.raw_channels = {name: channel_id(self.writer.con, *channel)
+                             for name, channel in self.station.raw_channels().items()}
+        # samples and uncertainty of the sensors with adaptive sampling
+        self.sampling_channels = {name: {quantity: channel_id(self.writer.con, *channel)
+                                         for quantity, channel in channels.items()}
+                                  for name, channels in self.station.sampling_channels().items()}
+        self.writer.con.commit()
         print('Connected to airquality database')
 
+        # deletes old rows in short steps after every cycle, runs in the persistence stage
+        # which owns the connection of the writer
+        self.retention = RetentionManager(self.writer.con, self.station.config['retention'])
+        self.db_size = self.retention.report()
+
+        # recent values over HTTP, filled from the database once
+        self.live = None
+        if live_port is not None:
+            from live import LiveService
+            self.live = LiveService(self._units())
+            self.live.load(self.writer.con, self.channels)
+            self.live.start_server(live_port)
 
-    def measurement_cycle(self, vent_time=2, wait_time=2, iterations=5) -> dict:
+        # stages of measure() and measure_continuous()
+        self.pipeline = None
+        # continuous sampling, see build_continuous_pipeline()
+        self.sampler = None
+        self.converter = None
+        self.phase_channels = {}
+        self.excluded_channels = {}
+        self._next_display = 0.0
+
+
+    def measurement_cycle(self, vent_time=None, wait_time=None, iterations=5, concurrent=True,
+                          aggregate='mean', adaptive=True) -> dict:
         """
-            Description: ventilates measurement channel and reads out sensors
-            Parameters: vent_time: ventilation time
-                        wait_time: wait time after ventilation
+            Description: ventilates measurement channels and reads out sensors
+            Parameters: vent_time: ventilation time, default from the station file
+                        wait_time: wait time after ventilation, default from the station file
                         iterations: number of measurements that are averaged
-            Return: dict which holds the measured gas concentration, temperature and humidity
+                        concurrent: read all sensors in parallel instead of one after another
+                        aggregate: aggregation of the samples (mean, median, trimmed_mean, ...)
+                        adaptive: sensors with a "sampling" entry in the station file take as
+                                  many samples as their tolerance needs instead of iterations
+            Return: dict which holds the measured gas concentration of every sensor, temperature
+                    and humidity and under 'std' the standard deviation of the gas samples
         """
+        return self.station.convert(
+            self.station.acquire(vent_time, wait_time, iterations, concurrent, aggregate, adaptive))
 
-        # ventilate channel
-        GPIO.output(27,True)
-        time.sleep(vent_time)
-        GPIO.output(27,False)
-        time.sleep(wait_time)
 
-        [con_o3, temp_o3, hum_o3] = self.ec_o3.read_bulk(iterations=iterations, delay=0.2)
-        [con_co, temp_co, hum_co] = self.ec_co.read_bulk(iterations=iterations, delay=0.2)
-        [con_no2, temp_no2, hum_no2] = self.ec_no2.read_bulk(iterations=iterations, delay=0.2)
-        [con_filtered, con_unfiltered] = self.cozir_co2.read_bulk(iterations=iterations, delay=0.2)
-        
-        values = {  self.ec_o3.sensor_type:(con_o3/1000), # convert o3 values to ppm
-                    self.ec_no2.sensor_type:con_no2,
-                    self.ec_co.sensor_type:con_co,
-                    self.cozir_co2.sensor_type:con_filtered,
-                    'temperature':(temp_o3 + temp_co + temp_no2)/3,
-                    'humidity':(hum_o3+ hum_no2+ hum_co)/3}
+    def save(self, var, timestamp=None):
+        """
+            Description: hands the values of one cycle to the database writer
+            Parameters: var: dict as returned by measurement_cycle
+                        timestamp: unix time in milliseconds, default now
+        """
+        timestamp = epoch_ms() if timestamp is None else timestamp
 
-        return values
+        for name in self.station.sensors:
+            self.writer.add(INSERT_MEASUREMENT,
+                            (self.channels[name], timestamp, var[name], var['std'][name]))
+            self.writer.add(INSERT_MEASUREMENT,
+                            (self.raw_channels[name], timestamp, var['raw'][name], None))
+            if name in self.sampling_channels:
+                for quantity in ['samples', 'uncertainty']:
+                    self.writer.add(INSERT_MEASUREMENT, (self.sampling_channels[name][quantity],
+                                                         timestamp, var[quantity][name], None))
+        for quantity in ['temperature', 'humidity']:
+            if var[quantity] is not None: # stations without EC sensors
+                self.writer.add(INSERT_MEASUREMENT,
+                                (self.channels[quantity], timestamp, var[quantity], None))
 
 
-    def measure(self, time_between_cycles = 30):
+    def measure(self, time_between_cycles = 30, policy = Scheduler.SKIP):
         """
-            Description: measure gas concentration in a loop and save measured values in database
+            Description: measure gas concentration in a loop and save measured values in database.
+                         Acquisition, conversion, database and display run as separate stages
+                         (pipeline.py), a slow database never delays the next cycle.
+            Parameters: time_between_cycles: period of the cycles in seconds
+                        policy: handling of cycles that start too late, Scheduler.SKIP waits for
+                                the next slot, Scheduler.CATCH_UP starts immediately
         """
         logging.info("Main    : Starting measurements")
 
-        insert_query = """INSERT INTO {} (timestamp, value, unit, temperature, humidity)
-                                                      VALUES(?,?,?,?,?)"""
+        self.build_pipeline(time_between_cycles, policy).run()
+
+        self.writer.flush() # safe buffered data in database
+
+
+    def measure_continuous(self, store = None, display_interval = 10, duration = None):
+        """
+            Description: samples all sensors continuously and saves every sample or the statistics
+                         of every second in the database, the fans run on their own schedule
+                         (continuous.py)
+            Parameters: store: 'seconds' or 'samples', default from the station file
+                        display_interval: time between two console outputs in seconds
+                        duration: measurement time in seconds, default until stopped
+        """
+        logging.info("Main    : Starting continuous measurements")
+
+        pipeline = self.build_continuous_pipeline(store, display_interval, duration)
+        self.sampler.start()
+        try:
+            pipeline.run()
+        finally:
+            self.sampler.stop()
+            self._persist_continuous(self.converter.convert(*self.sampler.collect()))
+            self.writer.flush() # safe buffered data in database
+
+
+    def build_continuous_pipeline(self, store = None, display_interval = 10,
+                                  cycles = None) -> Pipeline:
+        """
+            Description: stages sampler -> conversion -> persistence and display, the sampler
+                         hands over the finished rows once per second. The sampler is started
+                         by measure_continuous().
+            Parameters: store, display_interval: see measure_continuous()
+                        cycles: number of hand-overs, default until stopped
+        """
+        self.sampler = ContinuousSampler(self.station, store)
+        self.converter = ContinuousConverter(self.station)
+        self.phase_channels = {fan: channel_id(self.writer.con, fan, 'phase', 'state')
+                               for fan in self.station.fans}
+        # concentrations taken while the fans ventilate or the air settles
+        self.excluded_channels = {phase: {name: channel_id(self.writer.con, name,
+                                                           f'concentration_{phase}', settings['unit'])
+                                          for name, settings in self.station.config['sensors'].items()}
+                                  for phase in ('ventilation', 'settle')}
+        self.writer.con.commit()
+        self._next_display = time.monotonic() + display_interval
+
+        display = Stage('display', lambda _: self._display_continuous(display_interval), maxsize=1)
+        persistence = Stage('persistence', self._persist_continuous, maxsize=1000,
+                            idle=self._flush_due)
+        stages = [persistence, display]
+        if self.live is not None:
+            stages.append(Stage('live', lambda rows: self.live.publish(
+                [(name, timestamp, value) for kind, name, timestamp, value, _ in rows
+                 if kind == 'value'])))
+        conversion = Stage('conversion', lambda batch: self.converter.convert(*batch),
+                           outputs=stages)
+        source = Source('sampler', self.sampler.collect, 1, outputs=[conversion], cycles=cycles)
+        self.pipeline = Pipeline(source, [conversion] + stages)
+        return self.pipeline
+
+
+    def build_pipeline(self, time_between_cycles, policy = Scheduler.SKIP, cycles = None,
+                       **cycle_parameters) -> Pipeline:
+        """
+            Description: stages acquisition -> conversion -> persistence and display
+            Parameters: time_between_cycles, policy: see measure()
+                        cycles: number of cycles, default until stopped
+                        cycle_parameters: arguments of Station.acquire(), default times of the
+                                          station file and 5 iterations
+        """
+        def acquisition():
+            started_at = time.monotonic()
+            readings = self.station.acquire(**cycle_parameters)
+            metrics.CYCLE_DURATION.observe(time.monotonic() - started_at)
+            # the next cycle overwrites read_timings while this one is processed
+            return readings, epoch_ms(), dict(self.station.read_timings)
+
+        # only the latest values are worth displaying
+        display = Stage('display', self._display, maxsize=1)
+        # about 8 h of cycles at 30 s in case the SD card stalls
+        persistence = Stage('persistence', self._persist, maxsize=1000, idle=self._flush_due)
+        stages = [persistence, display]
+        if self.live is not None:
+            stages.append(Stage('live', self._publish))
+        conversion = Stage('conversion', self._convert, outputs=stages)
+        source = Source('acquisition', acquisition, time_between_cycles,
+                        outputs=[conversion], policy=policy, cycles=cycles)
+        self.pipeline = Pipeline(source, [conversion] + stages)
+        return self.pipeline
+
+
+    def _convert(self, cycle):
+        """
+            Description: conversion and quality check stage, drops implausible cycles
+        """
+        readings, timestamp, read_timings = cycle
+        var = self.station.convert(readings)
+        problems = self.station.check(readings)
+        if problems:
+            metrics.QA_REJECTED.inc()
+            logging.warning(f"Cycle rejected: {', '.join(problems)}")
+            return None
+        return var, timestamp, read_timings
+
+
+    def _persist(self, cycle):
+        """
+            Description: persistence stage
+        """
+        var, timestamp, _ = cycle
+        self.save(var, timestamp)
+        self.retention.step()
+        self.db_size = self.retention.report()
+
+
+    def _flush_due(self):
+        """
+            Description: idle call of the persistence stage, writes the buffered rows once the
+                         flush interval is over, also if no new rows arrive
+        """
+        if self.writer.flush_due():
+            self.writer.flush()
+
+
+    def _publish(self, cycle):
+        """
+            Description: live data stage
+        """
+        var, timestamp, _ = cycle
+        self.live.publish([(name, timestamp, var[name]) for name in self.live.units])
+
+
+    def _persist_continuous(self, rows):
+        """
+            Description: persistence stage of the continuous sampling
+        """
+        channels = {'value': self.channels, 'raw': self.raw_channels, 'phase': self.phase_channels,
+                    **self.excluded_channels}
+        for kind, name, timestamp, value, std in rows:
+            self.writer.add(INSERT_MEASUREMENT, (channels[kind][name], timestamp, value, std))
+        self.retention.step()
+        self.db_size = self.retention.report()
+
+
+    def _units(self):
+        units = {name: self.station.settings(name)['unit'] for name in self.station.sensors}
+        units.update({'temperature': '°C', 'humidity': '%rH'})
+        return units
+
+
+    def _display(self, cycle):
+        """
+            Description: display stage, metrics and console output
+        """
+        var, timestamp, read_timings = cycle
 
-        loop_forever=True
-        while loop_forever:
-            try:
-                execution_started_at = datetime.now().timestamp()
+        for name, (started_at, finished_at) in read_timings.items():
+            metrics.SENSOR_READ_DURATION.labels(name).observe(finished_at - started_at)
+        for name, count in var['samples'].items():
+            metrics.SAMPLES_USED.labels(name).observe(count)
+        units = self._units()
+        for name, unit in units.items():
+            if var[name] is not None:
+                metrics.LATEST_VALUE.labels(name, unit).set(var[name])
 
-                var = self.measurement_cycle(vent_time=5, wait_time=2, iterations=5)
-                timestamp = datetime.now()
+        # make logging message
+        logging.info("New Measurement")
+        for name, (started_at, finished_at) in read_timings.items():
+            logging.info(f"{name} read from {datetime.fromtimestamp(started_at):%H:%M:%S.%f}"
+                         f" to {datetime.fromtimestamp(finished_at):%H:%M:%S.%f}")
+        print("---")
+        for name in self.station.sensors:
+            if name in var['uncertainty']:
+                print(f"| {name:>11} : {var[name]:.4f} ± {var['uncertainty'][name]:.4f} {units[name]}"
+                      f" ({var['samples'][name]} samples)")
+            else:
+                print(f"| {name:>11} : {var[name]:.4f} {units[name]}")
+        if var['temperature'] is not None:
+            print(f"| Temperature : {var['temperature']:.1f} °C")
+            print(f"|   Humidity  : {var['humidity']:.1f} rH")
+        print(f"|   DB buffer : {self.writer.pending} rows pending,"
+              f" last flush {self.writer.last_flush_duration*1000:.1f} ms")
+        print(f"|   DB size   : {(self.db_size['database'] + self.db_size['wal']) / 1e6:.1f} MB,"
+              f" {self.db_size['free'] / 1e6:.1f} MB free")
+        print("---")
+        print(self.pipeline.report())
+        print("---\n")
 
-                for gas in ["NO2", "O3", "CO", "CO2"]:
-                    self.cursor.execute(insert_query.format(gas),
-                                        (timestamp, var[gas], 'ppm',
-                                         var['temperature'], var['humidity']))
+    def _display_continuous(self, interval):
+        """
+            Description: display stage of the continuous sampling, metrics every second and
+                         console output every interval seconds
+        """
+        units = self._units()
+        for name, value in self.converter.latest.items():
+            metrics.LATEST_VALUE.labels(name, units[name]).set(value)
 
-                self.con.commit()  # safe data in database
+        if time.monotonic() < self._next_display:
+            return
+        self._next_display = time.monotonic() + interval
 
-                # make logging message
-                logging.info("New Measurement")
-                print("---")
-                print(f"|      NO2    : {var['NO2']:.4f} ppm")
-                print(f"|      O3     : {var['O3']:.4f} ppm")
-                print(f"|      CO     : {var['CO']:.4f} ppm")
-                print(f"|      CO2    : {var['CO2']} ppm")
-                print(f"| Temperature : {var['temperature']:.1f} °C")
-                print(f"|   Humidity  : {var['humidity']:.1f} rH")
-                print("---\n")
+        rates = self.sampler.rates()
+        print("---")
+        for name in self.station.sensors:
+            if name in self.converter.latest:
+                print(f"| {name:>11} : {self.converter.latest[name]:.4f} {units[name]},"
+                      f" {rates[name]:.1f} samples/s")
+        if 'temperature' in self.converter.latest:
+            print(f"| Temperature : {self.converter.latest['temperature']:.1f} °C")
+            print(f"|   Humidity  : {self.converter.latest['humidity']:.1f} rH")
+        print(f"|   Fans      : {', '.join(f'{fan} {phase}' for fan, phase in self.sampler.phases.items())}")
+        print(f"|   DB buffer : {self.writer.pending} rows pending,"
+              f" last flush {self.writer.last_flush_duration*1000:.1f} ms")
+        print(f"|   DB size   : {(self.db_size['database'] + self.db_size['wal']) / 1e6:.1f} MB,"
+              f" {self.db_size['free'] / 1e6:.1f} MB free")
+        print("---")
+        print(self.pipeline.report())
+        print("---\n")
 
-                execution_ended_at = datetime.now().timestamp()
-                time_to_wait = time_between_cycles - (execution_ended_at - execution_started_at)
-                time_to_wait = 0 if time_to_wait < 0 else time_to_wait
-                time.sleep(time_to_wait)
+    def close(self):
+        """
+            Description: Writes the buffered rows and closes the db connection first, then stops
+                         the live service and cleans up the sensors and GPIOs. Only closes what
+                         the constructor opened, a second call does nothing.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if getattr(self, 'writer', None) is not None:
+            self.writer.close()
+        if getattr(self, 'live', None) is not None:
+            self.live.close()
+            self.live = None
+        if getattr(self, 'station', None) is not None:
+            self.station.close()
 
-            except KeyboardInterrupt:
-                loop_forever = False
 
     def __del__(self):
         """
-            Description: Destructor; close db connection and cleanup GPIOs
+            Description: Destructor; see close()
         """
-        self.con.close()
-        GPIO.cleanup()
+        if not getattr(self, 'closed', True):
+            self.close()
 
 
 if __name__ == "__main__":
@@ -133,12 +398,25 @@ if __name__ == "__main__":
     FORMAT = "%(asctime)s: %(message)s"
     #logging.basicConfig(format=format, level=logging.INFO, datefmt="%H:%M:%S")
 
+    # stop like on Ctrl+C when the service is stopped, so buffered rows are written
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+
+    # Prometheus metrics on http://<station>:8000/metrics
+    metrics.start_server(8000)
+
     ### Start of the measurements
     print('\n\nStart logging...')
 
-    measurement_obj = MeasureAirquality(db_path = 'device_data/airquality.db')
-    measurement_obj.measure(time_between_cycles = 5)
+    # live data for the touchscreen and the LAN on http://<station>:8080/
+    measurement_obj = MeasureAirquality(db_path = 'device_data/airquality.db', live_port = 8080)
+    if '--continuous' in sys.argv[1:]:
+        measurement_obj.measure_continuous()
+    else:
+        # a cycle takes vent_time + wait_time of the station file and about a second of reads
+        measurement_obj.measure(time_between_cycles = 10)
 
-    del measurement_obj
+    measurement_obj.close()
     #### End of Measurements
     print("Program end")
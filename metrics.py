@@ -0,0 +1,112 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Prometheus metrics of the station. The drivers, the database
+writer, the uploader, the measurement loops, the retention manager and the
+collector update these metrics;
+start_server() serves them on http://<station>:<port>/metrics.
+
+prometheus_client takes about 0.1 s to import, so it is only loaded when a
+metric is used for the first time: metrics.CYCLE_DURATION creates the
+histogram on first access. Tools which never measure do not pay for it.
+"""
+
+import threading
+
+# cycles take seconds, single reads and database operations milliseconds
+CYCLE_BUCKETS = (1, 2, 5, 7.5, 10, 15, 20, 30, 45, 60, 120)
+FAST_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+
+# attribute -> (type, metric name, documentation, labels, options)
+_DEFINITIONS = {
+    'CYCLE_DURATION': ('Histogram', 'airquality_cycle_duration_seconds',
+                       'Duration of one measurement cycle', (), {'buckets': CYCLE_BUCKETS}),
+    'SENSOR_READ_DURATION': ('Histogram', 'airquality_sensor_read_duration_seconds',
+                             'Duration of the bulk read of one sensor in a cycle', ('sensor',),
+                             {'buckets': FAST_BUCKETS}),
+    'FRAME_LATENCY': ('Histogram', 'airquality_frame_latency_seconds',
+                      'Time from command to valid answer of an EC sensor', ('sensor',),
+                      {'buckets': FAST_BUCKETS}),
+    'DB_FLUSH_DURATION': ('Histogram', 'airquality_db_flush_duration_seconds',
+                          'Duration of one database flush', (), {'buckets': FAST_BUCKETS}),
+    'UPLOAD_DURATION': ('Histogram', 'airquality_upload_duration_seconds',
+                        'Duration of one upload', ('target',), {'buckets': FAST_BUCKETS}),
+    'STAGE_DURATION': ('Histogram', 'airquality_stage_duration_seconds',
+                       'Processing time of one item in a pipeline stage', ('stage',),
+                       {'buckets': FAST_BUCKETS + CYCLE_BUCKETS[3:]}),
+    'SAMPLES_USED': ('Histogram', 'airquality_samples_used', 'Gas samples of one sensor in a cycle',
+                     ('sensor',), {'buckets': (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)}),
+    'COLLECTOR_COMMIT_DURATION': ('Histogram', 'airquality_collector_commit_duration_seconds',
+                                  'Duration of one group commit of the collector', (),
+                                  {'buckets': FAST_BUCKETS}),
+
+    'READ_RETRIES': ('Counter', 'airquality_read_retries_total',
+                     'Commands sent again because no valid answer arrived', ('sensor',), {}),
+    'CORRUPT_FRAMES': ('Counter', 'airquality_corrupt_frames_total',
+                       'Frames or lines with wrong checksum or format', ('sensor',), {}),
+    'SHORT_FRAMES': ('Counter', 'airquality_short_frames_total',
+                     'Reads which timed out before a complete frame arrived', ('sensor',), {}),
+    'UPLOAD_FAILURES': ('Counter', 'airquality_upload_failures_total', 'Failed uploads',
+                        ('target',), {}),
+    'STAGE_ITEMS': ('Counter', 'airquality_stage_items_total',
+                    'Items processed by a pipeline stage', ('stage',), {}),
+    'STAGE_DROPPED': ('Counter', 'airquality_stage_dropped_total',
+                      'Items dropped because the queue of a pipeline stage was full', ('stage',), {}),
+    'QA_REJECTED': ('Counter', 'airquality_qa_rejected_total',
+                    'Cycles rejected by the quality check', (), {}),
+    'MISSED_DEADLINES': ('Counter', 'airquality_missed_deadlines_total',
+                         'Cycles which took longer than the time between cycles', (), {}),
+    'COLLECTOR_ROWS': ('Counter', 'airquality_collector_rows_total',
+                       'Rows stored by the collector', ('station',), {}),
+    'PRUNED_ROWS': ('Counter', 'airquality_pruned_rows_total',
+                    'Rows deleted by the retention rules', ('resolution',), {}),
+    'WRITTEN_BYTES': ('Counter', 'airquality_written_bytes_total',
+                      'Bytes written to the storage by the process', (), {}),
+
+    'LATEST_VALUE': ('Gauge', 'airquality_latest_value', 'Latest value of a channel',
+                     ('channel', 'unit'), {}),
+    'DB_PENDING_ROWS': ('Gauge', 'airquality_db_pending_rows',
+                        'Rows buffered by the database writer', (), {}),
+    'DB_SIZE': ('Gauge', 'airquality_db_size_bytes',
+                'Size of the database file, its write-ahead log and its free pages', ('file',), {}),
+    'LIVE_CLIENTS': ('Gauge', 'airquality_live_clients',
+                     'Clients connected to the event stream of the live service', (), {}),
+    'SPOOL_DEPTH': ('Gauge', 'airquality_upload_spool_depth', 'Rows waiting for upload', (), {}),
+    'SPOOL_PARKED': ('Gauge', 'airquality_upload_spool_parked',
+                     'Rows taken out of the upload queue, e.g. after too many failed attempts',
+                     (), {}),
+    'STAGE_QUEUE_DEPTH': ('Gauge', 'airquality_stage_queue_depth',
+                          'Items waiting in the queue of a pipeline stage', ('stage',), {}),
+}
+
+_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """
+        Description: Creates a metric of _DEFINITIONS on first access
+    """
+    if name not in _DEFINITIONS:
+        raise AttributeError(f"module {__name__} has no attribute {name}")
+
+    with _lock:
+        if name not in globals(): # another thread may have created it meanwhile
+            import prometheus_client
+            kind, metric, documentation, labels, options = _DEFINITIONS[name]
+            globals()[name] = getattr(prometheus_client, kind)(metric, documentation,
+                                                               list(labels), **options)
+    return globals()[name]
+
+
+def start_server(port=8000, addr=''):
+    """
+        Description: Serves the metrics in a background thread
+        Parameters: port: TCP port
+                    addr: address to bind, default all interfaces so Prometheus can scrape
+                          the station from the network
+        Return: None
+    """
+    from prometheus_client import start_http_server
+
+    start_http_server(port, addr)
@@ -0,0 +1,274 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Producer/consumer pipeline for the measurement scripts. Every stage
+runs in its own thread and takes its input from a bounded queue:
+
+    acquisition -> conversion -> persistence
+                              -> upload
+                              -> display
+
+The acquisition is driven by a Scheduler and never waits for a later stage.
+A stage whose queue is full handles the new item according to its policy, so a
+slow stage (usually the upload) only fills its own queue. Every stage counts
+processed, dropped and failed items and its busy time, report() prints the
+throughput of all stages.
+"""
+
+import time
+import queue
+import logging
+import threading
+
+import metrics
+from scheduler import Scheduler
+
+_STOP = object() # end of the stream, passed on to all outputs
+
+
+class Stage(threading.Thread):
+    """
+    Worker which applies a function to every item of its queue.
+    """
+    # policies if the queue is full
+    BLOCK = 'block' # the producer waits, only for stages which are always fast
+    DROP_OLDEST = 'drop_oldest' # the oldest queued item is discarded
+    DROP_NEWEST = 'drop_newest' # the new item is discarded
+
+    def __init__(self, name, function, outputs=(), maxsize=100, policy=DROP_OLDEST, idle=None,
+                 idle_interval=1):
+        """
+            ### Constructor ###
+            Parameters: name: name of the stage in logs, reports and metrics
+                        function: called with every item, the return value is passed to
+                                  all outputs, None passes nothing on
+                        outputs: following stages
+                        maxsize: capacity of the queue
+                        policy: BLOCK, DROP_OLDEST or DROP_NEWEST
+                        idle: called without arguments in the thread of the stage every
+                              idle_interval seconds without items, e.g. to write buffered rows
+                        idle_interval: time in seconds
+        """
+        if policy not in (self.BLOCK, self.DROP_OLDEST, self.DROP_NEWEST):
+            raise ValueError(f'Unknown policy {policy}')
+        super().__init__(name=name, daemon=True)
+        self.function = function
+        self.outputs = list(outputs)
+        self.policy = policy
+        self.idle = idle
+        self.idle_interval = idle_interval
+        self.inbox = queue.Queue(maxsize)
+
+        # statistics
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.busy = 0.0 # time spent in function
+        self.started_at = None
+
+
+    def put(self, item):
+        """
+            Description: Hands an item to the stage, applies the policy if the queue is full
+        """
+        if self.policy == self.BLOCK:
+            self.inbox.put(item)
+        else:
+            self._put_nowait(item)
+        metrics.STAGE_QUEUE_DEPTH.labels(self.name).set(self.inbox.qsize())
+
+
+    def _put_nowait(self, item):
+        while True:
+            try:
+                self.inbox.put_nowait(item)
+                return
+            except queue.Full:
+                if self.policy == self.DROP_NEWEST:
+                    self._drop()
+                    return
+            try:
+                self.inbox.get_nowait()
+                self._drop()
+            except queue.Empty:
+                pass # the stage took an item in the meantime
+
+
+    def _drop(self):
+        self.dropped += 1
+        metrics.STAGE_DROPPED.labels(self.name).inc()
+        logging.warning(f'Queue of stage {self.name} is full, item dropped')
+
+
+    def _apply(self, item):
+        """
+            Description: Calls the function with timing and error handling and passes the
+                         result on
+        """
+        started_at = time.perf_counter()
+        try:
+            result = self.function(item)
+        except Exception:
+            self.failed += 1
+            logging.exception(f'Stage {self.name} failed')
+            return
+        finally:
+            duration = time.perf_counter() - started_at
+            self.busy += duration
+            metrics.STAGE_DURATION.labels(self.name).observe(duration)
+
+        self.processed += 1
+        metrics.STAGE_ITEMS.labels(self.name).inc()
+        if result is not None:
+            for output in self.outputs:
+                output.put(result)
+
+
+    def run(self):
+        self.started_at = time.monotonic()
+        while True:
+            try:
+                item = self.inbox.get(timeout=None if self.idle is None else self.idle_interval)
+            except queue.Empty:
+                try:
+                    self.idle()
+                except Exception:
+                    logging.exception(f'Idle call of stage {self.name} failed')
+                continue
+            metrics.STAGE_QUEUE_DEPTH.labels(self.name).set(self.inbox.qsize())
+            if item is _STOP:
+                break
+            self._apply(item)
+
+        # the stop marker is never dropped
+        for output in self.outputs:
+            output.inbox.put(_STOP)
+
+
+    def stats(self) -> dict:
+        """
+            Description: Throughput of the stage
+            Return: dict with processed, dropped and failed items, queue length, items per
+                    second and the fraction of the time the stage was busy
+        """
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        return {'processed': self.processed,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'queued': self.inbox.qsize() if self.inbox is not None else 0,
+                'rate': self.processed / elapsed if elapsed else 0.0,
+                'utilisation': self.busy / elapsed if elapsed else 0.0}
+
+
+class Source(Stage):
+    """
+    First stage, produces an item in every slot of a Scheduler.
+    """
+
+    def __init__(self, name, function, period, outputs=(), policy=Scheduler.SKIP, cycles=None):
+        """
+            ### Constructor ###
+            Parameters: name: name of the stage
+                        function: called without arguments in every slot, the return value
+                                  is passed to all outputs
+                        period: time between two items in seconds
+                        outputs: following stages
+                        policy: Scheduler.SKIP or Scheduler.CATCH_UP
+                        cycles: number of items, default until stop()
+        """
+        super().__init__(name, lambda _: function(), outputs)
+        self.inbox = None
+        self.cycles = cycles
+        self._stop_event = threading.Event()
+        # stop() interrupts the sleep between the slots
+        self.scheduler = Scheduler(period, policy, sleep=self._stop_event.wait)
+
+
+    def put(self, item):
+        raise TypeError('A source has no input')
+
+
+    def run(self):
+        self.started_at = time.monotonic()
+        cycle = 0
+        while self.cycles is None or cycle < self.cycles:
+            self.scheduler.wait()
+            if self._stop_event.is_set():
+                break
+            self._apply(None)
+            cycle += 1
+
+        for output in self.outputs:
+            output.inbox.put(_STOP)
+
+
+    def stop(self):
+        """
+            Description: Stops after the running cycle
+        """
+        self._stop_event.set()
+
+
+class Pipeline:
+    """
+    Source and stages which are started and stopped together.
+    """
+
+    def __init__(self, source, stages):
+        """
+            ### Constructor ###
+            Parameters: source: Source
+                        stages: all other stages, every stage has exactly one producer
+        """
+        self.source = source
+        self.stages = [source] + list(stages)
+
+
+    def start(self):
+        for stage in reversed(self.stages):
+            stage.start()
+
+
+    def stop(self):
+        """
+            Description: Stops the source, the other stages process their queues and end
+        """
+        self.source.stop()
+        for stage in self.stages:
+            stage.join()
+
+
+    def run(self):
+        """
+            Description: Starts the pipeline and blocks until the source ends or Ctrl+C
+            Return: None, returns after all queued items are processed
+        """
+        self.start()
+        try:
+            while self.source.is_alive():
+                self.source.join(0.5) # short timeouts keep Ctrl+C working
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+    def stats(self) -> dict:
+        """
+            Description: Statistics of all stages
+            Return: dict which maps the stage name to Stage.stats()
+        """
+        return {stage.name: stage.stats() for stage in self.stages}
+
+
+    def report(self) -> str:
+        """
+            Description: One line per stage with items per minute, utilisation and queue
+        """
+        lines = []
+        for name, stats in self.stats().items():
+            lines.append(f"{name:>12}: {stats['rate']*60:6.1f}/min, busy {stats['utilisation']:4.0%},"
+                         f" queued {stats['queued']}, dropped {stats['dropped']},"
+                         f" failed {stats['failed']}")
+        return '\n'.join(lines)
@@ -0,0 +1,297 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Retention of the local database. Every resolution is kept for a
+number of days, the raw values ('raw') for example 30 days, the 1 min rollups
+a year and the hourly rollups forever (DEFAULT_RULES, changed by the
+"retention" entry of the station file). Old rows are deleted day by day (UTC):
+
+    raw values: a day is only deleted after the rollups which still keep it
+                hold all its values; rollups which miss values are recalculated
+                first (db_schema.rebuild_rollups)
+    rollups:    a day of a rollup table is deleted when it is older than its rule
+
+The free pages are returned to the file system with PRAGMA incremental_vacuum.
+step() does this work in slices of a few milliseconds, so it runs between the
+cycles without delaying the measurements, and waits an hour once nothing is
+left. A database has to use auto_vacuum=INCREMENTAL to shrink; db_schema.create_schema
+sets it for new files, which only takes effect before the first table is
+created. Older files still get their rows deleted, but keep their size until
+they are converted once with 'python retention.py --db <database> convert'
+while the station is stopped: a full VACUUM rewrites the whole file and needs
+as much free space as the file takes.
+
+Usage: python retention.py --db <database> report     size and horizons
+       python retention.py --db <database> prune      applies the rules completely
+       python retention.py --db <database> convert    enables incremental vacuum
+"""
+
+import os
+import time
+import logging
+
+import metrics
+from db_schema import RESOLUTIONS, ROLLUP_CHANNELS, epoch_ms, rebuild_rollups
+
+DAY_MS = 86400 * 1000
+
+# resolution -> days the rows are kept, None forever
+DEFAULT_RULES = {'raw': 30, '1min': 365, '5min': 730, '1h': None, '1d': None}
+
+# pages returned to the file system by one incremental vacuum (4 KiB each)
+VACUUM_PAGES = 64
+
+
+def check_rules(rules) -> dict:
+    """
+        Description: Checks retention rules and fills in the defaults
+        Parameters: rules: dict which maps 'raw' or a resolution of db_schema.RESOLUTIONS to
+                           the number of days its rows are kept, None forever
+        Return: complete dict of rules
+        Raises: ValueError for unknown resolutions or periods shorter than a day
+    """
+    unknown = set(rules) - set(DEFAULT_RULES)
+    if unknown:
+        raise ValueError(f"Retention: unknown resolutions {', '.join(sorted(unknown))}, "
+                         f"known are {', '.join(DEFAULT_RULES)}")
+    rules = {**DEFAULT_RULES, **rules}
+    for resolution, days in rules.items():
+        if days is not None and days < 1:
+            raise ValueError(f'Retention: {resolution} has to be kept at least one day')
+    return rules
+
+
+def written_bytes():
+    """
+        Description: Bytes the process has written to the storage so far (Linux)
+        Return: int or None if unknown
+    """
+    try:
+        with open('/proc/self/io', encoding='ascii') as file:
+            for line in file:
+                if line.startswith('write_bytes:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class RetentionManager:
+    """
+    Deletes old rows of the local database and shrinks the file in small steps.
+    """
+
+    def __init__(self, con, rules=None, step_duration=0.05, idle_interval=3600):
+        """
+            ### Constructor ###
+            Parameters: con: sqlite3 connection of the database (db_schema.create_schema),
+                             only used from the thread which calls step()
+                        rules: retention rules, see check_rules()
+                        step_duration: time in seconds one step() may take
+                        idle_interval: time in seconds without checks once everything is done
+        """
+        self.con = con
+        self.rules = check_rules(rules or {})
+        self.step_duration = step_duration
+        self.idle_interval = idle_interval
+        self.path = con.execute('PRAGMA database_list').fetchone()[2]
+
+        self.incremental = con.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        if not self.incremental:
+            # a VACUUM would block the measurements for the time it takes to rewrite the file
+            logging.warning(f'{self.path} was created without incremental vacuum, the file does '
+                            f"not shrink; run 'python retention.py --db {self.path} convert' once "
+                            'while the station is stopped')
+
+        # resolution -> (table, time column)
+        self.tables = {'raw': ('measurement', 'time'),
+                       **{name: (f'rollup_{name}', 'bucket') for name in RESOLUTIONS}}
+        self._idle_until = 0.0
+
+        # statistics
+        self.pruned = {resolution: 0 for resolution in self.tables}
+        self.rebuilt_days = 0
+        self.vacuumed_pages = 0
+        self._written_at = self._written_reported = written_bytes()
+
+
+    def convert(self):
+        """
+            Description: Enables incremental vacuum for a database created without it, the
+                         VACUUM rewrites the whole file once and blocks all writers meanwhile
+        """
+        started_at = time.monotonic()
+        self.con.commit() # VACUUM fails within a transaction
+        self.con.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        self.con.execute('VACUUM')
+        self.incremental = self.con.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        logging.info(f'{self.path} converted in {time.monotonic() - started_at:.1f} s')
+
+
+    def step(self, duration=None, now=None) -> bool:
+        """
+            Description: Deletes old days and returns free pages until the time is up
+            Parameters: duration: time in seconds, default step_duration
+                        now: unix time in ms the rules refer to, default now
+            Return: True if work is left for the next step
+        """
+        if time.monotonic() < self._idle_until:
+            return False
+        deadline = time.perf_counter() + (self.step_duration if duration is None else duration)
+        now = epoch_ms() if now is None else now
+
+        days = self._pending(now)
+        while days and time.perf_counter() < deadline:
+            self._prune(*days.pop(), now)
+            if not days:
+                days = self._pending(now)
+
+        free = self._free_pages()
+        while free and time.perf_counter() < deadline:
+            self.con.execute(f'PRAGMA incremental_vacuum({VACUUM_PAGES})').fetchall()
+            self.vacuumed_pages += free - self._free_pages()
+            free = self._free_pages()
+
+        if days or free:
+            return True
+        self._idle_until = time.monotonic() + self.idle_interval
+        return False
+
+
+    def _pending(self, now) -> list:
+        """
+            Description: Oldest day of every resolution which is older than its rule
+            Return: list of (resolution, day start in ms, ids of the channels with rows that day)
+        """
+        channels = [row[0] for row in self.con.execute('SELECT id FROM channel')]
+        days = []
+        for resolution, keep in self.rules.items():
+            if keep is None:
+                continue
+            table, column = self.tables[resolution]
+            cutoff = (now - keep * DAY_MS) // DAY_MS * DAY_MS
+            # one lookup in the primary key (channel_id, time) per channel
+            oldest = {channel: self.con.execute(
+                          f'SELECT min({column}) FROM {table} WHERE channel_id = ?', (channel,)
+                      ).fetchone()[0] for channel in channels}
+            oldest = {channel: first for channel, first in oldest.items() if first is not None}
+            if oldest and min(oldest.values()) < cutoff:
+                day = min(oldest.values()) // DAY_MS * DAY_MS
+                days.append((resolution, day,
+                             [channel for channel, first in oldest.items() if first < day + DAY_MS]))
+        return days
+
+
+    def _prune(self, resolution, day, channels, now):
+        """
+            Description: Deletes one day of a resolution
+        """
+        table, column = self.tables[resolution]
+        end = day + DAY_MS
+        if resolution == 'raw':
+            rolled_up = {row[0] for row in self.con.execute(ROLLUP_CHANNELS)}
+            for channel in set(channels) & rolled_up:
+                self._confirm_rollups(channel, day, end, now)
+
+        with self.con:
+            self.con.execute("""INSERT INTO retention (resolution, horizon) VALUES (?,?)
+                                ON CONFLICT (resolution) DO UPDATE SET
+                                    horizon = max(horizon, excluded.horizon)""", (resolution, end))
+        for channel in channels:
+            with self.con:
+                deleted = self.con.execute(
+                    f'DELETE FROM {table} WHERE channel_id = ? AND {column} >= ? AND {column} < ?',
+                    (channel, day, end)).rowcount
+            self.pruned[resolution] += deleted
+            metrics.PRUNED_ROWS.labels(resolution).inc(deleted)
+
+
+    def _confirm_rollups(self, channel, start, end, now):
+        """
+            Description: Makes sure the rollups which still keep a day hold all raw values of
+                         a channel with rollups in it
+        """
+        count = self.con.execute("""SELECT count(*) FROM measurement
+                                    WHERE channel_id = ? AND time >= ? AND time < ?""",
+                                 (channel, start, end)).fetchone()[0]
+        for name in RESOLUTIONS:
+            keep = self.rules[name]
+            if keep is not None and start < now - keep * DAY_MS:
+                continue # the rollups of the day are deleted as well
+            # more values than raw rows are counted if raw rows of the day were deleted before
+            stored = self.con.execute(f"""SELECT ifnull(sum(count), 0) FROM rollup_{name}
+                                          WHERE channel_id = ? AND bucket >= ? AND bucket < ?""",
+                                      (channel, start, end)).fetchone()[0]
+            if stored < count:
+                logging.warning(f'Rollups of channel {channel} miss values on '
+                                f'{time.strftime("%Y-%m-%d", time.gmtime(start / 1000))}, '
+                                f'recalculating them before the raw values are deleted')
+                rebuild_rollups(self.con, [channel], start, end - 1)
+                self.rebuilt_days += 1
+                return
+
+
+    def _free_pages(self) -> int:
+        if not self.incremental:
+            return 0
+        return self.con.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+    def report(self) -> dict:
+        """
+            Description: Size of the database and write volume, also exported as metrics
+            Return: dict with the size of the file, its write-ahead log and its free pages in
+                    bytes, the bytes written by the process since the start (None if unknown),
+                    the deleted rows per resolution and the retention horizons
+        """
+        page_size = self.con.execute('PRAGMA page_size').fetchone()[0]
+        sizes = {'database': os.path.getsize(self.path),
+                 'wal': os.path.getsize(self.path + '-wal') if os.path.exists(self.path + '-wal') else 0,
+                 'free': self.con.execute('PRAGMA freelist_count').fetchone()[0] * page_size}
+        for file, size in sizes.items():
+            metrics.DB_SIZE.labels(file).set(size)
+
+        written = written_bytes()
+        if written is not None and self._written_at is not None:
+            metrics.WRITTEN_BYTES.inc(written - self._written_reported)
+            self._written_reported = written
+
+        return {**sizes,
+                'written': None if written is None or self._written_at is None
+                           else written - self._written_at,
+                'pruned': dict(self.pruned),
+                'horizons': dict(self.con.execute('SELECT resolution, horizon FROM retention'))}
+
+
+if __name__ == "__main__":
+
+    import sqlite3
+    import argparse
+    from datetime import datetime, timezone
+
+    parser = argparse.ArgumentParser(description='Retention of the local database.')
+    parser.add_argument('--db', default='device_data/airquality.db')
+    parser.add_argument('command', choices=['report', 'prune', 'convert'])
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.db)
+    manager = RetentionManager(connection, idle_interval=0)
+    if args.command == 'convert':
+        if not manager.incremental:
+            manager.convert()
+        print(f'{args.db} uses incremental vacuum')
+    else:
+        if args.command == 'prune':
+            while manager.step(duration=1):
+                pass
+        result = manager.report()
+        print(f"database {result['database'] / 1e6:.1f} MB, write-ahead log {result['wal'] / 1e6:.1f} MB, "
+              f"free {result['free'] / 1e6:.1f} MB")
+        for resolution, horizon in result['horizons'].items():
+            print(f'{resolution}: deleted before '
+                  f'{datetime.fromtimestamp(horizon / 1000, timezone.utc):%Y-%m-%d}')
+        if args.command == 'prune':
+            print(f"{sum(result['pruned'].values())} rows deleted, "
+                  f"{manager.vacuumed_pages} pages returned")
+    connection.close()
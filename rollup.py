@@ -0,0 +1,108 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Queries of averaged time series. The requests are answered from the
+coarsest rollup table (see db_schema.RESOLUTIONS) that fits the requested step,
+so a plot over months reads a few hundred rows instead of every measurement.
+Channels without rollups (db_schema.ROLLUP_QUANTITIES) are averaged from the
+measurement table.
+
+Usage: python rollup.py <path to airquality.db> rebuild
+"""
+
+import math
+import sys
+import sqlite3
+
+from aggregation import RunningStats
+from db_schema import RESOLUTIONS, ROLLUP_CHANNELS, create_schema, rebuild_rollups
+
+
+def choose_resolution(step=None, start=None, end=None, max_points=None):
+    """
+        Description: Selects the rollup table for a request
+        Parameters: step: requested bucket length in seconds
+                    start, end, max_points: alternatively, the time range in ms and the
+                                            maximal number of returned buckets
+        Return: tuple (resolution name or None for the raw table, bucket length in seconds)
+    """
+    if step is None:
+        if max_points is None:
+            return None, 0
+        step = (end - start) / 1000 / max_points
+        # finest resolution which does not exceed max_points
+        for name, seconds in RESOLUTIONS.items():
+            if seconds >= step:
+                return name, seconds
+        name = list(RESOLUTIONS)[-1]
+        return name, math.ceil(step / RESOLUTIONS[name]) * RESOLUTIONS[name]
+
+    # coarsest resolution whose buckets add up exactly to the step
+    chosen = None
+    for name, seconds in RESOLUTIONS.items():
+        if seconds <= step and step % seconds == 0:
+            chosen = name
+    return chosen, step
+
+
+def query(con, channel_id, start, end, step=None, max_points=None):
+    """
+        Description: Averaged values of one channel
+        Parameters: con: sqlite3 connection
+                    channel_id: id of the channel
+                    start, end: time range as unix time in milliseconds (end exclusive), start
+                                is rounded down to a multiple of the step
+                    step: bucket length in seconds, None returns the raw values
+                    max_points: alternative to step, maximal number of buckets
+        Return: list of tuples (bucket start in ms, count, mean, std, min, max), std is the
+                population standard deviation of the values in the bucket
+    """
+    resolution, step = choose_resolution(step, start, end, max_points)
+    step_ms = int(step * 1000)
+    if resolution is not None and con.execute(f'SELECT 1 FROM ({ROLLUP_CHANNELS}) WHERE id = ?',
+                                              (channel_id,)).fetchone() is None:
+        resolution = None # channels without rollups, e.g. raw values, are averaged here
+    if step_ms:
+        # whole buckets only
+        start = start // step_ms * step_ms
+
+    if resolution is None and step_ms == 0:
+        rows = con.execute("""SELECT time, value FROM measurement
+                              WHERE channel_id = ? AND time >= ? AND time < ? ORDER BY time""",
+                           (channel_id, start, end))
+        return [(time, 1, value, 0.0, value, value) for time, value in rows]
+
+    buckets = {} # bucket start -> RunningStats
+    if resolution is None:
+        # step finer than the finest rollup or not a multiple of it
+        rows = con.execute(f"""SELECT time / {step_ms} * {step_ms}, value FROM measurement
+                               WHERE channel_id = ? AND time >= ? AND time < ? ORDER BY time""",
+                           (channel_id, start, end))
+        for time, value in rows:
+            if time not in buckets:
+                buckets[time] = RunningStats.from_moments()
+            buckets[time].add(value)
+    else:
+        rows = con.execute(f"""SELECT bucket / {step_ms} * {step_ms}, count, mean, m2, min, max
+                               FROM rollup_{resolution} WHERE channel_id = ? AND bucket >= ? AND bucket < ?
+                               ORDER BY bucket""", (channel_id, start, end))
+        for time, *moments in rows:
+            if time not in buckets:
+                buckets[time] = RunningStats.from_moments()
+            buckets[time].merge(RunningStats.from_moments(*moments))
+
+    return [(time, stats.count, stats.mean, math.sqrt(stats.m2 / stats.count), stats.min, stats.max)
+            for time, stats in buckets.items()]
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) == 3 and sys.argv[2] == 'rebuild':
+        connection = sqlite3.connect(sys.argv[1])
+        create_schema(connection)
+        rebuild_rollups(connection)
+        connection.close()
+        print('Rollup tables rebuilt')
+    else:
+        print(__doc__)
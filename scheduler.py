@@ -0,0 +1,74 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Cycle scheduling of the measurement loops. The slots lie on a fixed
+grid of time.monotonic(), so NTP corrections or a changed system time do not
+disturb the cadence and a slow cycle does not shift all later ones.
+"""
+
+import math
+import time
+
+import metrics
+
+
+class Scheduler:
+    """
+    Fixed rate schedule on the monotonic clock.
+    """
+    # policies for slots which are already over when the cycle is due
+    SKIP = 'skip' # drop the missed slots and wait for the next one on the grid
+    CATCH_UP = 'catch_up' # run the missed slots back to back until the schedule is reached
+
+    def __init__(self, period, policy=SKIP, clock=time.monotonic, sleep=time.sleep):
+        """
+            ### Constructor ###
+            Parameters: period: time between the start of two cycles in seconds
+                        policy: Scheduler.SKIP or Scheduler.CATCH_UP
+                        clock, sleep: time source, replaceable for simulations
+        """
+        if policy not in (self.SKIP, self.CATCH_UP):
+            raise ValueError(f'Unknown policy {policy}')
+        self.period = period
+        self.policy = policy
+        self._clock = clock
+        self._sleep = sleep
+        self._slot = None # start of the current slot
+
+        # statistics
+        self.cycles = 0
+        self.late = 0 # cycles which started after their slot
+        self.skipped = 0 # slots which were dropped
+
+
+    def wait(self):
+        """
+            Description: Sleeps until the next slot, the first call returns immediately
+            Return: delay of the cycle start behind its slot in seconds, 0 if on time
+        """
+        now = self._clock()
+        self.cycles += 1
+        if self._slot is None:
+            self._slot = now
+            return 0.0
+
+        due = self._slot + self.period
+        if now <= due:
+            self._sleep(due - now)
+            self._slot = due
+            return 0.0
+
+        self.late += 1
+        metrics.MISSED_DEADLINES.inc()
+        if self.policy == self.CATCH_UP:
+            self._slot = due
+            return now - due
+
+        # next slot of the grid which is not over yet
+        missed = math.ceil((now - due) / self.period)
+        self.skipped += missed
+        self._slot = due + missed * self.period
+        self._sleep(max(self._slot - self._clock(), 0))
+        return 0.0
+
@@ -0,0 +1,346 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Simulation of the station hardware on a normal Linux machine.
+Every simulated sensor creates a pseudo terminal (pty) and speaks the serial
+protocol of the real sensor on it, so the unchanged drivers can open the pty
+path instead of /dev/ttyS0 etc.:
+
+- TB600B EC sensors (NO2, O3, CO): answer command 0xD1 (sensor information)
+  and command 6 (0xFF 0x01 0x87 ..., 13 byte frame with checksum)
+- Cozir LP3: streams lines ' Z 00412 z 00410\\r\\n' with a fixed period
+
+The concentration follows a configurable waveform; answer latency, jitter and
+byte corruption can be set per sensor. FakeGPIO replaces RPi.GPIO for the fan.
+
+Usage: python simulator.py  (prints the pty paths and runs until Ctrl+C)
+"""
+
+import os
+import sys
+import tty
+import math
+import time
+import types
+import random
+import select
+import threading
+
+import gpio
+
+
+def constant(value):
+    """
+        Description: Waveform with a constant concentration
+    """
+    return lambda t: value
+
+
+def sine(mean, amplitude, period=60):
+    """
+        Description: Waveform which oscillates around mean
+        Parameters: mean, amplitude: concentration in sensor units
+                    period: period in seconds
+    """
+    return lambda t: mean + amplitude * math.sin(2 * math.pi * t / period)
+
+
+def noisy(waveform, sigma, seed=None):
+    """
+        Description: Adds gaussian noise to a waveform
+    """
+    rng = random.Random(seed)
+    return lambda t: waveform(t) + rng.gauss(0, sigma)
+
+
+class SimulatedDevice:
+    """
+    Base class: pty pair and a thread which serves the master side.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, corruption=0.0, seed=None):
+        """
+            ### Constructor ###
+            Parameters: latency: answer delay in seconds
+                        jitter: additional random delay up to jitter seconds
+                        corruption: probability that a sent frame or line is corrupted
+                        seed: seed of the random generator
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.corruption = corruption
+        self.rng = random.Random(seed)
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.started_at = time.monotonic()
+        self.sent_frames = 0
+        self.corrupted_frames = 0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self.run, name=f'sim {self.port}', daemon=True)
+
+
+    def start(self):
+        """
+            Description: Starts serving the pty
+        """
+        self._thread.start()
+        return self
+
+
+    def stop(self):
+        """
+            Description: Stops the thread and closes the pty
+        """
+        self._stop_event.set()
+        self._thread.join(2)
+        os.close(self.master)
+        os.close(self.slave)
+
+
+    def elapsed(self):
+        """
+            Description: Seconds since the device was created, input of the waveforms
+        """
+        return time.monotonic() - self.started_at
+
+
+    def send(self, data):
+        """
+            Description: Writes data after latency and jitter, corrupts it with the
+                         configured probability (flipped byte or dropped byte)
+        """
+        delay = self.latency + self.rng.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        data = bytearray(data)
+        if data and self.rng.random() < self.corruption:
+            index = self.rng.randrange(len(data))
+            if self.rng.random() < 0.5:
+                data[index] ^= 1 << self.rng.randrange(8)
+            else:
+                del data[index]
+            self.corrupted_frames += 1
+
+        self.sent_frames += 1
+        os.write(self.master, bytes(data))
+
+
+    def receive(self, timeout):
+        """
+            Description: Bytes written by the driver, empty if nothing arrived within timeout
+        """
+        readable, _, _ = select.select([self.master], [], [], timeout)
+        return os.read(self.master, 1024) if readable else b''
+
+
+    def run(self):
+        raise NotImplementedError
+
+
+class SimulatedEcSensor(SimulatedDevice):
+    """
+    TB600B EC sensor in question and answer mode.
+    """
+
+    # sensor type code, max range, unit code, decimal places
+    properties = {'NO2': (0x21, 5, 0x02, 3),
+                  'O3': (0x23, 5000, 0x04, 0),
+                  'CO': (0x19, 10, 0x02, 2)}
+
+    def __init__(self, gas='NO2', waveform=None, temperature=None, humidity=None, **kwargs):
+        """
+            ### Constructor ###
+            Parameters: gas: NO2, O3 or CO
+                        waveform: function of the elapsed time which returns the
+                                  concentration in the unit of the sensor
+                        temperature, humidity: waveforms of temperature (°C) and humidity (%rH)
+                        kwargs: latency, jitter, corruption, seed of SimulatedDevice
+        """
+        super().__init__(**kwargs)
+        self.gas = gas
+        self.type_code, self.max_value, self.unit_code, self.decimal = self.properties[gas]
+        self.waveform = waveform or constant(self.max_value / 100)
+        self.temperature = temperature or constant(22.5)
+        self.humidity = humidity or constant(45.0)
+
+
+    @staticmethod
+    def checksum(data):
+        return (~sum(data) + 1) & 0xFF
+
+
+    def info(self):
+        """
+            Description: Answer to command 0xD1
+        """
+        data = bytes([self.type_code, self.max_value >> 8, self.max_value & 0xFF,
+                      self.unit_code, 0, 0, 0, self.decimal << 4])
+        return data + bytes([self.checksum(data[1:])])
+
+
+    def frame(self):
+        """
+            Description: Answer to command 6 with the current values of the waveforms
+        """
+        t = self.elapsed()
+        gas = min(max(round(self.waveform(t) * 10 ** self.decimal), 0), 0xFFFF)
+        temperature = round(self.temperature(t) * 100)
+        humidity = min(max(round(self.humidity(t) * 100), 0), 0xFFFF)
+        data = (bytes([0x87]) + gas.to_bytes(2, 'big') + self.max_value.to_bytes(2, 'big')
+                + gas.to_bytes(2, 'big') + temperature.to_bytes(2, 'big', signed=True)
+                + humidity.to_bytes(2, 'big'))
+        return b'\xff' + data + bytes([self.checksum(data)])
+
+
+    def run(self):
+        """
+            Description: Answers the commands of the driver
+        """
+        buffer = bytearray()
+        while not self._stop_event.is_set():
+            buffer += self.receive(0.1)
+            while buffer:
+                if buffer[0] == 0xD1:
+                    del buffer[0]
+                    self.send(self.info())
+                elif buffer[0] == 0xFF:
+                    if len(buffer) < 9:
+                        break
+                    command = buffer[2]
+                    del buffer[:9]
+                    if command == 0x87:
+                        self.send(self.frame())
+                    elif command in (0x88, 0x89):
+                        self.send(b'OK') # running light off/on
+                else:
+                    del buffer[0]
+
+
+class SimulatedCozirSensor(SimulatedDevice):
+    """
+    Cozir LP3 in streaming mode.
+    """
+
+    def __init__(self, waveform=None, period=0.5, **kwargs):
+        """
+            ### Constructor ###
+            Parameters: waveform: function of the elapsed time which returns the CO2
+                                  concentration in ppm
+                        period: time between two lines in seconds
+                        kwargs: latency, jitter, corruption, seed of SimulatedDevice
+        """
+        super().__init__(**kwargs)
+        self.waveform = waveform or constant(420)
+        self.period = period
+        self._filtered = None
+
+
+    def line(self):
+        """
+            Description: Next output line with filtered and unfiltered concentration
+        """
+        unfiltered = min(max(round(self.waveform(self.elapsed())), 0), 99999)
+        if self._filtered is None:
+            self._filtered = unfiltered
+        self._filtered += (unfiltered - self._filtered) * 0.25
+        return b' Z %05d z %05d\r\n' % (round(self._filtered), unfiltered)
+
+
+    def run(self):
+        """
+            Description: Sends one line per period, the commands of the driver are ignored
+        """
+        next_line = time.monotonic()
+        while not self._stop_event.is_set():
+            self.receive(max(next_line - time.monotonic(), 0))
+            if time.monotonic() >= next_line:
+                self.send(self.line())
+                next_line += self.period
+
+
+class FakeGPIO(types.ModuleType, gpio.NullGPIO):
+    """
+    Replacement of the RPi.GPIO module which records the pin states.
+    """
+
+    def __init__(self):
+        types.ModuleType.__init__(self, 'RPi.GPIO')
+        gpio.NullGPIO.__init__(self)
+
+
+def install_fake_gpio():
+    """
+        Description: Makes a FakeGPIO the GPIO backend of the station (gpio.py) and registers
+                     it as module RPi.GPIO, so also 'import RPi.GPIO' works without a
+                     Raspberry pi
+        Return: the FakeGPIO instance
+    """
+    fake = FakeGPIO()
+    package = types.ModuleType('RPi')
+    package.GPIO = fake
+    sys.modules['RPi'] = package
+    sys.modules['RPi.GPIO'] = fake
+    return gpio.set_backend(fake)
+
+
+class SimulatedStation:
+    """
+    All sensors of a station with the port roles of local_db.py.
+    """
+
+    def __init__(self, latency=0.02, jitter=0.0, corruption=0.0, cozir_period=0.5, seed=None):
+        """
+            ### Constructor ###
+            Parameters: latency, jitter, corruption, seed: see SimulatedDevice, used for all sensors
+                        cozir_period: time between two lines of the CO2 sensor
+        """
+        options = {'latency': latency, 'jitter': jitter, 'corruption': corruption}
+        rng = random.Random(seed)
+        self.sensors = {
+            'O3': SimulatedEcSensor('O3', noisy(sine(40, 15, 600), 2, rng.random()),
+                                    seed=rng.random(), **options),
+            'CO': SimulatedEcSensor('CO', noisy(sine(0.4, 0.1, 900), 0.02, rng.random()),
+                                    seed=rng.random(), **options),
+            'NO2': SimulatedEcSensor('NO2', noisy(sine(0.02, 0.01, 300), 0.002, rng.random()),
+                                     seed=rng.random(), **options),
+            'CO2': SimulatedCozirSensor(noisy(sine(450, 50, 1200), 5, rng.random()),
+                                        period=cozir_period, seed=rng.random(), **options)}
+
+
+    @property
+    def ports(self):
+        """
+            Description: dict which maps the sensor role to its pty path
+        """
+        return {name: sensor.port for name, sensor in self.sensors.items()}
+
+
+    def start(self):
+        for sensor in self.sensors.values():
+            sensor.start()
+        return self
+
+
+    def stop(self):
+        for sensor in self.sensors.values():
+            sensor.stop()
+
+
+if __name__ == "__main__":
+
+    station = SimulatedStation().start()
+    print('Simulated sensors:')
+    for name, port in station.ports.items():
+        print(f'{name:>4}: {port}')
+    print('Press Ctrl+C to stop...')
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        station.stop()
@@ -0,0 +1,462 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Declarative description of a measurement station. A JSON file
+(see config/station.json) lists the fan channels, any number of sensors with
+driver, port, fan channel and calibration, and the mapping of the values to
+the columns of the upload targets. Station instantiates the drivers from the
+registry DRIVERS and reads, converts and checks all sensors of the file, the
+measurement scripts only loop over Station.sensors.
+
+A sensor entry looks like
+
+    {"name": "NO2", "driver": "ec", "port": "/dev/ttyS0", "fan": "main",
+     "unit": "µg/m³", "calibration": {"zero": 0.002, "span": 1.05, "cross": {"O3": 0.8}}}
+
+name is the name of the channel in the database and the sensor type the
+driver has to report (unless "gas" is given), so swapped cables are noticed
+when the station starts. The raw value in the unit of the driver is corrected
+for zero, span and the cross sensitivity to other sensors of the station and
+converted to unit at the measured temperature and the "conditions" of the
+file, {"temperature": "measured", "pressure": 1013.25} by default (see
+calibration.py). A linear calibration {"scale": ..., "offset": ...} gives
+value = raw value * scale + offset without unit conversion. With "port":
+"auto" (or without port) the sensor is searched on the "candidate_ports" of
+the file, default all UARTs. The identities of the sensors are cached by port
+(discovery.py), a restart connects without querying the sensors. "retention"
+sets how many days the local database keeps every resolution (retention.py),
+"continuous" and the "period" of the fans configure the continuous sampling
+(continuous.py).
+"""
+
+import os
+import json
+import time
+import importlib
+
+import gpio
+from acquisition import read_sensors
+from aggregation import SamplingPolicy
+from discovery import IdentityCache, IDENTITY_CACHE, candidate_ports, discover
+
+# driver name -> (module, class, True if the sensor also measures temperature and humidity)
+# every driver provides read_bulk(delay, iterations, aggregate, raw=True, policy) with the gas
+# concentration as first value. The modules are imported when a station uses them.
+DRIVERS = {'ec': ('ecsense', 'EcSensor', True),
+           'cozir': ('cozir', 'CozirSensor', False)}
+
+# folder of the station files
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config')
+
+# delay between two samples of read_bulk in seconds
+SAMPLE_DELAY = 0.2
+
+
+def driver_class(driver):
+    """
+        Description: Imports the class of a driver of the registry
+        Parameters: driver: key of DRIVERS
+        Return: class
+    """
+    module, name, _ = DRIVERS[driver]
+    return getattr(importlib.import_module(module), name)
+
+
+def load_config(path) -> dict:
+    """
+        Description: Reads and checks a station file, fills in the defaults
+        Parameters: path: path of the JSON file
+        Return: dict with the keys name, fans, sensors and upload
+    """
+    with open(path, encoding='utf-8') as file:
+        return check_config(json.load(file))
+
+
+def check_config(config) -> dict:
+    """
+        Description: Checks a station description, fills in the defaults
+        Parameters: config: dict as in the JSON file
+        Return: checked copy of config
+        Raises: ValueError if an entry is missing or inconsistent
+    """
+    fans = {}
+    for fan in config.get('fans', []):
+        if 'name' not in fan or 'pin' not in fan:
+            raise ValueError(f'Fan {fan} needs a name and a pin')
+        fan = {'vent_time': 5, 'wait_time': 2, 'period': 60, **fan}
+        if fan['vent_time'] + fan['wait_time'] > fan['period']:
+            raise ValueError(f"Fan {fan['name']}: vent_time and wait_time exceed the period")
+        fans[fan['name']] = fan
+
+    sensors = {}
+    for sensor in config.get('sensors', []):
+        for key in ['name', 'driver']:
+            if key not in sensor:
+                raise ValueError(f'Sensor {sensor} has no {key}')
+        name = sensor['name']
+        if name in sensors:
+            raise ValueError(f'Sensor {name} is listed twice')
+        if sensor['driver'] not in DRIVERS:
+            raise ValueError(f"Sensor {name}: unknown driver {sensor['driver']}, "
+                             f"known are {', '.join(DRIVERS)}")
+        if sensor.get('fan') is not None and sensor['fan'] not in fans:
+            raise ValueError(f"Sensor {name}: unknown fan {sensor['fan']}")
+        sensors[name] = {'gas': name, 'port': 'auto', 'fan': None, 'unit': 'ppm', **sensor}
+        sensors[name]['calibration'] = check_calibration(name, sensors[name])
+        if 'sampling' in sensor:
+            if 'tolerance' not in sensor['sampling']:
+                raise ValueError(f'Sensor {name}: adaptive sampling needs a tolerance')
+            sensors[name]['sampling'] = {'confidence': 0.95, 'min_samples': 3, 'budget': 10,
+                                         **sensor['sampling']}
+    if not sensors:
+        raise ValueError('The station has no sensors')
+    for name, sensor in sensors.items():
+        unknown = set(sensor['calibration']['cross']) - set(sensors)
+        if unknown:
+            raise ValueError(f"Sensor {name}: cross sensitivity to unknown sensors {', '.join(sorted(unknown))}")
+
+    channels = set(sensors) | {'temperature', 'humidity'}
+    upload = {}
+    for target, settings in config.get('upload', {}).items():
+        unknown = set(settings.get('columns', {}).values()) - channels
+        if unknown:
+            raise ValueError(f"Upload {target}: unknown channels {', '.join(sorted(unknown))}")
+        upload[target] = settings
+
+    continuous = {'store': 'seconds', 'sample_interval': 0, **config.get('continuous', {})}
+    if continuous['store'] not in ('seconds', 'samples'):
+        raise ValueError(f"Continuous store {continuous['store']}: use seconds or samples")
+
+    return {'name': config.get('name', 'station'), 'fans': fans, 'sensors': sensors,
+            'upload': upload, 'candidate_ports': config.get('candidate_ports'),
+            'conditions': dict(config.get('conditions', {})),
+            'retention': dict(config.get('retention', {})), 'continuous': continuous}
+
+
+def check_calibration(name, sensor) -> dict:
+    """
+        Description: Calibration of a sensor entry with defaults
+        Parameters: name: sensor name
+                    sensor: sensor entry
+        Return: dict with zero, span, cross and raw_unit (None: unit of the driver)
+        Raises: ValueError for a linear calibration combined with zero or span
+    """
+    settings = dict(sensor.get('calibration', {}))
+    if 'scale' in settings or 'offset' in settings:
+        if {'zero', 'span', 'raw_unit'} & set(settings):
+            raise ValueError(f'Sensor {name}: use either scale and offset or zero and span')
+        scale = settings.pop('scale', 1)
+        offset = settings.pop('offset', 0)
+        if scale == 0:
+            raise ValueError(f'Sensor {name}: scale must not be 0')
+        # raw * scale + offset = (raw - zero) * span, already in the output unit
+        settings.update(zero=-offset / scale, span=scale, raw_unit=sensor['unit'])
+    return {'zero': 0, 'span': 1, 'cross': {}, 'raw_unit': None, **settings}
+
+
+class Station:
+    """
+    Fans and sensors of one station.
+    """
+
+    def __init__(self, config, ports=None, rediscover=False, identity_cache=IDENTITY_CACHE):
+        """
+            ### Constructor ###
+            Sets up the fan GPIOs and connects to all sensors at the same time
+            Parameters: config: path of a station file or dict with the content of such a file
+                        ports: dict which maps sensor names to other serial ports than in the
+                               file (e.g. simulated ports of simulator.py), they bypass the
+                               identity cache
+                        rediscover: ignore the cached identities, e.g. after rewiring
+                        identity_cache: path of the identity cache, None disables it
+            Raises: ValueError if a sensor reports another sensor type than configured or
+                    no port has a sensor for an "auto" entry
+        """
+        self.config = load_config(config) if isinstance(config, str) else check_config(config)
+        self.name = self.config['name']
+        self.fans = self.config['fans']
+
+        self.gpio = gpio.backend()
+        self.gpio.setwarnings(False)
+        self.gpio.setmode(self.gpio.BCM)
+        for fan in self.fans.values():
+            self.gpio.setup(fan['pin'], self.gpio.OUT)
+
+        cache = IdentityCache(identity_cache) if identity_cache else None
+        if cache is not None and rediscover:
+            cache.identities.clear()
+
+        # port and known identity of every sensor
+        ports = {} if ports is None else ports
+        connections = {}
+        for name, settings in self.config['sensors'].items():
+            if name in ports:
+                connections[name] = (ports[name], None)
+            elif settings['port'] != 'auto':
+                connections[name] = (settings['port'],
+                                     self._cached(cache, settings['port'], settings['gas']))
+        missing = [name for name in self.config['sensors'] if name not in connections]
+        if missing:
+            used = {port for port, _ in connections.values()}
+            connections.update(self._discover(missing, cache, used))
+
+        # the sensors connect at the same time, with a known identity without any query
+        self.sensors, _ = read_sensors(
+            {name: lambda name=name, connection=connection:
+                driver_class(self.settings(name)['driver'])(*connection)
+             for name, connection in connections.items()})
+
+        for name, sensor in self.sensors.items():
+            port, _ = connections[name]
+            if getattr(sensor, 'sensor_type', None) != self.settings(name)['gas']:
+                if cache is not None:
+                    cache.remove(port)
+                    cache.save()
+                for other in self.sensors.values():
+                    other.close()
+                raise ValueError(f"{port}: expected a {self.settings(name)['gas']} sensor for "
+                                 f"{name}, found {getattr(sensor, 'sensor_type', 'none')}")
+            if cache is not None and name not in ports:
+                cache.put(port, sensor.identity())
+        if cache is not None:
+            cache.save()
+        self.ports = {name: port for name, (port, _) in connections.items()}
+
+        # raw values are in the unit the driver reports unless the file gives one
+        import calibration # loads NumPy
+        self.raw_units = {name: sensor.unit for name, sensor in self.sensors.items()}
+        self.calibration = calibration.Calibration(
+            {name: {**calibration.calibration_settings(settings),
+                    'raw_unit': settings['calibration']['raw_unit'] or self.raw_units[name]}
+             for name, settings in self.config['sensors'].items()},
+            **self.config['conditions'])
+
+        # adaptive sampling, the tolerance of the file is in the unit of the sensor
+        self.sampling = {}
+        for name, settings in self.config['sensors'].items():
+            if 'sampling' in settings:
+                scale = abs(self.calibration.sensors[name]['span'] * self.calibration.factor(name))
+                self.sampling[name] = SamplingPolicy(
+                    **{**settings['sampling'], 'tolerance': settings['sampling']['tolerance'] / scale})
+
+        # start and end time of the last read of every sensor
+        self.read_timings = {}
+        # duration of the ventilation and wait phase of every fan in the last cycle
+        self.phase_timings = {}
+
+
+    @staticmethod
+    def _cached(cache, port, gas):
+        """
+            Description: Cached identity of a port if it is a sensor of the expected gas
+        """
+        identity = cache.get(port) if cache is not None else None
+        return identity if identity is not None and identity['sensor_type'] == gas else None
+
+
+    def _discover(self, names, cache, used) -> dict:
+        """
+            Description: Finds the ports of the sensors with port "auto", from the cache or
+                         by probing all candidate ports at the same time
+            Parameters: names: names of the sensors
+                        cache: IdentityCache or None
+                        used: ports which belong to other sensors
+            Return: dict which maps the names to (port, identity)
+        """
+        candidates = [port for port in self.config['candidate_ports'] or candidate_ports()
+                      if port not in used]
+        identities = {port: cache.get(port) for port in candidates} if cache is not None else {}
+        unknown = [port for port in candidates if identities.get(port) is None]
+        if unknown:
+            identities.update(discover(unknown))
+
+        found = {}
+        for name in names:
+            gas = self.settings(name)['gas']
+            port = next((port for port in candidates if port not in used and
+                         identities.get(port) is not None and
+                         identities[port]['sensor_type'] == gas), None)
+            if port is None:
+                raise ValueError(f'No {gas} sensor found for {name} on {", ".join(candidates)}')
+            used.add(port)
+            found[name] = (port, identities[port])
+        return found
+
+
+    def settings(self, name) -> dict:
+        """
+            Description: Entry of a sensor in the station file
+        """
+        return self.config['sensors'][name]
+
+
+    def channels(self) -> dict:
+        """
+            Description: Database channels of the values of convert()
+            Return: dict which maps the sensor names, temperature and humidity to a tuple
+                    (sensor, quantity, unit) of db_schema.channel_id()
+        """
+        channels = {name: (name, 'concentration', settings['unit'])
+                    for name, settings in self.config['sensors'].items()}
+        channels['temperature'] = ('station', 'temperature', '°C')
+        channels['humidity'] = ('station', 'humidity', '%rH')
+        return channels
+
+
+    def raw_channels(self) -> dict:
+        """
+            Description: Database channels of the raw values, calibration.reprocess() recalculates
+                         the concentrations from them
+            Return: dict which maps the sensor names to a tuple (sensor, 'raw', unit of the driver)
+        """
+        return {name: (name, 'raw', unit) for name, unit in self.raw_units.items()}
+
+
+    def sampling_channels(self) -> dict:
+        """
+            Description: Database channels of the number of samples and the uncertainty of the
+                         sensors with adaptive sampling
+            Return: dict which maps the sensor names to a dict 'samples' or 'uncertainty' ->
+                    (sensor, quantity, unit)
+        """
+        return {name: {'samples': (name, 'samples', 'count'),
+                       'uncertainty': (name, 'uncertainty', self.settings(name)['unit'])}
+                for name in self.sampling}
+
+
+    def climate_sensors(self) -> list:
+        """
+            Description: Names of the sensors which also measure temperature and humidity
+        """
+        return [name for name, settings in self.config['sensors'].items()
+                if DRIVERS[settings['driver']][2]]
+
+
+    def ventilate(self, fan, vent_time=None, wait_time=None):
+        """
+            Description: Ventilates the channel of a fan and waits until the air settled
+            Parameters: fan: name of the fan
+                        vent_time, wait_time: durations in seconds, default from the file
+        """
+        settings = self.fans[fan]
+        vent_time = settings['vent_time'] if vent_time is None else vent_time
+        wait_time = settings['wait_time'] if wait_time is None else wait_time
+
+        started_at = time.perf_counter()
+        self.gpio.output(settings['pin'], True)
+        time.sleep(vent_time)
+        self.gpio.output(settings['pin'], False)
+        ventilated_at = time.perf_counter()
+        time.sleep(wait_time)
+        self.phase_timings[f'{fan}.ventilation'] = ventilated_at - started_at
+        self.phase_timings[f'{fan}.wait'] = time.perf_counter() - ventilated_at
+
+
+    def acquire(self, vent_time=None, wait_time=None, iterations=5, concurrent=True,
+                aggregate='mean', adaptive=True) -> dict:
+        """
+            Description: Ventilates every fan channel and reads its sensors afterwards. The
+                         channels run at the same time, sensors without fan are read at once.
+            Parameters: vent_time, wait_time: durations in seconds, default from the file
+                        iterations: number of samples per sensor
+                        concurrent: read all sensors in parallel instead of one after another
+                        aggregate: aggregation of the samples (mean, median, trimmed_mean, ...)
+                        adaptive: sensors with a "sampling" entry take samples until the
+                                  confidence interval of the mean is within their tolerance
+                                  or their time budget is used up, instead of iterations
+            Return: dict which maps the sensor name to the (values, stats) tuple of read_bulk
+        """
+        groups = {}
+        for name, settings in self.config['sensors'].items():
+            groups.setdefault(settings['fan'], []).append(name)
+
+        def read_group(fan, names):
+            if fan is not None:
+                self.ventilate(fan, vent_time, wait_time)
+            return read_sensors(
+                {name: lambda name=name, sensor=self.sensors[name]:
+                    sensor.read_bulk(delay=SAMPLE_DELAY, iterations=iterations,
+                                     aggregate=aggregate, raw=True,
+                                     policy=self.sampling.get(name) if adaptive else None)
+                 for name in names},
+                concurrent=concurrent)
+
+        results, _ = read_sensors({fan: lambda fan=fan, names=names: read_group(fan, names)
+                                   for fan, names in groups.items()},
+                                  concurrent=concurrent)
+
+        readings = {}
+        self.read_timings = {}
+        for group_readings, group_timings in results.values():
+            readings.update(group_readings)
+            self.read_timings.update(group_timings)
+        return readings
+
+
+    def convert(self, readings) -> dict:
+        """
+            Description: Applies the calibration of the station file
+            Parameters: readings: dict as returned by acquire()
+            Return: dict which maps the sensor names, temperature and humidity to the values,
+                    under 'std' the standard deviation of the gas samples of every sensor,
+                    under 'raw' the raw values, under 'samples' the number of gas samples and
+                    under 'uncertainty' the half width of the confidence interval of the mean
+                    of the sensors with adaptive sampling
+        """
+        climate = [readings[name][0] for name in self.climate_sensors() if name in readings]
+        temperature = sum(value[1] for value in climate) / len(climate) if climate else None
+        humidity = sum(value[2] for value in climate) / len(climate) if climate else None
+
+        raw = {name: sensor_values[0] for name, (sensor_values, _) in readings.items()}
+        values = {name: float(value)
+                  for name, value in self.calibration.apply(raw, temperature).items()}
+        values['std'] = {name: float(self.calibration.std(name, stats[0].std, temperature))
+                         for name, (_, stats) in readings.items()}
+        values['raw'] = raw
+        values['samples'] = {name: stats[0].count for name, (_, stats) in readings.items()}
+        values['uncertainty'] = {
+            name: float(self.calibration.std(name, policy.half_width(readings[name][1][0]),
+                                             temperature))
+            for name, policy in self.sampling.items() if name in readings}
+        values['temperature'] = temperature
+        values['humidity'] = humidity
+        return values
+
+
+    def check(self, readings) -> list:
+        """
+            Description: Quality check of the readings of one cycle
+            Parameters: readings: dict as returned by acquire()
+            Return: list of problems, empty if the readings are plausible
+        """
+        problems = []
+        for name, (sensor_values, _) in readings.items():
+            limit = self.sensors[name].max_value
+            if not 0 <= sensor_values[0] <= limit:
+                problems.append(f'{name} {sensor_values[0]} outside of the range 0 to {limit}')
+            if DRIVERS[self.settings(name)['driver']][2]:
+                if not -40 <= sensor_values[1] <= 85:
+                    problems.append(f'{name} temperature {sensor_values[1]} outside of -40 to 85 °C')
+                if not 0 <= sensor_values[2] <= 100:
+                    problems.append(f'{name} humidity {sensor_values[2]} outside of 0 to 100 %rH')
+        return problems
+
+
+    def upload_rows(self, values) -> dict:
+        """
+            Description: Values of one cycle as rows of the upload targets
+            Parameters: values: dict as returned by convert()
+            Return: dict which maps the target name to a dict column -> value
+        """
+        return {target: {column: values[channel]
+                         for column, channel in settings.get('columns', {}).items()}
+                for target, settings in self.config['upload'].items()}
+
+
+    def close(self):
+        """
+            Description: Disconnects the sensors and releases the GPIOs
+        """
+        self.sensors.clear() # the drivers close their ports when deleted
+        self.gpio.cleanup()
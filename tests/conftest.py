@@ -0,0 +1,50 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Fixtures of the tests. The sensors are simulated on pseudo
+terminals (simulator.py) and the fans switch a FakeGPIO, so the tests run on
+any Linux machine.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import simulator
+
+GPIO = simulator.install_fake_gpio()
+
+
+@pytest.fixture(scope='session')
+def sim():
+    """
+        Description: Simulated station with the sensors O3, CO, NO2 and CO2, shared by all
+                     tests; only one test at a time may open its ports
+    """
+    station = simulator.SimulatedStation(latency=0.005, cozir_period=0.1, seed=1).start()
+    yield station
+    station.stop()
+
+
+def station_config(ports, **extra):
+    """
+        Description: Station file for the simulated sensors with short fan times
+        Parameters: ports: dict which maps the sensor names to their pty paths
+                    extra: further entries of the station file
+    """
+    drivers = {'O3': 'ec', 'CO': 'ec', 'NO2': 'ec', 'CO2': 'cozir'}
+    return {'name': 'test',
+            'fans': [{'name': 'main', 'pin': 27, 'vent_time': 0.05, 'wait_time': 0.05}],
+            'sensors': [{'name': name, 'driver': drivers[name], 'port': port, 'fan': 'main',
+                         'unit': 'ppm'} for name, port in ports.items()],
+            **extra}
+
+
+@pytest.fixture
+def config(sim):
+    return station_config(sim.ports)
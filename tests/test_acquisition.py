@@ -0,0 +1,42 @@
+"""
+Tests of the concurrent reads of acquisition.py and Station.acquire().
+"""
+
+import time
+
+from acquisition import read_sensors
+from station import Station
+
+
+def test_read_sensors_runs_the_jobs_in_parallel():
+    jobs = {name: lambda name=name: time.sleep(0.2) or name for name in ['O3', 'CO', 'NO2']}
+
+    started_at = time.perf_counter()
+    results, timings = read_sensors(jobs)
+    duration = time.perf_counter() - started_at
+
+    assert results == {'O3': 'O3', 'CO': 'CO', 'NO2': 'NO2'}
+    assert duration < 0.4
+    # every read started before any other one finished
+    assert max(start for start, _ in timings.values()) < min(end for _, end in timings.values())
+
+
+def test_read_sensors_sequential():
+    jobs = {name: lambda: time.sleep(0.1) for name in ['O3', 'CO', 'NO2']}
+
+    _, timings = read_sensors(jobs, concurrent=False)
+
+    ordered = sorted(timings.values())
+    assert all(previous[1] <= following[0] for previous, following in zip(ordered, ordered[1:]))
+
+
+def test_acquire_reads_all_sensors_at_the_same_time(config):
+    station = Station(config, identity_cache=None)
+    try:
+        readings = station.acquire(vent_time=0, wait_time=0, iterations=3)
+    finally:
+        station.close()
+
+    assert set(readings) == {'O3', 'CO', 'NO2', 'CO2'}
+    ec = [station.read_timings[name] for name in ['O3', 'CO', 'NO2']]
+    assert max(start for start, _ in ec) < min(end for _, end in ec)
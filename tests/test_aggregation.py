@@ -0,0 +1,81 @@
+"""
+Tests of the streaming statistics of aggregation.py.
+"""
+
+import statistics
+
+import pytest
+
+import aggregation
+from aggregation import AGGREGATIONS, RunningStats, SamplingPolicy
+
+SAMPLES = [412.0, 415.5, 409.0, 600.0, 414.0, 413.5, 411.0]
+
+EXPECTED = {'mean': statistics.fmean(SAMPLES),
+            'median': statistics.median(SAMPLES),
+            'trimmed_mean': aggregation.trimmed_mean(SAMPLES),
+            'std': statistics.stdev(SAMPLES),
+            'min': min(SAMPLES),
+            'max': max(SAMPLES)}
+
+
+def stats_of(samples, **options):
+    stats = RunningStats(**options)
+    for value in samples:
+        stats.add(value)
+    return stats
+
+
+@pytest.mark.parametrize('method', AGGREGATIONS)
+def test_aggregations_of_kept_samples(method):
+    assert stats_of(SAMPLES).aggregate(method) == pytest.approx(EXPECTED[method])
+
+
+def test_unknown_aggregation_lists_the_known_ones():
+    with pytest.raises(ValueError, match='mean, median, trimmed_mean, std, min, max'):
+        stats_of(SAMPLES).aggregate('mode')
+
+
+def test_merge_is_exact_for_the_moments():
+    merged = aggregation.merge([stats_of(SAMPLES[:3]), stats_of(SAMPLES[3:])])
+
+    assert merged.count == len(SAMPLES)
+    assert merged.mean == pytest.approx(EXPECTED['mean'])
+    assert merged.std == pytest.approx(EXPECTED['std'])
+    assert merged.quantile(0.5) == EXPECTED['median']
+
+
+def test_sketch_beyond_the_capacity():
+    samples = [float(value) for value in range(1, 1001)]
+    stats = stats_of(samples, capacity=64, accuracy=0.01)
+
+    assert not stats.exact
+    assert stats.quantile(0.5) == pytest.approx(statistics.median(samples), rel=0.01)
+    assert stats.trimmed_mean() == pytest.approx(aggregation.trimmed_mean(samples), rel=0.01)
+
+
+@pytest.mark.parametrize('df, quantile', [(1, 12.706), (2, 4.303), (3, 3.182), (9, 2.262),
+                                          (30, 2.042), (120, 1.980)])
+def test_t_quantiles(df, quantile):
+    assert aggregation.t_quantile(0.95, df) == pytest.approx(quantile, abs=1e-3)
+
+
+def test_interval_of_few_samples_uses_t():
+    policy = SamplingPolicy(tolerance=1, min_samples=3)
+    stats = stats_of([1.0, 2.0, 3.0])
+
+    assert policy.half_width(stats) == pytest.approx(4.303 * 1 / 3 ** 0.5, rel=1e-3)
+    assert not policy.done(stats, elapsed=0.1)
+
+
+def test_budget_counts_the_samples_taken():
+    policy = SamplingPolicy(tolerance=1e-9, min_samples=3, budget=10)
+    noisy = stats_of([1.0, 5.0, 2.0, 8.0, 3.0])
+
+    # 5 samples in 8 s: the next one would end after 9.6 s
+    assert not policy.done(noisy, elapsed=8)
+    # 4 of them came from a history, 1 sample in 8 s: the next one ends after 16 s
+    assert policy.done(noisy, elapsed=8, taken=1)
+    # no sample taken yet, only the budget itself stops sampling
+    assert not policy.done(noisy, elapsed=0, taken=0)
+    assert policy.done(noisy, elapsed=10.5, taken=0)
@@ -0,0 +1,109 @@
+"""
+Tests of the export and the memory mapped reader of archive.py.
+"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+import archive
+from archive import Archive, ArchiveWriter, month_range
+from db_schema import INSERT_MEASUREMENT, channel_id, create_schema
+
+MAY = month_range('2026-05')
+JUNE = month_range('2026-06')
+
+
+@pytest.fixture
+def con():
+    con = sqlite3.connect(':memory:')
+    create_schema(con)
+    yield con
+    con.close()
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(archive, 'BLOCK', 16)
+
+
+def insert(con, channel, times, values, std=None):
+    with con:
+        con.executemany(INSERT_MEASUREMENT, [(channel, int(time), float(value), std)
+                                             for time, value in zip(times, values)])
+
+
+def test_round_trip_across_months(con, tmp_path):
+    no2 = channel_id(con, 'node 1/NO2', 'concentration', 'µg/m³')
+    times = np.arange(MAY[1] - 100 * 60000, MAY[1] + 100 * 60000, 60000)
+    values = np.linspace(10, 30, len(times))
+    insert(con, no2, times, values, std=0.5)
+
+    assert ArchiveWriter(tmp_path).export(con, until=JUNE[1]) == [('node 1', '2026-05'),
+                                                                  ('node 1', '2026-06')]
+    reader = Archive(tmp_path)
+    assert reader.stations() == ['node 1']
+    assert reader.channels('node 1') == {'NO2/concentration': 'µg/m³'}
+
+    read_times, read_values, read_stds = reader.read('node 1', 'NO2')
+    assert read_times.tolist() == times.tolist()
+    assert np.allclose(read_values, values, rtol=1e-6)
+    assert np.all(read_stds == 0.5)
+
+    # a range inside a month is a view of the file and only covers the range
+    start, end = int(times[37]), int(times[61])
+    range_times, range_values, range_stds = reader.read('node 1', 'NO2', start=start, end=end)
+    assert range_times.tolist() == times[37:61].tolist()
+    assert np.allclose(range_values, values[37:61], rtol=1e-6)
+    assert not range_values.flags.owndata
+
+    # the files can only be unmapped when no view is left
+    del read_values, read_stds, range_values, range_stds
+    reader.close()
+
+
+def test_unknown_std_is_nan(con, tmp_path):
+    co = channel_id(con, 'CO', 'concentration', 'mg/m³')
+    insert(con, co, range(MAY[0], MAY[0] + 50000, 1000), range(50))
+
+    ArchiveWriter(tmp_path).export(con, station='roof', until=JUNE[0])
+
+    times, values, stds = Archive(tmp_path).read('roof', 'CO')
+    assert len(times) == 50 and values[-1] == 49
+    assert np.isnan(stds).all()
+
+
+def test_export_only_writes_changed_months(con, tmp_path):
+    co2 = channel_id(con, 'CO2', 'concentration', 'ppm')
+    insert(con, co2, range(MAY[0], MAY[0] + 10000, 1000), [420] * 10)
+    writer = ArchiveWriter(tmp_path)
+    assert writer.export(con, station='roof', until=JUNE[0]) == [('roof', '2026-05')]
+    assert writer.export(con, station='roof', until=JUNE[0]) == []
+
+    # late rows of a month are exported again
+    insert(con, co2, [MAY[0] + 20000], [421])
+    assert ArchiveWriter(tmp_path).export(con, station='roof', until=JUNE[0]) == [('roof', '2026-05')]
+    assert len(Archive(tmp_path).read('roof', 'CO2')[0]) == 11
+
+
+def test_channels_without_station_need_a_name(con, tmp_path):
+    channel_id(con, 'CO2', 'concentration', 'ppm')
+    with pytest.raises(ValueError):
+        ArchiveWriter(tmp_path).export(con)
+
+
+def test_pruned_months_are_not_rewritten(con, tmp_path):
+    co2 = channel_id(con, 'CO2', 'concentration', 'ppm')
+    raw = channel_id(con, 'CO2', 'raw', 'ppm')
+    insert(con, co2, range(MAY[0], MAY[0] + 10000, 1000), [420] * 10)
+    insert(con, raw, range(MAY[0], MAY[0] + 10000, 1000), [420] * 10)
+    ArchiveWriter(tmp_path).export(con, station='roof', until=JUNE[0])
+
+    # retention deleted the raw values, a late concentration value arrived
+    with con:
+        con.execute('DELETE FROM measurement WHERE channel_id = ?', (raw,))
+    insert(con, co2, [MAY[0] + 20000], [421])
+
+    assert ArchiveWriter(tmp_path).export(con, station='roof', until=JUNE[0]) == []
+    assert len(Archive(tmp_path).read('roof', 'CO2', 'raw')[0]) == 10
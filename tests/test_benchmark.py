@@ -0,0 +1,38 @@
+"""
+Tests of the benchmark helpers of benchmark.py on the simulated station.
+"""
+
+import argparse
+
+import pytest
+
+import benchmark
+
+
+def test_percentiles():
+    summary = benchmark.percentiles([0.001 * i for i in range(1, 101)])
+
+    assert summary['count'] == 100
+    assert summary['mean'] == pytest.approx(50.5)
+    assert summary['p50'] == pytest.approx(51)
+    assert summary['p99'] == pytest.approx(100)
+    assert summary['max'] == pytest.approx(100)
+    assert benchmark.percentiles([]) == {'count': 0}
+
+
+def test_bench_writer(tmp_path):
+    result = benchmark.bench_writer(argparse.Namespace(writer_rows=600), str(tmp_path))
+
+    assert set(result) == {1, 60, 1000}
+    assert all(summary['rows_per_second'] > 0 for summary in result.values())
+
+
+def test_bench_cycles(tmp_path):
+    args = argparse.Namespace(cycles=2, vent_time=0, wait_time=0, iterations=2, latency=0.005,
+                              jitter=0, corruption=0, cozir_period=0.1, upload_latency=0)
+
+    result = benchmark.bench_cycles(args, str(tmp_path))
+
+    assert result['phases']['cycle']['count'] == 2
+    assert result['spool_pending'] == 0 and result['uploaded'] == 2
+    assert result['writer']['pending'] + result['writer']['rows_written'] > 0
@@ -0,0 +1,68 @@
+"""
+Tests of the unit conversion and of calibration.reprocess().
+"""
+
+import sqlite3
+
+import pytest
+
+import calibration
+from db_schema import INSERT_MEASUREMENT, channel_id, create_schema
+from station import check_config
+
+DAY_MS = 24 * 3600 * 1000
+
+
+@pytest.mark.parametrize('gas, factor', [('NO2', 1.88), ('O3', 1.96), ('CO', 1.145)])
+def test_ppb_to_microgram_at_25_degrees(gas, factor):
+    assert calibration.conversion_factor(gas, 'ppb', 'µg/m³') == pytest.approx(factor, rel=2e-3)
+
+
+@pytest.fixture
+def con():
+    con = sqlite3.connect(':memory:')
+    create_schema(con)
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def stored(con):
+    """
+    Two days of NO2 values stored with span 1, one value per hour.
+    """
+    raw = channel_id(con, 'NO2', 'raw', 'ppm')
+    concentration = channel_id(con, 'NO2', 'concentration', 'ppm')
+    times = range(0, 2 * DAY_MS, 3600 * 1000)
+    with con:
+        con.executemany(INSERT_MEASUREMENT, [(raw, time, 0.04, None) for time in times])
+        con.executemany(INSERT_MEASUREMENT, [(concentration, time, 0.04, None) for time in times])
+    return concentration
+
+
+def config(span):
+    return check_config({'sensors': [{'name': 'NO2', 'driver': 'ec',
+                                      'calibration': {'span': span}}]})
+
+
+def values(con, channel, table='measurement', column='value', time='time'):
+    return [row[0] for row in con.execute(f'SELECT {column} FROM {table} WHERE channel_id = ? '
+                                          f'ORDER BY {time}', (channel,))]
+
+
+def test_reprocess_recalculates_values_and_rollups(con, stored):
+    counts = calibration.reprocess(con, config(span=2))
+
+    assert counts == {'NO2': 48}
+    assert values(con, stored) == pytest.approx([0.08] * 48)
+    assert values(con, stored, 'rollup_1d', 'mean', 'bucket') == pytest.approx([0.08, 0.08])
+
+
+def test_reprocess_stops_at_the_raw_horizon(con, stored, caplog):
+    con.execute("INSERT INTO retention (resolution, horizon) VALUES ('raw', ?)", (DAY_MS,))
+
+    counts = calibration.reprocess(con, config(span=2), start=0)
+
+    assert counts == {'NO2': 24}
+    assert values(con, stored) == pytest.approx([0.04] * 24 + [0.08] * 24)
+    assert 'retention horizon' in caplog.text
@@ -0,0 +1,88 @@
+"""
+Tests of the collector protocol of collector.py on a Unix socket.
+"""
+
+import math
+import sqlite3
+
+import pytest
+
+from async_serial import run_sync
+from collector import Collector, CollectorClient, CollectorTarget, parse_address, parse_batch
+
+CHANNEL = ('NO2', 'concentration', 'ppm')
+
+
+@pytest.fixture
+def collector(tmp_path):
+    collector = Collector(str(tmp_path / 'collector.db'))
+    address = f"unix:{tmp_path / 'collector.sock'}"
+    run_sync(collector.start([address]))
+    client = CollectorClient(address, timeout=5)
+    yield collector, client, str(tmp_path / 'collector.db')
+    client.close()
+    run_sync(collector.stop())
+
+
+def stored(path):
+    with sqlite3.connect(path) as con:
+        rows = con.execute("""SELECT sensor, time, value FROM measurement
+                              JOIN channel ON channel.id = channel_id ORDER BY time""").fetchall()
+    con.close()
+    return rows
+
+
+def test_parse_address():
+    assert parse_address('tcp:0.0.0.0:7070') == ('tcp', ('0.0.0.0', 7070))
+    assert parse_address('unix:/tmp/collector.sock') == ('unix', '/tmp/collector.sock')
+    with pytest.raises(ValueError):
+        parse_address('udp:localhost:7070')
+
+
+@pytest.mark.parametrize('row', [[0, 1000, math.nan, None], [0, 1000, 1.0, math.inf],
+                                 [0, 1000.5, 1.0, None], [1, 1000, 1.0, None],
+                                 [-1, 1000, 1.0, None], [0, True, 1.0, None], [0, 1000, True, None]])
+def test_parse_batch_rejects_invalid_rows(row):
+    with pytest.raises((ValueError, IndexError)):
+        parse_batch({'station': 'node', 'batch': 1, 'channels': [list(CHANNEL)], 'rows': [row]})
+
+
+def test_batches_are_acknowledged_after_the_commit(collector):
+    collector, client, path = collector
+
+    assert client.send('node 1', [(*CHANNEL, 1000, 1.5, None), (*CHANNEL, 2000, 2.5, 0.1)]) == 2
+
+    assert stored(path) == [('node 1/NO2', 1000, 1.5), ('node 1/NO2', 2000, 2.5)]
+    assert client.stats()['stations']['node 1']['rows'] == 2
+
+
+def test_duplicate_batches_are_stored_once(collector):
+    collector, client, path = collector
+    rows = [(*CHANNEL, 1000, 1.5, None)]
+
+    client.send('node 1', rows)
+    client.send('node 1', rows) # acknowledgement lost, the spool sends it again
+
+    assert stored(path) == [('node 1/NO2', 1000, 1.5)]
+
+
+def test_non_finite_values_are_not_acknowledged(collector):
+    collector, client, path = collector
+
+    with pytest.raises(ConnectionError, match='not finite'):
+        client.send('node 1', [(*CHANNEL, 1000, 1.5, None), (*CHANNEL, 2000, math.nan, None)])
+
+    assert stored(path) == []
+    assert collector.stats()['stations']['node 1']['rejected'] == 1
+
+
+def test_collector_target_of_the_upload_spool(collector):
+    collector, client, path = collector
+    target = CollectorTarget(f'unix:{client.target}', {'no2': CHANNEL, 't': ('station', 'temperature', '°C')})
+
+    target.upload_many([('node 2', {'no2': 1.0, 't': None}, 1.0, 'a'),
+                        ('node 2', {'no2': 2.0, 't': 20.5}, 2.0, 'b')])
+    target.client.close()
+
+    assert stored(path) == [('node 2/NO2', 1000, 1.0), ('node 2/NO2', 2000, 2.0),
+                            ('node 2/station', 2000, 20.5)]
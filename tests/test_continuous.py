@@ -0,0 +1,95 @@
+"""
+Tests of the continuous sampling of continuous.py.
+"""
+
+import time
+import types
+import asyncio
+
+import pytest
+
+from continuous import ContinuousConverter, ContinuousSampler, SAMPLES
+from station import Station
+
+EC_VALUES = [0.02, 22.5, 45.0]
+
+
+@pytest.fixture
+def station(config):
+    station = Station(config, identity_cache=None)
+    yield station
+    station.close()
+
+
+def test_ventilation_samples_get_their_own_kind(station):
+    converter = ContinuousConverter(station)
+    rows = [('NO2', 1000, 'measurement', EC_VALUES, None),
+            ('NO2', 2000, 'ventilation', [0.5, 22.5, 45.0], None),
+            ('NO2', 3000, 'settle', [0.1, 22.5, 45.0], None)]
+
+    converted = converter.convert(rows, [('main', 1500, 'ventilation')])
+
+    kinds = [(kind, name, time_ms) for kind, name, time_ms, _, _ in converted]
+    assert ('value', 'NO2', 1000) in kinds and ('raw', 'NO2', 1000) in kinds
+    assert ('phase', 'main', 1500) in kinds
+    assert ('ventilation', 'NO2', 2000) in kinds and ('settle', 'NO2', 3000) in kinds
+    # raw values and climate only come from the measurement phase
+    assert [time_ms for kind, _, time_ms in kinds if kind == 'raw'] == [1000]
+    assert converter.raw['NO2'] == EC_VALUES[0]
+    assert converter.latest['NO2'] == pytest.approx(0.02)
+
+
+class FailingSensor:
+    """
+    Driver whose stream fails once and then sends samples.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    async def sample_stream(self, interval=0):
+        self.calls += 1
+        if self.calls == 1:
+            raise OSError('device disconnected')
+        while True:
+            await asyncio.sleep(0.01)
+            yield time.time(), [1.0]
+
+
+def test_reads_continue_after_an_error(capsys):
+    station = types.SimpleNamespace(
+        config={'continuous': {'store': SAMPLES, 'sample_interval': 0}}, fans={},
+        sensors={'X': types.SimpleNamespace(sensor=FailingSensor())},
+        settings=lambda name: {'fan': None})
+    sampler = ContinuousSampler(station)
+
+    sampler.start()
+    deadline = time.monotonic() + 3
+    while sampler.samples['X'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    sampler.stop()
+
+    assert sampler.samples['X'] > 0
+    assert 'Reading X failed: device disconnected' in capsys.readouterr().out
+
+
+def test_ventilation_samples_are_stored_apart(config, tmp_path):
+    from local_db import MeasureAirquality
+
+    measurement = MeasureAirquality(str(tmp_path / 'airquality.db'), config=config,
+                                    identity_cache=None)
+    measurement.build_continuous_pipeline()
+    measurement._persist_continuous([('value', 'NO2', 1000, 0.02, None),
+                                     ('ventilation', 'NO2', 2000, 0.5, None),
+                                     ('settle', 'NO2', 3000, 0.1, None)])
+    measurement.writer.flush()
+    con = measurement.writer.con
+    stored = con.execute("""SELECT channel.quantity, measurement.time FROM measurement
+                            JOIN channel ON channel.id = measurement.channel_id
+                            WHERE channel.sensor = 'NO2' ORDER BY time""").fetchall()
+    rollups = con.execute('SELECT count(*) FROM rollup_1min').fetchone()[0]
+    measurement.close()
+
+    assert stored == [('concentration', 1000), ('concentration_ventilation', 2000),
+                      ('concentration_settle', 3000)]
+    assert rollups == 1
@@ -0,0 +1,71 @@
+"""
+Tests of the time windows of AsyncCozirSensor.read_bulk().
+"""
+
+import asyncio
+import time
+
+import pytest
+
+import simulator
+from cozir import AsyncCozirSensor, CozirSensor
+
+
+def fill(sensor, samples):
+    """
+        Description: Stores samples as the background reader would
+        Parameters: samples: list of (seconds ago, concentration)
+    """
+    now = time.time()
+    for age, value in samples:
+        sensor.samples.append((now - age, value, value + 1))
+        sensor._accumulate(now - age, [value, value + 1])
+
+
+def test_short_window_contains_only_its_samples():
+    sensor = AsyncCozirSensor('/dev/null')
+    fill(sensor, [(5, 100), (2.5, 200), (0.5, 300)])
+
+    values, stats = asyncio.run(sensor.read_bulk(window=3, raw=True))
+
+    assert values == [250, 251]
+    assert stats[0].count == 2
+
+
+def test_long_window_uses_the_statistics_per_second():
+    sensor = AsyncCozirSensor('/dev/null', buffer_size=2)
+    fill(sensor, [(30.5, 50), (8.5, 100), (4.5, 200), (0.5, 300)])
+
+    values, stats = asyncio.run(sensor.read_bulk(window=10, raw=True))
+
+    assert values == [200, 201]
+    assert stats[0].count == 3
+
+
+def test_window_without_samples_uses_the_latest_one():
+    sensor = AsyncCozirSensor('/dev/null')
+    fill(sensor, [(5, 100)])
+
+    assert asyncio.run(sensor.read_bulk(window=1)) == [100, 101]
+
+
+def test_sensor_type_is_only_set_when_connected():
+    sensor = AsyncCozirSensor('/dev/null')
+    assert sensor.sensor_type is None
+    assert sensor.identity()['sensor_type'] == 'CO2'
+
+
+def test_read_bulk_of_the_simulated_stream():
+    device = simulator.SimulatedCozirSensor(waveform=simulator.constant(800), period=0.05,
+                                            seed=1).start()
+    try:
+        sensor = CozirSensor(device.port)
+        assert sensor.sensor_type == 'CO2'
+        time.sleep(0.5)
+        values, stats = sensor.read_bulk(window=0.3, raw=True)
+        del sensor
+    finally:
+        device.stop()
+
+    assert values == pytest.approx([800, 800])
+    assert 3 <= stats[0].count <= 7
@@ -0,0 +1,63 @@
+"""
+Tests of the group commit writer db_writer.py.
+"""
+
+import sqlite3
+
+import pytest
+
+from db_writer import BatchedWriter
+
+INSERT = 'INSERT INTO sample VALUES (?, ?)'
+
+
+@pytest.fixture
+def writer(tmp_path):
+    writer = BatchedWriter(str(tmp_path / 'test.db'), flush_rows=3, flush_interval=3600)
+    writer.con.execute('CREATE TABLE sample (time INTEGER PRIMARY KEY, value REAL)')
+    yield writer
+    writer.con.close()
+
+
+def count(writer):
+    return writer.con.execute('SELECT count(*) FROM sample').fetchone()[0]
+
+
+def test_rows_are_written_in_groups(writer):
+    writer.add(INSERT, (1, 1.0))
+    writer.add(INSERT, (2, 2.0))
+    assert count(writer) == 0 and writer.pending == 2
+
+    writer.add(INSERT, (3, 3.0))
+    assert count(writer) == 3
+    assert writer.stats()['flushes'] == 1 and writer.stats()['rows_written'] == 3
+
+
+def test_flush_interval(writer):
+    writer.flush_interval = 0
+    writer.add(INSERT, (1, 1.0))
+    assert count(writer) == 1
+
+
+def test_failed_flush_keeps_the_rows(writer):
+    writer.add(INSERT, (1, 1.0))
+    writer.add(INSERT, (1, 2.0)) # duplicate key
+    with pytest.raises(sqlite3.IntegrityError):
+        writer.add(INSERT, (2, 3.0))
+    assert count(writer) == 0 and writer.pending == 3
+
+    writer._rows[INSERT][1] = (3, 2.0)
+    writer.flush()
+    assert count(writer) == 3 and writer.pending == 0
+
+
+def test_close_writes_the_pending_rows(tmp_path):
+    path = str(tmp_path / 'test.db')
+    writer = BatchedWriter(path, flush_rows=100)
+    writer.con.execute('CREATE TABLE sample (time INTEGER PRIMARY KEY, value REAL)')
+    writer.add(INSERT, (1, 1.0))
+    writer.close()
+
+    with sqlite3.connect(path) as con:
+        assert con.execute('SELECT value FROM sample').fetchall() == [(1.0,)]
+        assert con.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
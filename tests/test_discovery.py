@@ -0,0 +1,54 @@
+"""
+Tests of the port discovery and the identity cache of discovery.py.
+"""
+
+import json
+
+from conftest import station_config
+from discovery import IdentityCache, discover
+from station import Station
+
+
+def test_discover_the_simulated_sensors(sim):
+    identities = discover(list(sim.ports.values()) + ['/dev/does-not-exist'], timeout=1)
+
+    assert identities['/dev/does-not-exist'] is None
+    assert {name: identities[port]['sensor_type'] for name, port in sim.ports.items()} == \
+        {'O3': 'O3', 'CO': 'CO', 'NO2': 'NO2', 'CO2': 'CO2'}
+    assert identities[sim.ports['CO']] == {'driver': 'ec', 'sensor_type': 'CO', 'unit': 'ppm',
+                                           'max_value': 10, 'decimal': 2}
+
+
+def test_identity_cache(tmp_path):
+    path = str(tmp_path / 'identities.json')
+    cache = IdentityCache(path)
+    assert cache.get('/dev/ttyS0') is None
+
+    cache.put('/dev/ttyS0', {'sensor_type': 'NO2'})
+    cache.put('/dev/ttyS1', {'sensor_type': 'O3'})
+    cache.remove('/dev/ttyS1')
+    cache.save()
+
+    assert IdentityCache(path).identities == {'/dev/ttyS0': {'sensor_type': 'NO2'}}
+    (tmp_path / 'broken.json').write_text('{')
+    assert IdentityCache(str(tmp_path / 'broken.json')).identities == {}
+
+
+def test_station_finds_its_sensors_and_caches_them(sim, tmp_path):
+    config = station_config({name: 'auto' for name in sim.ports},
+                            candidate_ports=list(sim.ports.values()))
+    path = str(tmp_path / 'identities.json')
+
+    station = Station(config, identity_cache=path)
+    station.close()
+
+    assert station.ports == sim.ports
+    with open(path, encoding='utf-8') as file:
+        cached = json.load(file)
+    assert {port: identity['sensor_type'] for port, identity in cached.items()} == \
+        {port: name for name, port in sim.ports.items()}
+
+    # the second start connects with the cached identities
+    station = Station(config, identity_cache=path)
+    station.close()
+    assert station.ports == sim.ports
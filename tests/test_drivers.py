@@ -0,0 +1,87 @@
+"""
+Tests of the sensor drivers ecsense.py and cozir.py on simulated sensors.
+"""
+
+import asyncio
+import pytest
+
+import ecsense
+import simulator
+from async_serial import run_sync
+from cozir import AsyncCozirSensor, CozirSensor
+from ecsense import AsyncEcSensor, EcSensor
+
+
+@pytest.fixture
+def no_wait(monkeypatch):
+    """
+        Description: Skips the pauses between the connection attempts
+    """
+    sleep = asyncio.sleep
+    monkeypatch.setattr(ecsense.asyncio, 'sleep', lambda delay, *args: sleep(0, *args))
+
+
+def test_ec_sensor_reads_the_simulated_values():
+    device = simulator.SimulatedEcSensor('CO', waveform=simulator.constant(1.23), seed=1).start()
+    try:
+        sensor = EcSensor(device.port)
+        assert (sensor.sensor_type, sensor.unit, sensor.max_value) == ('CO', 'ppm', 10)
+        assert sensor.read() == pytest.approx([1.23, 22.5, 45.0])
+
+        sensor.change_led_status(False)
+        sensor.change_led_status(True)
+        assert sensor.read()[0] == pytest.approx(1.23)
+        del sensor
+    finally:
+        device.stop()
+
+
+def test_ec_connect_raises_after_the_last_attempt(no_wait):
+    sensor = AsyncEcSensor('/dev/does-not-exist')
+    with pytest.raises(ConnectionError):
+        run_sync(sensor.connect())
+    assert sensor.ser is None
+    sensor.close() # nothing to close
+
+
+def test_close_without_connection():
+    AsyncEcSensor('/dev/null').close()
+    run_sync(AsyncCozirSensor('/dev/null').close())
+
+
+def test_close_twice():
+    device = simulator.SimulatedEcSensor('NO2', seed=1).start()
+    try:
+        sensor = EcSensor(device.port)
+        sensor.close()
+        sensor.close()
+    finally:
+        device.stop()
+
+
+def test_cozir_connect_raises_for_a_missing_port(no_wait):
+    with pytest.raises(ConnectionError):
+        CozirSensor('/dev/does-not-exist')
+
+
+def test_cozir_sensor_reads_the_stream():
+    device = simulator.SimulatedCozirSensor(waveform=simulator.constant(512), period=0.05,
+                                            seed=1).start()
+    try:
+        sensor = CozirSensor(device.port)
+        assert sensor.read() == [512, 512]
+        del sensor
+    finally:
+        device.stop()
+
+
+def test_cozir_close_stops_the_reader_first():
+    device = simulator.SimulatedCozirSensor(period=0.02).start()
+    try:
+        sensor = CozirSensor(device.port)
+        reader = sensor.sensor._reader
+        sensor.close()
+        assert reader.done() and sensor.sensor.ser is None
+        sensor.close()
+    finally:
+        device.stop()
@@ -0,0 +1,87 @@
+"""
+Tests of the frame synchronisation and checksums of the EC sensor protocol.
+"""
+
+import os
+
+import pytest
+
+import simulator
+from async_serial import AsyncSerial, run_sync
+from ecsense import AsyncEcSensor, EcSensor
+
+
+@pytest.fixture
+def device():
+    device = simulator.SimulatedEcSensor('NO2', waveform=simulator.constant(0.456),
+                                         temperature=simulator.constant(-3.5))
+    yield device
+    os.close(device.master)
+    os.close(device.slave)
+
+
+@pytest.fixture
+def sensor(device):
+    """
+        Description: Driver on the pty of the device, the device thread is not started, the
+                     tests write the bytes themselves
+    """
+    sensor = AsyncEcSensor(device.port)
+    sensor.ser = AsyncSerial(device.port)
+    sensor._set_identity(AsyncEcSensor.parse_identity(device.info()))
+    yield sensor
+    sensor.close()
+
+
+def test_checksum_of_the_datasheet_example():
+    # read command of the datasheet: FF 01 87 00 00 00 00 00 78
+    assert AsyncEcSensor.checksum(bytes([0x01, 0x87, 0, 0, 0, 0, 0])) == 0x78
+
+
+def test_parse_identity(device):
+    assert AsyncEcSensor.parse_identity(device.info()) == {
+        'driver': 'ec', 'sensor_type': 'NO2', 'unit': 'ppm', 'max_value': 5, 'decimal': 3}
+
+
+def test_parse_identity_rejects_a_wrong_checksum(device):
+    info = bytearray(device.info())
+    info[8] ^= 0xFF
+    with pytest.raises(ValueError):
+        AsyncEcSensor.parse_identity(info)
+    with pytest.raises(ValueError):
+        AsyncEcSensor.parse_identity(device.info()[:8])
+
+
+def test_parse_uses_the_offsets_of_the_datasheet(sensor, device):
+    assert sensor.parse(device.frame()) == pytest.approx([0.456, -3.5, 45.0])
+
+
+def test_read_frame_resynchronises_after_garbage_and_corrupt_frames(sensor, device):
+    corrupt = bytearray(device.frame())
+    corrupt[7] ^= 0x10 # wrong checksum
+    os.write(device.master, b'\x00\x12\xff\x87' + bytes(corrupt) + device.frame())
+
+    frame = run_sync(sensor.read_frame(timeout=1))
+
+    assert frame == device.frame()
+    assert sensor.corrupt_frames >= 2
+
+
+def test_read_frame_returns_none_for_a_short_frame(sensor, device):
+    os.write(device.master, device.frame()[:7])
+    assert run_sync(sensor.read_frame(timeout=0.2)) is None
+    assert sensor.short_frames == 1
+
+
+def test_reads_survive_corrupted_answers():
+    device = simulator.SimulatedEcSensor('O3', waveform=simulator.constant(120), corruption=0.3,
+                                         seed=3).start()
+    try:
+        sensor = EcSensor(device.port, identity=AsyncEcSensor.parse_identity(device.info()))
+        values = [sensor.read(timeout=0.2, retries=10)[0] for _ in range(20)]
+        del sensor
+    finally:
+        device.stop()
+
+    assert values == [120] * 20
+    assert device.corrupted_frames > 0
@@ -0,0 +1,44 @@
+"""
+Tests of the lazy imports and the GPIO backends of gpio.py. Every case runs in a
+new interpreter, as the test session has loaded all modules already.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(code, gpio='auto'):
+    return subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True,
+                          env={**os.environ, 'AIRQUALITY_GPIO': gpio})
+
+
+@pytest.mark.parametrize('module', ['local_db', 'web_db', 'rollup', 'retention', 'discovery'])
+def test_entry_points_load_the_heavy_modules_later(module):
+    process = run(f'import sys, {module}\n'
+                  'print(sorted({"numpy", "serial", "prometheus_client", "RPi"} & set(sys.modules)))')
+
+    assert process.returncode == 0, process.stderr
+    assert process.stdout.strip() == '[]'
+
+
+def test_null_backend_without_a_raspberry_pi():
+    process = run('import gpio\n'
+                  'backend = gpio.backend()\n'
+                  'backend.setup(27, backend.OUT)\n'
+                  'backend.output(27, True)\n'
+                  'print(type(backend).__name__, backend.input(27))', gpio='null')
+
+    assert process.stdout.strip() == 'NullGPIO True'
+
+
+def test_rpi_backend_is_required_on_request():
+    process = run('import gpio\ngpio.backend()', gpio='rpi')
+    if process.returncode == 0:
+        pytest.skip('RPi.GPIO is installed')
+
+    assert 'RPi.GPIO is not available' in process.stderr
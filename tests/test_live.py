@@ -0,0 +1,109 @@
+"""
+Tests of the ring buffers, the downsampling and the HTTP server of live.py.
+"""
+
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+import live
+from live import LiveService, RingBuffer, downsample
+
+
+def test_ring_buffer_keeps_the_latest_values_in_order():
+    buffer = RingBuffer(4)
+    for second in range(6):
+        buffer.append(second * 1000, float(second))
+
+    times, values = buffer.window()
+    assert times.tolist() == [2000, 3000, 4000, 5000]
+    assert values.tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert buffer.window(since=3500)[1].tolist() == [4.0, 5.0]
+    assert len(buffer) == 4
+
+
+def test_ring_buffer_averages_a_second():
+    buffer = RingBuffer(4)
+    for time_ms, value in [(1000, 1.0), (1300, 2.0), (1900, 6.0), (2100, 5.0)]:
+        buffer.append(time_ms, value)
+
+    times, values = buffer.window()
+    assert times.tolist() == [1000, 2100]
+    assert values.tolist() == pytest.approx([3.0, 5.0])
+
+
+def test_downsample_buckets():
+    times = np.arange(0, 100000, 1000)
+    values = np.arange(100, dtype=float)
+
+    result = downsample(times, values, 10)
+
+    assert len(result['time']) == 10
+    assert result['value'][0] == pytest.approx(4.5)
+    assert (result['min'][0], result['max'][0]) == (0.0, 9.0)
+    assert result['max'][-1] == 99.0
+    # fewer values than points are returned as they are
+    assert downsample(times[:5], values[:5], 10)['value'] == values[:5].tolist()
+
+
+def close_in_time(service, timeout=2):
+    closing = threading.Thread(target=service.close)
+    closing.start()
+    closing.join(timeout)
+    return not closing.is_alive()
+
+
+def test_server_answers_and_closes():
+    service = LiveService({'NO2': 'ppm'})
+    service.publish([('NO2', 1000, 0.02)])
+    service.start_server(port=0, addr='127.0.0.1')
+    port = service.server.server_address[1]
+
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/latest', timeout=2) as response:
+        latest = json.load(response)
+
+    assert latest['values']['NO2']['value'] == 0.02
+    for minutes in ['inf', '1e400', 'nan', 'x']:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/history?channel=NO2&minutes={minutes}',
+                                   timeout=2)
+        assert error.value.code == 400
+    assert close_in_time(service)
+
+
+def test_close_does_not_wait_for_a_dead_serve_thread(monkeypatch):
+    # the serve thread ends before it serves, e.g. after an error
+    monkeypatch.setattr(live.ThreadingHTTPServer, 'serve_forever', lambda server: None)
+    service = LiveService({'NO2': 'ppm'})
+    service.start_server(port=0, addr='127.0.0.1')
+    service._thread.join()
+
+    assert close_in_time(service)
+
+
+def test_measurement_close_writes_the_rows_first(config, tmp_path):
+    import sqlite3
+    from local_db import MeasureAirquality
+
+    path = tmp_path / 'airquality.db'
+    measurement = MeasureAirquality(str(path), config=config, live_port=0, identity_cache=None)
+    measurement._persist_continuous([('value', 'NO2', 1000, 0.02, None)])
+
+    assert close_in_time(measurement)
+    assert measurement.live is None
+    measurement.close() # closing again does nothing
+    con = sqlite3.connect(path)
+    assert con.execute('SELECT count(*) FROM measurement').fetchone()[0] == 1
+    con.close()
+
+
+def test_failed_constructor_leaves_nothing_to_close(tmp_path):
+    from local_db import MeasureAirquality
+
+    with pytest.raises(ValueError):
+        MeasureAirquality(str(tmp_path / 'airquality.db'), config={'sensors': []},
+                          identity_cache=None)
@@ -0,0 +1,46 @@
+"""
+Tests of the Prometheus metrics of metrics.py.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+from prometheus_client import REGISTRY
+
+import metrics
+import simulator
+from ecsense import EcSensor
+
+
+def test_metrics_are_created_on_first_use():
+    code = ('import sys, metrics\n'
+            'assert "prometheus_client" not in sys.modules\n'
+            'metrics.CYCLE_DURATION.observe(1)\n'
+            'assert "prometheus_client" in sys.modules\n')
+    subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(metrics.__file__), check=True)
+
+
+def test_unknown_metric():
+    with pytest.raises(AttributeError):
+        metrics.NOT_A_METRIC
+
+
+def test_reads_update_the_frame_metrics():
+    def value(name, sensor):
+        return REGISTRY.get_sample_value(name, {'sensor': sensor}) or 0
+
+    device = simulator.SimulatedEcSensor('O3', corruption=0.5, seed=5).start()
+    try:
+        sensor = EcSensor(device.port)
+        latencies = value('airquality_frame_latency_seconds_count', 'O3')
+        corrupt = value('airquality_corrupt_frames_total', 'O3') + value('airquality_short_frames_total', 'O3')
+        for _ in range(10):
+            sensor.read(timeout=0.2, retries=20)
+        sensor.close()
+    finally:
+        device.stop()
+
+    assert value('airquality_frame_latency_seconds_count', 'O3') == latencies + 10
+    assert value('airquality_corrupt_frames_total', 'O3') + value('airquality_short_frames_total', 'O3') > corrupt
@@ -0,0 +1,72 @@
+"""
+Tests of the stages and the pipeline of pipeline.py.
+"""
+
+import threading
+
+import pytest
+
+from pipeline import Pipeline, Source, Stage, _STOP
+
+
+def test_items_pass_all_stages():
+    results = []
+    sink = Stage('sink', results.append)
+    double = Stage('double', lambda item: 2 * item, outputs=[sink])
+    counter = iter(range(5))
+    source = Source('source', lambda: next(counter), period=0.001, outputs=[double], cycles=5)
+
+    Pipeline(source, [double, sink]).run()
+
+    assert results == [0, 2, 4, 6, 8]
+    assert source.processed == 5 and sink.processed == 5
+
+
+@pytest.mark.parametrize('policy, kept', [(Stage.DROP_OLDEST, [3, 4]), (Stage.DROP_NEWEST, [1, 2])])
+def test_full_queue_policies(policy, kept):
+    stage = Stage('slow', lambda item: item, maxsize=2, policy=policy)
+    for item in [1, 2, 3, 4]:
+        stage.put(item)
+
+    assert [stage.inbox.get_nowait() for _ in range(2)] == kept
+    assert stage.dropped == 2
+
+
+def test_failing_items_are_counted():
+    results = []
+    sink = Stage('sink', results.append)
+    stage = Stage('fragile', lambda item: 1 / item, outputs=[sink])
+    stage.start()
+    sink.start()
+    for item in [1, 0, 2]:
+        stage.put(item)
+    stage.put(_STOP)
+    stage.join(2)
+    sink.join(2)
+
+    assert results == [1.0, 0.5]
+    assert stage.failed == 1 and stage.processed == 2
+
+
+def test_stop_interrupts_the_source():
+    started = threading.Event()
+    source = Source('source', started.set, period=3600)
+    pipeline = Pipeline(source, [])
+    pipeline.start()
+    assert started.wait(1)
+
+    pipeline.stop()
+
+    assert not source.is_alive()
+    assert 'source' in pipeline.report()
+
+
+def test_idle_call_without_items():
+    called = threading.Event()
+    stage = Stage('persistence', lambda item: item, idle=called.set, idle_interval=0.01)
+    stage.start()
+
+    assert called.wait(1)
+    stage.inbox.put(_STOP)
+    stage.join(1)
+    assert not stage.is_alive()
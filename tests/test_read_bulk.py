@@ -0,0 +1,49 @@
+"""
+Tests of the robust aggregators and the raw samples of read_bulk().
+"""
+
+import statistics
+
+import pytest
+
+import aggregation
+import simulator
+from ecsense import EcSensor
+
+
+def test_median_and_trimmed_mean_ignore_outliers():
+    samples = [10.0, 10.5, 9.5, 10.0, 1000.0]
+
+    assert aggregation.median(samples) == 10.0
+    assert aggregation.trimmed_mean(samples) == pytest.approx(statistics.fmean([10.0, 10.0, 10.5]))
+    assert aggregation.trimmed_mean([1.0, 2.0]) == 1.5 # too few samples to cut
+
+
+@pytest.fixture
+def sensor():
+    spike = simulator.noisy(simulator.constant(2.0), sigma=0.05, seed=4)
+    device = simulator.SimulatedEcSensor('CO', waveform=spike, seed=4).start()
+    sensor = EcSensor(device.port)
+    yield sensor
+    sensor.close()
+    device.stop()
+
+
+def test_read_bulk_returns_the_statistics_of_all_samples(sensor):
+    values, stats = sensor.read_bulk(0, 10, raw=True)
+
+    assert [column.count for column in stats] == [10, 10, 10]
+    assert values[0] == pytest.approx(stats[0].mean)
+    assert values[0] == pytest.approx(2.0, abs=0.1)
+    assert values[1:] == pytest.approx([22.5, 45.0])
+
+
+@pytest.mark.parametrize('method', ['mean', 'median', 'trimmed_mean', 'std', 'min', 'max'])
+def test_read_bulk_aggregators(sensor, method):
+    values, stats = sensor.read_bulk(0, 5, aggregate=method, raw=True)
+    assert values[0] == stats[0].aggregate(method)
+
+
+def test_unknown_aggregator(sensor):
+    with pytest.raises(ValueError):
+        sensor.read_bulk(0, 2, aggregate='mode')
@@ -0,0 +1,103 @@
+"""
+Tests of the retention rules and the conversion to incremental vacuum of retention.py.
+"""
+
+import sqlite3
+
+import pytest
+
+from db_schema import INSERT_MEASUREMENT, channel_id, create_schema
+from retention import DAY_MS, RetentionManager, check_rules
+
+NOW = 40 * DAY_MS
+
+
+@pytest.fixture
+def con(tmp_path):
+    con = sqlite3.connect(tmp_path / 'airquality.db')
+    create_schema(con)
+    yield con
+    con.close()
+
+
+def fill(con, channel, days=3):
+    with con:
+        con.executemany(INSERT_MEASUREMENT, [(channel, time, 1.0, None)
+                                             for time in range(0, days * DAY_MS, 60000)])
+
+
+def count(con, table, channel):
+    return con.execute(f'SELECT count(*) FROM {table} WHERE channel_id = ?', (channel,)).fetchone()[0]
+
+
+def prune(manager):
+    while manager.step(duration=10, now=NOW):
+        pass
+
+
+def test_rules():
+    assert check_rules({'raw': 90})['raw'] == 90
+    with pytest.raises(ValueError):
+        check_rules({'10s': 1})
+    with pytest.raises(ValueError):
+        check_rules({'raw': 0})
+
+
+def test_old_raw_values_are_deleted(con):
+    no2 = channel_id(con, 'NO2', 'concentration', 'ppm')
+    raw = channel_id(con, 'NO2', 'raw', 'ppm')
+    fill(con, no2)
+    fill(con, raw)
+    manager = RetentionManager(con)
+
+    prune(manager)
+
+    assert count(con, 'measurement', no2) == count(con, 'measurement', raw) == 0
+    assert manager.pruned['raw'] == 2 * 3 * 1440
+    # the rollups kept the values, channels without rollups are not checked
+    assert count(con, 'rollup_1d', no2) == 3 and count(con, 'rollup_1d', raw) == 0
+    assert manager.rebuilt_days == 0
+    assert manager.report()['horizons'] == {'raw': 3 * DAY_MS}
+
+
+def test_incomplete_rollups_are_rebuilt_first(con):
+    no2 = channel_id(con, 'NO2', 'concentration', 'ppm')
+    fill(con, no2, days=1)
+    with con:
+        con.execute('DELETE FROM rollup_1h WHERE bucket >= ?', (12 * 3600 * 1000,))
+    manager = RetentionManager(con)
+
+    prune(manager)
+
+    assert manager.rebuilt_days == 1
+    assert con.execute('SELECT sum(count) FROM rollup_1h WHERE channel_id = ?',
+                       (no2,)).fetchone()[0] == 1440
+
+
+def test_old_databases_are_converted_on_request(tmp_path):
+    path = tmp_path / 'old.db'
+    con = sqlite3.connect(path)
+    con.execute('CREATE TABLE old (x)') # auto_vacuum can no longer be set by create_schema
+    create_schema(con)
+    assert con.execute('PRAGMA auto_vacuum').fetchone()[0] == 0
+    no2 = channel_id(con, 'NO2', 'concentration', 'ppm')
+    fill(con, no2)
+
+    # the manager never blocks the station with a VACUUM, only the convert command does
+    manager = RetentionManager(con)
+    assert not manager.incremental
+    prune(manager)
+    assert manager.vacuumed_pages == 0
+
+    fill(con, no2)
+    manager.convert()
+    assert manager.incremental
+    assert con.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    manager = RetentionManager(con) # the next start of the station
+
+    size = path.stat().st_size
+    prune(manager)
+    assert manager.vacuumed_pages > 0
+    assert con.execute('PRAGMA freelist_count').fetchone()[0] == 0
+    assert path.stat().st_size < size
+    con.close()
@@ -0,0 +1,100 @@
+"""
+Tests of the rollup triggers of db_schema.py and the queries of rollup.py.
+"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+import rollup
+from db_schema import INSERT_MEASUREMENT, ROLLUP_SCHEMA, channel_id, create_schema, rebuild_rollups
+
+HOUR_MS = 3600 * 1000
+
+
+@pytest.fixture
+def con():
+    con = sqlite3.connect(':memory:')
+    create_schema(con)
+    yield con
+    con.close()
+
+
+def insert(con, channel, times, values):
+    con.executemany(INSERT_MEASUREMENT, [(channel, int(time), float(value), None)
+                                         for time, value in zip(times, values)])
+
+
+def test_triggers_match_numpy(con):
+    rng = np.random.default_rng(1)
+    co2 = channel_id(con, 'CO2', 'concentration', 'ppm')
+    times = np.arange(0, 2 * HOUR_MS, 7000)
+    values = 420 + rng.normal(0, 0.5, len(times)) # large offset, small variance
+    insert(con, co2, times, values)
+
+    rows = con.execute('SELECT bucket, count, mean, m2, min, max FROM rollup_1h '
+                       'WHERE channel_id = ? ORDER BY bucket', (co2,)).fetchall()
+    assert [row[0] for row in rows] == [0, HOUR_MS]
+    for bucket, count, mean, m2, minimum, maximum in rows:
+        selected = values[(times >= bucket) & (times < bucket + HOUR_MS)]
+        assert count == len(selected)
+        assert mean == pytest.approx(selected.mean(), abs=1e-9)
+        assert m2 / (count - 1) == pytest.approx(selected.var(ddof=1), rel=1e-9)
+        assert (minimum, maximum) == (selected.min(), selected.max())
+
+
+def test_rebuild_gives_the_same_rollups(con):
+    gas = channel_id(con, 'NO2', 'concentration', 'ppm')
+    insert(con, gas, range(0, 600000, 5000), np.sin(np.arange(120)))
+    before = con.execute('SELECT * FROM rollup_1min ORDER BY bucket').fetchall()
+
+    rebuild_rollups(con)
+
+    after = con.execute('SELECT * FROM rollup_1min ORDER BY bucket').fetchall()
+    assert [row[:3] for row in after] == [row[:3] for row in before]
+    assert np.allclose([row[3:] for row in after], [row[3:] for row in before])
+
+
+def test_only_measured_quantities_are_rolled_up(con):
+    raw = channel_id(con, 'NO2', 'raw', 'ppm')
+    phase = channel_id(con, 'main', 'phase', 'state')
+    humidity = channel_id(con, 'station', 'humidity', '%rH')
+    for channel in [raw, phase, humidity]:
+        insert(con, channel, [0, 1000], [1, 2])
+
+    rebuild_rollups(con)
+
+    assert con.execute('SELECT DISTINCT channel_id FROM rollup_1min').fetchall() == [(humidity,)]
+
+
+def test_old_triggers_are_replaced(con):
+    raw = channel_id(con, 'NO2', 'raw', 'ppm')
+    old_trigger = ROLLUP_SCHEMA.format(name='1min', bucket_ms=60000, channels='SELECT id FROM channel')
+    con.execute('DROP TRIGGER rollup_1min_insert')
+    con.executescript(old_trigger)
+    insert(con, raw, [0], [1])
+    assert con.execute('SELECT count(*) FROM rollup_1min').fetchone()[0] == 1
+
+    create_schema(con)
+    insert(con, raw, [1000], [1])
+
+    assert con.execute('SELECT count(*) FROM rollup_1min').fetchone()[0] == 0
+
+
+def test_query_uses_the_rollups(con):
+    gas = channel_id(con, 'NO2', 'concentration', 'ppm')
+    insert(con, gas, range(0, HOUR_MS, 10000), [1.0, 3.0] * 180)
+
+    rows = rollup.query(con, gas, 0, HOUR_MS, step=3600)
+
+    assert rows == [(0, 360, 2.0, 1.0, 1.0, 3.0)]
+
+
+def test_query_of_a_channel_without_rollups(con):
+    raw = channel_id(con, 'NO2', 'raw', 'ppm')
+    insert(con, raw, range(0, 2 * HOUR_MS, 10000), [1.0, 3.0] * 360)
+
+    rows = rollup.query(con, raw, 0, 2 * HOUR_MS, step=3600)
+
+    assert rows == [(0, 360, 2.0, 1.0, 1.0, 3.0), (HOUR_MS, 360, 2.0, 1.0, 1.0, 3.0)]
@@ -0,0 +1,61 @@
+"""
+Tests of the fixed rate schedule of scheduler.py with a simulated clock.
+"""
+
+import pytest
+
+from scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, duration):
+        self.sleeps.append(duration)
+        self.now += duration
+
+
+def run(policy, durations, period=10):
+    """
+        Description: Runs cycles of the given durations
+        Return: tuple (scheduler, start times of the cycles)
+    """
+    clock = FakeClock()
+    scheduler = Scheduler(period, policy, clock=clock, sleep=clock.sleep)
+    starts = []
+    for duration in durations:
+        scheduler.wait()
+        starts.append(clock.now)
+        clock.now += duration
+    return scheduler, starts
+
+
+def test_cycles_stay_on_the_grid():
+    scheduler, starts = run(Scheduler.SKIP, [3, 8.5, 0.1, 9.9])
+
+    assert starts == [100, 110, 120, 130]
+    assert scheduler.late == 0
+
+
+def test_skip_drops_the_missed_slots():
+    scheduler, starts = run(Scheduler.SKIP, [25, 1, 1])
+
+    assert starts == [100, 130, 140]
+    assert (scheduler.late, scheduler.skipped) == (1, 2)
+
+
+def test_catch_up_runs_the_missed_slots():
+    scheduler, starts = run(Scheduler.CATCH_UP, [25, 1, 1, 1])
+
+    assert starts == [100, 125, 126, 130]
+    assert scheduler.late == 2 and scheduler.skipped == 0
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        Scheduler(10, 'later')
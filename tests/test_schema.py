@@ -0,0 +1,77 @@
+"""
+Tests of the channel/measurement schema and the migration of the old per gas tables.
+"""
+
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import pytest
+
+from db_schema import INSERT_MEASUREMENT, channel_id, create_schema, epoch_ms
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'device_data'))
+from db_migrate import migrate
+
+
+@pytest.fixture
+def con():
+    con = sqlite3.connect(':memory:')
+    create_schema(con)
+    yield con
+    con.close()
+
+
+def test_channel_id_is_created_once(con):
+    first = channel_id(con, 'NO2', 'concentration', 'ppm')
+    assert channel_id(con, 'NO2', 'concentration', 'ppm') == first
+    assert channel_id(con, 'NO2', 'temperature', '°C') != first
+    assert con.execute('SELECT count(*) FROM channel').fetchone()[0] == 2
+
+
+def test_duplicate_rows_are_ignored(con):
+    gas = channel_id(con, 'NO2', 'concentration', 'ppm')
+    con.execute(INSERT_MEASUREMENT, (gas, 1000, 1.0, None))
+    con.execute(INSERT_MEASUREMENT, (gas, 1000, 2.0, None))
+
+    assert con.execute('SELECT value FROM measurement').fetchall() == [(1.0,)]
+    assert con.execute('SELECT count FROM rollup_1min').fetchall() == [(1,)]
+
+
+def test_create_schema_twice(con):
+    create_schema(con)
+    assert con.execute('SELECT count(*) FROM channel').fetchone()[0] == 0
+
+
+def test_migrate_the_old_tables(tmp_path):
+    path = str(tmp_path / 'airquality.db')
+    with sqlite3.connect(path) as con:
+        for gas in ['NO2', 'CO2']:
+            con.execute(f'CREATE TABLE {gas} (timestamp TEXT, value REAL, unit TEXT, '
+                        'temperature REAL, humidity REAL)')
+            con.executemany(f'INSERT INTO {gas} VALUES (?, ?, ?, 21.5, 40)',
+                            [('2023-04-19 12:00:00', 1.5, 'ppm'),
+                             ('2023-04-19 12:00:10', 2.5, 'ppm')])
+    con.close()
+
+    migrate(path)
+
+    with sqlite3.connect(path) as con:
+        tables = {row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert 'NO2' not in tables and 'CO2' not in tables
+        rows = con.execute("""SELECT sensor, quantity, time, value FROM measurement
+                              JOIN channel ON channel.id = channel_id
+                              ORDER BY sensor, quantity, time""").fetchall()
+    con.close()
+
+    start = epoch_ms(datetime(2023, 4, 19, 12, 0, 0))
+    assert rows == [('CO2', 'concentration', start, 1.5),
+                    ('CO2', 'concentration', start + 10000, 2.5),
+                    ('NO2', 'concentration', start, 1.5),
+                    ('NO2', 'concentration', start + 10000, 2.5),
+                    ('station', 'humidity', start, 40.0),
+                    ('station', 'humidity', start + 10000, 40.0),
+                    ('station', 'temperature', start, 21.5),
+                    ('station', 'temperature', start + 10000, 21.5)]
@@ -0,0 +1,86 @@
+"""
+Tests of the simulated sensors and GPIO of simulator.py.
+"""
+
+import os
+import select
+import time
+
+import pytest
+
+import gpio
+import simulator
+from ecsense import AsyncEcSensor
+
+READ_COMMAND = b'\xff\x01\x87\x00\x00\x00\x00\x00\x78'
+
+
+def ask(device, command, size):
+    """
+        Description: Sends a command from the driver side of the pty and reads size bytes
+    """
+    fd = os.open(device.port, os.O_RDWR | os.O_NOCTTY)
+    try:
+        os.write(fd, command)
+        data = b''
+        deadline = time.monotonic() + 1
+        while len(data) < size and time.monotonic() < deadline:
+            if select.select([fd], [], [], 0.05)[0]:
+                data += os.read(fd, size - len(data))
+        return data
+    finally:
+        os.close(fd)
+
+
+@pytest.mark.parametrize('gas', ['NO2', 'O3', 'CO'])
+def test_ec_sensor_answers_the_datasheet_commands(gas):
+    device = simulator.SimulatedEcSensor(gas, waveform=simulator.constant(1)).start()
+    try:
+        info = ask(device, b'\xd1', 9)
+        frame = ask(device, READ_COMMAND, 13)
+    finally:
+        device.stop()
+
+    assert AsyncEcSensor.parse_identity(info)['sensor_type'] == gas
+    assert frame[:2] == b'\xff\x87' and AsyncEcSensor.checksum(frame[1:12]) == frame[12]
+
+
+def test_cozir_sensor_streams_lines():
+    device = simulator.SimulatedCozirSensor(waveform=simulator.constant(1234), period=0.02).start()
+    try:
+        lines = ask(device, b'', 68).split(b'\r\n')
+    finally:
+        device.stop()
+
+    assert b' Z 01234 z 01234' in lines
+
+
+def test_corruption_changes_the_frames():
+    device = simulator.SimulatedEcSensor('CO', corruption=1.0, seed=2)
+    try:
+        clean = device.frame()
+        device.send(clean)
+        assert device.corrupted_frames == 1
+        corrupted = os.read(device.slave, 13)
+    finally:
+        os.close(device.master)
+        os.close(device.slave)
+
+    assert corrupted != clean
+
+
+def test_waveforms():
+    assert simulator.constant(3)(100) == 3
+    assert simulator.sine(10, 2, period=4)(1) == pytest.approx(12)
+    noisy = simulator.noisy(simulator.constant(0), 1, seed=1)
+    assert noisy(0) != noisy(0)
+
+
+def test_station_ports_and_fake_gpio(sim):
+    assert len(set(sim.ports.values())) == 4
+    assert isinstance(gpio.backend(), simulator.FakeGPIO)
+
+    backend = gpio.backend()
+    backend.setup(27, backend.OUT)
+    backend.output(27, backend.HIGH)
+    assert backend.input(27) and backend.history[-1][1:] == (27, True)
@@ -0,0 +1,83 @@
+"""
+Tests of the station file and the Station class of station.py.
+"""
+
+import pytest
+
+from conftest import station_config
+from station import Station, check_config
+
+SENSOR = {'name': 'NO2', 'driver': 'ec', 'port': '/dev/ttyS0', 'fan': 'main'}
+FAN = {'name': 'main', 'pin': 27}
+
+
+def test_defaults():
+    config = check_config({'fans': [FAN], 'sensors': [SENSOR]})
+
+    assert config['name'] == 'station'
+    assert config['fans']['main'] == {**FAN, 'vent_time': 5, 'wait_time': 2, 'period': 60}
+    assert config['sensors']['NO2']['gas'] == 'NO2'
+    assert config['sensors']['NO2']['calibration'] == {'zero': 0, 'span': 1, 'cross': {},
+                                                       'raw_unit': None}
+    assert config['continuous']['store'] == 'seconds'
+
+
+@pytest.mark.parametrize('config, message', [
+    ({'sensors': []}, 'no sensors'),
+    ({'fans': [{'pin': 27}], 'sensors': [SENSOR]}, 'needs a name'),
+    ({'fans': [FAN], 'sensors': [SENSOR, SENSOR]}, 'listed twice'),
+    ({'fans': [FAN], 'sensors': [{**SENSOR, 'driver': 'i2c'}]}, 'unknown driver'),
+    ({'sensors': [SENSOR]}, 'unknown fan'),
+    ({'fans': [{**FAN, 'vent_time': 50, 'wait_time': 20}], 'sensors': [SENSOR]}, 'exceed the period'),
+    ({'fans': [FAN], 'sensors': [{**SENSOR, 'calibration': {'cross': {'O3': 0.8}}}]}, 'unknown sensors'),
+    ({'fans': [FAN], 'sensors': [{**SENSOR, 'calibration': {'scale': 2, 'zero': 1}}]}, 'either scale'),
+    ({'fans': [FAN], 'sensors': [{**SENSOR, 'sampling': {}}]}, 'needs a tolerance'),
+    ({'fans': [FAN], 'sensors': [SENSOR], 'upload': {'node': {'columns': {'NO2': 'SO2'}}}},
+     'unknown channels'),
+    ({'fans': [FAN], 'sensors': [SENSOR], 'continuous': {'store': 'minutes'}}, 'use seconds'),
+])
+def test_invalid_station_files(config, message):
+    with pytest.raises(ValueError, match=message):
+        check_config(config)
+
+
+def test_linear_calibration():
+    config = check_config({'sensors': [{**SENSOR, 'fan': None, 'calibration': {'scale': 2, 'offset': 4}}]})
+    assert config['sensors']['NO2']['calibration'] == {'zero': -2, 'span': 2, 'cross': {},
+                                                       'raw_unit': 'ppm'}
+
+
+@pytest.fixture
+def station(sim):
+    config = station_config(sim.ports, upload={'node': {'columns': {'no2': 'NO2', 't': 'temperature'}}})
+    station = Station(config, identity_cache=None)
+    yield station
+    station.close()
+
+
+def test_station_channels(station):
+    assert station.channels() == {'O3': ('O3', 'concentration', 'ppm'),
+                                  'CO': ('CO', 'concentration', 'ppm'),
+                                  'NO2': ('NO2', 'concentration', 'ppm'),
+                                  'CO2': ('CO2', 'concentration', 'ppm'),
+                                  'temperature': ('station', 'temperature', '°C'),
+                                  'humidity': ('station', 'humidity', '%rH')}
+    assert station.raw_channels()['O3'] == ('O3', 'raw', 'ppb')
+    assert station.climate_sensors() == ['O3', 'CO', 'NO2']
+
+
+def test_cycle_of_the_simulated_station(station):
+    readings = station.acquire(vent_time=0, wait_time=0, iterations=2)
+    values = station.convert(readings)
+
+    assert station.check(readings) == []
+    assert values['temperature'] == pytest.approx(22.5)
+    assert values['O3'] == pytest.approx(values['raw']['O3'] / 1000)
+    assert station.upload_rows(values) == {'node': {'no2': values['NO2'], 't': values['temperature']}}
+
+
+def test_wrong_sensor_type_stops_the_station(sim):
+    ports = dict(sim.ports)
+    ports['NO2'], ports['CO'] = ports['CO'], ports['NO2']
+    with pytest.raises(ValueError, match='expected a (CO|NO2) sensor'):
+        Station(station_config(ports), identity_cache=None)
@@ -0,0 +1,195 @@
+"""
+Tests of the upload spool and the Uploader with the stand-in target.
+"""
+
+import time
+import sqlite3
+
+import pytest
+
+from upload_spool import PermanentUploadError, UploadSpool, Uploader, UNKNOWN_TARGET
+from upload_standin import StandInTarget
+from web_db import STVTarget
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = UploadSpool(str(tmp_path / 'spool.db'))
+    yield spool
+    spool.close()
+
+
+def fill(spool, count, target='node', start=1000.0):
+    return [spool.put(target, 'station', {'NO2': start + i}, start + i) for i in range(count)]
+
+
+def test_rows_are_spooled_once(spool):
+    assert spool.put('node', 'station', {'NO2': 1}, 1000.0) == spool.put('node', 'station', {'NO2': 2}, 1000.0)
+    assert len(spool) == 1
+
+
+def test_replay_after_an_outage(spool):
+    target = StandInTarget(offline=True)
+    uploader = Uploader(spool, {'node': target}, batch_size=5)
+    keys = fill(spool, 8)
+
+    assert uploader.upload_batch() == 0
+    assert len(spool) == 8 and spool.parked() == 0
+    assert all(row[6] == 0 for row in spool.peek(10)) # no row is blamed for the outage
+
+    target.offline = False
+    uploader._down_until.clear() # the backoff is over
+    while uploader.upload_batch():
+        pass
+
+    assert len(spool) == 0
+    assert sorted(target.rows) == sorted(keys)
+    assert [target.rows[key][2] for key in keys] == [1000.0 + i for i in range(8)]
+
+
+def test_failing_row_does_not_block_the_queue(spool):
+    stand_in = StandInTarget()
+
+    def target(sensor_id, data, timestamp, key):
+        if data['NO2'] == 1000:
+            raise ValueError('rejected by the server')
+        stand_in(sensor_id, data, timestamp, key)
+
+    uploader = Uploader(spool, {'node': target}, max_attempts=3, base_delay=0)
+    fill(spool, 5)
+
+    assert uploader.upload_batch() == 4
+    assert [row[6] for row in spool.peek(10)] == [1]
+
+    uploader.upload_batch()
+    fill(spool, 1, start=2000.0)
+    uploader.upload_batch()
+    fill(spool, 1, start=3000.0)
+    uploader.upload_batch()
+
+    assert len(spool) == 0 and spool.parked() == 1
+    assert len(stand_in.rows) == 6
+
+
+def test_unknown_target_is_parked_and_requeued(spool):
+    fill(spool, 2, target='old')
+    fill(spool, 2, target='node')
+    target = StandInTarget()
+
+    assert Uploader(spool, {'node': target}).upload_batch() == 2
+    assert len(spool) == 0 and spool.parked() == 2
+
+    Uploader(spool, {'node': target, 'old': target}).upload_batch()
+    assert spool.parked() == 0 and len(target.rows) == 4
+
+
+def test_rejected_rows_are_parked(spool):
+    def target(sensor_id, data, timestamp, key):
+        raise PermanentUploadError('never')
+
+    Uploader(spool, {'node': target}).upload_batch()
+
+    assert len(spool) == 0
+    fill(spool, 1)
+    Uploader(spool, {'node': target}).upload_batch()
+    reasons = spool.con.execute('SELECT reason FROM parked').fetchall()
+    assert reasons == [('rejected: never',)]
+    assert spool.requeue(['node']) == 1 and len(spool) == 1
+
+
+def test_batched_target_falls_back_to_single_rows(spool):
+    class Target(StandInTarget):
+        def upload_many(self, rows):
+            for row in rows:
+                self(*row)
+
+        def __call__(self, sensor_id, data, timestamp, key):
+            if data['NO2'] == 1002:
+                raise ValueError('nack')
+            super().__call__(sensor_id, data, timestamp, key)
+
+    target = Target()
+    fill(spool, 4)
+
+    assert Uploader(spool, {'node': target}).upload_batch() == 3
+    assert [row[6] for row in spool.peek(10, now=time.time() + 3600)] == [1]
+
+
+def test_stv_target_parks_old_rows():
+    class Client:
+        rows = []
+
+        def insert_data(self, sensor_id, data):
+            self.rows.append((sensor_id, data))
+
+    target = STVTarget(Client(), max_age=60)
+    target('station', {'NO2': 1}, time.time() - 5, 'key')
+    with pytest.raises(PermanentUploadError):
+        target('station', {'NO2': 2}, time.time() - 600, 'key')
+    assert Client.rows == [('station', {'NO2': 1})]
+
+
+def test_spool_of_an_older_version(tmp_path):
+    path = str(tmp_path / 'spool.db')
+    with sqlite3.connect(path) as con:
+        con.execute("""CREATE TABLE spool (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL UNIQUE,
+                       target TEXT NOT NULL, sensor_id TEXT NOT NULL, timestamp REAL NOT NULL,
+                       data TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)""")
+        con.execute("""INSERT INTO spool (key, target, sensor_id, timestamp, data)
+                       VALUES ('k', 'node', 'station', 1, '{}')""")
+    con.close()
+
+    spool = UploadSpool(path)
+    assert [row[1] for row in spool.peek(10)] == ['k']
+    spool.close()
+
+
+def test_uploader_survives_spool_errors(spool, monkeypatch):
+    target = StandInTarget()
+    fill(spool, 3)
+    peek = spool.peek
+    calls = []
+
+    def failing_peek(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return peek(*args)
+
+    monkeypatch.setattr(spool, 'peek', failing_peek)
+    uploader = Uploader(spool, {'node': target}, base_delay=0.01)
+    uploader.start()
+    deadline = time.monotonic() + 3
+    while len(target.rows) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    uploader.stop()
+
+    assert len(target.rows) == 3
+    assert len(calls) > 1
+
+
+def test_stv_target_forwards_late_rows_loudly(caplog):
+    class Client:
+        rows = []
+
+        def insert_data(self, sensor_id, data):
+            self.rows.append((sensor_id, data))
+
+    target = STVTarget(Client())
+    target('station', {'NO2': 1}, time.time() - 3600, 'key')
+
+    assert Client.rows == [('station', {'NO2': 1})]
+    assert 'stored with the time of the insert' in caplog.text
+
+
+def test_stv_target_sends_the_measurement_time():
+    class Client:
+        rows = []
+
+        def insert_data(self, sensor_id, data, timestamp=None):
+            self.rows.append((sensor_id, data, timestamp))
+
+    target = STVTarget(Client(), max_age=60)
+    target('station', {'NO2': 1}, 1000.0, 'key')
+
+    assert Client.rows == [('station', {'NO2': 1}, 1000.0)]
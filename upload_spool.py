@@ -0,0 +1,369 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Store-and-forward queue for the uploads to the remote database.
+The measurement loop only appends rows to a local sqlite spool, which takes a
+few milliseconds. A background thread uploads the spooled rows in batches and
+retries failed uploads with exponential backoff. The spool survives restarts,
+so nothing is lost while the server is slow or unreachable.
+
+Every row gets a deduplication key (target, sensor id and measurement time).
+A row is spooled only once per key and deleted only after a successful upload.
+Targets which accept the key can use it to drop the duplicate that occurs when
+the station stops between an upload and the deletion of the row.
+
+A failing row must not block the rows behind it. When a row fails but a later
+row of the same target is uploaded, the row itself is the problem: it is
+retried with its own backoff and parked after max_attempts attempts. When two
+rows in a row fail, the target is down and all its rows wait with the backoff
+of the target, without counting attempts. Rows of targets which are not
+configured and rows a target rejects with PermanentUploadError are parked at
+once. Parked rows stay in the table "parked" of the spool file for inspection.
+"""
+
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+import metrics
+
+
+# reason of the rows whose target is not configured, see UploadSpool.requeue()
+UNKNOWN_TARGET = 'unknown target'
+
+
+class PermanentUploadError(Exception):
+    """
+    Raised by a target for a row which will never be accepted, the row is parked.
+    """
+
+
+class UploadSpool:
+    """
+    Persistent queue of pending uploads.
+    """
+
+    COLUMNS = 'id, key, target, sensor_id, timestamp, data, attempts'
+
+    def __init__(self, path):
+        """
+            ### Constructor ###
+            Parameters: path: path to the sqlite file of the spool
+        """
+        self._lock = threading.Lock()
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute('PRAGMA journal_mode=WAL')
+        self.con.execute('PRAGMA synchronous=NORMAL')
+        self.con.execute("""CREATE TABLE IF NOT EXISTS spool (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                key TEXT NOT NULL UNIQUE,
+                                target TEXT NOT NULL,
+                                sensor_id TEXT NOT NULL,
+                                timestamp REAL NOT NULL,
+                                data TEXT NOT NULL,
+                                attempts INTEGER NOT NULL DEFAULT 0,
+                                retry_at REAL NOT NULL DEFAULT 0)""")
+        # spools of older versions retry every row immediately
+        if 'retry_at' not in [column[1] for column in self.con.execute('PRAGMA table_info(spool)')]:
+            self.con.execute('ALTER TABLE spool ADD COLUMN retry_at REAL NOT NULL DEFAULT 0')
+        self.con.execute("""CREATE TABLE IF NOT EXISTS parked (
+                                id INTEGER PRIMARY KEY,
+                                key TEXT NOT NULL UNIQUE,
+                                target TEXT NOT NULL,
+                                sensor_id TEXT NOT NULL,
+                                timestamp REAL NOT NULL,
+                                data TEXT NOT NULL,
+                                attempts INTEGER NOT NULL,
+                                reason TEXT NOT NULL,
+                                parked_at REAL NOT NULL)""")
+        self.con.commit()
+
+
+    def put(self, target, sensor_id, data, timestamp=None):
+        """
+            Description: Appends one row, a row with the same key is only stored once
+            Parameters: target: name of the upload target
+                        sensor_id: node name
+                        data: dict of values
+                        timestamp: measurement time as unix time, default now
+            Return: deduplication key of the row
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        key = f'{target}/{sensor_id}/{round(timestamp * 1000)}'
+        with self._lock, self.con:
+            self.con.execute("""INSERT OR IGNORE INTO spool (key, target, sensor_id, timestamp, data)
+                                VALUES (?,?,?,?,?)""",
+                             (key, target, sensor_id, timestamp, json.dumps(data)))
+        return key
+
+
+    def peek(self, limit, skip=(), now=None):
+        """
+            Description: Oldest rows of the spool which are due for an upload
+            Parameters: limit: maximal number of rows
+                        skip: targets whose rows are left out, e.g. because they are down
+                        now: unix time the retry times are compared to, default now
+            Return: list of tuples (id, key, target, sensor_id, timestamp, data, attempts)
+        """
+        now = time.time() if now is None else now
+        skip = list(skip)
+        with self._lock:
+            rows = self.con.execute(f"""SELECT {self.COLUMNS} FROM spool
+                                        WHERE retry_at <= ? AND target NOT IN ({','.join('?' * len(skip))})
+                                        ORDER BY id LIMIT ?""", (now, *skip, limit)).fetchall()
+        return [row[:5] + (json.loads(row[5]), row[6]) for row in rows]
+
+
+    def remove(self, ids):
+        """
+            Description: Deletes uploaded rows
+        """
+        with self._lock, self.con:
+            self.con.executemany('DELETE FROM spool WHERE id = ?', [(i,) for i in ids])
+
+
+    def mark_failed(self, row_id, retry_at=0):
+        """
+            Description: Counts a failed upload attempt of a row
+            Parameters: row_id: id of the row
+                        retry_at: unix time before which the row is not uploaded again
+        """
+        with self._lock, self.con:
+            self.con.execute('UPDATE spool SET attempts = attempts + 1, retry_at = ? WHERE id = ?',
+                             (retry_at, row_id))
+
+
+    def park(self, ids, reason):
+        """
+            Description: Moves rows out of the queue into the table parked
+            Parameters: ids: ids of the rows
+                        reason: text stored with the rows
+        """
+        with self._lock, self.con:
+            for row_id in ids:
+                self.con.execute(f"""INSERT OR REPLACE INTO parked ({self.COLUMNS}, reason, parked_at)
+                                     SELECT {self.COLUMNS}, ?, ? FROM spool WHERE id = ?""",
+                                 (reason, time.time(), row_id))
+                self.con.execute('DELETE FROM spool WHERE id = ?', (row_id,))
+
+
+    def requeue(self, targets=None, reason=None):
+        """
+            Description: Moves parked rows back into the queue with a fresh attempt count
+            Parameters: targets: names of the targets, default all
+                        reason: only rows parked with this reason, default all
+            Return: number of requeued rows
+        """
+        conditions, parameters = ['1'], []
+        if targets is not None:
+            targets = list(targets)
+            conditions.append(f"target IN ({','.join('?' * len(targets))})")
+            parameters += targets
+        if reason is not None:
+            conditions.append('reason = ?')
+            parameters.append(reason)
+        where = ' AND '.join(conditions)
+        with self._lock, self.con:
+            self.con.execute(f"""INSERT OR IGNORE INTO spool (key, target, sensor_id, timestamp, data)
+                                 SELECT key, target, sensor_id, timestamp, data FROM parked
+                                 WHERE {where} ORDER BY id""", parameters)
+            return self.con.execute(f'DELETE FROM parked WHERE {where}', parameters).rowcount
+
+
+    def parked(self) -> int:
+        """
+            Description: Number of parked rows
+        """
+        with self._lock:
+            return self.con.execute('SELECT count(*) FROM parked').fetchone()[0]
+
+
+    def __len__(self):
+        with self._lock:
+            return self.con.execute('SELECT count(*) FROM spool').fetchone()[0]
+
+
+    def close(self):
+        """
+            Description: Closes the spool database
+        """
+        with self._lock:
+            self.con.close()
+
+
+class Uploader(threading.Thread):
+    """
+    Background thread which drains the spool.
+    """
+
+    def __init__(self, spool, targets, batch_size=20, base_delay=1, max_delay=300, max_attempts=10):
+        """
+            ### Constructor ###
+            Parameters: spool: UploadSpool
+                        targets: dict which maps the target name to a function
+                                 upload(sensor_id, data, timestamp, key), optionally with
+                                 a method upload_many(rows) for a list of such tuples
+                        batch_size: number of rows taken from the spool at once
+                        base_delay: waiting time after the first failed upload in seconds
+                        max_delay: upper limit of the waiting time in seconds
+                        max_attempts: failed attempts after which a row is parked
+        """
+        super().__init__(name='uploader', daemon=True)
+        self.spool = spool
+        self.targets = targets
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+        self._stop_event = threading.Event()
+        self.failures = {} # target -> consecutive failed uploads
+        self._down_until = {} # target -> unix time of the next attempt
+        self.uploaded = 0
+
+        # rows of targets which are configured again
+        self.spool.requeue(targets, UNKNOWN_TARGET)
+
+
+    def retry_delay(self, failures):
+        """
+            Description: Exponential backoff depending on the number of failures
+        """
+        return min(self.max_delay, self.base_delay * 2 ** (failures - 1))
+
+
+    def upload_batch(self):
+        """
+            Description: Uploads the oldest due rows of all targets which are not down. Rows
+                         of a target with an upload_many(rows) method are sent in one call.
+            Return: number of uploaded rows
+        """
+        now = time.time()
+        down = [target for target, until in self._down_until.items() if until > now]
+        groups = {} # target -> rows in spool order
+        for row in self.spool.peek(self.batch_size, down, now):
+            groups.setdefault(row[2], []).append(row)
+
+        uploaded = []
+        try:
+            for target, group in groups.items():
+                upload = self.targets.get(target)
+                if upload is None:
+                    logging.warning(f'{len(group)} rows for the unknown upload target {target} parked')
+                    self.spool.park([row[0] for row in group], UNKNOWN_TARGET)
+                    continue
+                uploaded += self._upload_group(target, upload, group)
+        finally:
+            self.spool.remove(uploaded)
+            self.uploaded += len(uploaded)
+            metrics.SPOOL_DEPTH.set(len(self.spool))
+            metrics.SPOOL_PARKED.set(self.spool.parked())
+        return len(uploaded)
+
+
+    def _send(self, target, upload, batch):
+        """
+            Description: Uploads spooled rows (id, key, target, sensor_id, timestamp, data,
+                         attempts) with one call
+        """
+        entries = [(sensor_id, data, timestamp, key)
+                   for _, key, _, sensor_id, timestamp, data, _ in batch]
+        started_at = time.perf_counter()
+        try:
+            if len(entries) > 1:
+                upload.upload_many(entries)
+            else:
+                upload(*entries[0])
+        except Exception as error_message:
+            logging.warning(f'Upload of {batch[0][1]} ({len(batch)} rows) failed: {error_message}')
+            metrics.UPLOAD_FAILURES.labels(target).inc()
+            raise
+        metrics.UPLOAD_DURATION.labels(target).observe(time.perf_counter() - started_at)
+
+
+    def _upload_group(self, target, upload, group):
+        """
+            Description: Uploads the rows of one target, as one batch if possible and row by
+                         row after a failed batch
+            Return: ids of the uploaded rows
+        """
+        if hasattr(upload, 'upload_many') and len(group) > 1:
+            try:
+                self._send(target, upload, group)
+                self.failures[target] = 0
+                return [row[0] for row in group]
+            except Exception:
+                pass # find the failing rows
+
+        uploaded = []
+        suspect = None # failed row, blamed if a later row is uploaded
+        for row in group:
+            try:
+                self._send(target, upload, [row])
+            except PermanentUploadError as error_message:
+                self.spool.park([row[0]], f'rejected: {error_message}')
+                continue
+            except Exception as error_message:
+                if suspect is not None:
+                    break # two failures in a row: the target is down
+                suspect = (row, error_message)
+                continue
+            uploaded.append(row[0])
+            self.failures[target] = 0
+            self._down_until.pop(target, None)
+            if suspect is not None:
+                self._row_failed(*suspect)
+                suspect = None
+        else:
+            if suspect is None:
+                return uploaded
+
+        # the target is down, its rows wait without counting attempts
+        self.failures[target] = self.failures.get(target, 0) + 1
+        self._down_until[target] = time.time() + self.retry_delay(self.failures[target])
+        return uploaded
+
+
+    def _row_failed(self, row, error_message):
+        """
+            Description: Delays a row which failed while other rows of its target were uploaded
+                         and parks it after max_attempts attempts
+        """
+        attempts = row[6] + 1
+        if attempts >= self.max_attempts:
+            logging.warning(f'Upload of {row[1]} failed {attempts} times, row parked')
+            self.spool.park([row[0]], f'failed {attempts} times: {error_message}')
+        else:
+            self.spool.mark_failed(row[0], time.time() + self.retry_delay(attempts))
+
+
+    def run(self):
+        """
+            Description: Uploads until stop() is called, waits poll seconds if no row was uploaded.
+                         An error of the spool itself (disk full, locked database) is logged
+                         and retried with backoff, the thread keeps running.
+        """
+        poll = 1
+        errors = 0 # consecutive errors of the spool
+        while not self._stop_event.is_set():
+            try:
+                uploaded = self.upload_batch()
+            except Exception:
+                errors += 1
+                logging.exception('Upload spool failed')
+                self._stop_event.wait(self.retry_delay(errors))
+                continue
+            errors = 0
+            if uploaded == 0:
+                self._stop_event.wait(poll)
+
+
+    def stop(self, timeout=5):
+        """
+            Description: Stops the thread, rows which are not uploaded stay in the spool
+        """
+        self._stop_event.set()
+        self.join(timeout)
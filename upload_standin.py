@@ -0,0 +1,53 @@
+"""
+Organization: Professorship of Environmental Sensing and Modelling, TU Munich
+Date: 17.10.2026
+
+Description: Local stand-in for the remote database, used to test the upload
+path without network. It can be made slow (latency) or unreachable (offline)
+at any time and counts duplicate uploads by their deduplication key.
+"""
+
+import time
+import threading
+
+
+class StandInTarget:
+    """
+    Upload target with the signature expected by upload_spool.Uploader.
+    """
+
+    def __init__(self, latency=0.0, offline=False):
+        """
+            ### Constructor ###
+            Parameters: latency: duration of every upload in seconds
+                        offline: if True every upload fails with ConnectionError
+        """
+        self.latency = latency
+        self.offline = offline
+
+        self._lock = threading.Lock()
+        self.rows = {} # key -> (sensor_id, data, timestamp)
+        self.calls = 0
+        self.duplicates = 0
+
+
+    def __call__(self, sensor_id, data, timestamp, key):
+        """
+            Description: Stores one row after the configured latency
+        """
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if self.offline:
+                raise ConnectionError('stand-in server is offline')
+            if key in self.rows:
+                self.duplicates += 1
+            self.rows[key] = (sensor_id, data, timestamp)
+
+
+    def insert_data(self, sensor_id, data):
+        """
+            Description: Same call as STVClient.insert_data, the row is stamped on arrival
+        """
+        timestamp = time.time()
+        self(sensor_id, data, timestamp, f'{sensor_id}/{round(timestamp * 1000)}')
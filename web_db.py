@@ -3,19 +3,77 @@ Organization: Professorship of Environmental Sensing and Modelling, TU Munich
 Date: 14.04.2022
 Author: Daniel Kühbacher
 
-Description: This script reads our sensors and saves the measured values in a
-sqlite database.
+Description: This script reads our sensors and uploads the measured values to
+the upload targets of the station file. The rows are kept in a sqlite spool
+(upload_spool.py) until the target confirmed them.
+
+STVClient.insert_data() stamps a row with the time of the insert. If the
+client accepts a "timestamp" argument, STVTarget passes the measurement time
+and a spooled row is stored correctly however late it is sent. Otherwise late
+rows (after an outage or a restart) are still inserted, but stored with the
+time of the insert, and STVTarget logs an error about it. An upload entry with
+"max_age" (seconds) parks older rows instead. Use a collector target
+(collector.py) to replay longer outages with the measurement times.
 """
 
+import os
 import time
+import inspect
 import logging
-import sqlite3
 from datetime import datetime
 
-import RPi.GPIO as GPIO
-from ecsense import EcSensor
-from stv_client import STVClient
+import metrics
+from station import Station, CONFIG_DIR
+from upload_spool import UploadSpool, Uploader, PermanentUploadError
+from scheduler import Scheduler
+from pipeline import Pipeline, Source, Stage
+
+
+
+class STVTarget:
+    """
+    Upload target of the spool for an STVClient.
+    """
+
+    # rows older than this in seconds are reported if the client cannot store their time
+    LATE = 120
+    # time in seconds between two reports of late rows
+    REPORT_INTERVAL = 60
+
+    def __init__(self, client, max_age=None):
+        """
+            ### Constructor ###
+            Parameters: client: STVClient
+                        max_age: age in seconds beyond which a row is parked instead of
+                                 inserted by a client without timestamps, default never
+        """
+        self.client = client
+        self.max_age = max_age
+        try:
+            self.timestamps = 'timestamp' in inspect.signature(client.insert_data).parameters
+        except (TypeError, ValueError): # no signature, e.g. a C function
+            self.timestamps = False
 
+        self.late_rows = 0
+        self._reported_at = 0.0
+
+
+    def __call__(self, sensor_id, data, timestamp, key):
+        if self.timestamps:
+            self.client.insert_data(sensor_id, data, timestamp=timestamp)
+            return
+
+        age = time.time() - timestamp
+        if self.max_age is not None and age > self.max_age:
+            raise PermanentUploadError(f'{key} is {age:.0f} s old, STVClient would store it with '
+                                       'the current time')
+        self.client.insert_data(sensor_id, data)
+        if age > self.LATE:
+            self.late_rows += 1
+            if time.monotonic() - self._reported_at > self.REPORT_INTERVAL:
+                self._reported_at = time.monotonic()
+                logging.error(f'{self.late_rows} late rows so far, e.g. {key} {age:.0f} s old, are '
+                              'stored with the time of the insert: STVClient has no timestamp')
 
 
 class MeasureAirquality:
@@ -23,125 +81,177 @@ class MeasureAirquality:
     Air-quality measurement class.
     """
 
-    def __init__(self, sensor_id):
+    def __init__(self, sensor_id=None, spool_path='device_data/upload_spool.db',
+                 config=os.path.join(CONFIG_DIR, 'web_station.json'), ports=None):
         """
             Description: Constructor
-            Parameters: db_path: path to sqlite3 database
-        """
-        self._sensor_id = sensor_id
-
-        #set GPIO
-        GPIO.setwarnings(False)
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(27,GPIO.OUT)
-
-        # TODO: Possibly swap connections
-        # init sensors and serial ports
-        self.ec_o3 = EcSensor('/dev/ttyAMA1') #O3 Sensor
-        self.ec_co = EcSensor('/dev/ttyAMA2') #CO Sensor
-        self.ec_no2 = EcSensor('/dev/ttyS0') #NO2 Sensor
-
-        # Client für Stickoxide
-        self.client = STVClient(
-            database_name="stv_airquality_course",
-            table_name="sensor_node",
-            data_columns=["no2"],
-            units={"no2": "µg/m³"},
-            descriptions={"no2": "Sensorwert Stickoxide"},
-            minima={"no2": 0},
-            decimal_places={"no2": 1},
-            print_stuff=False,
-        )
-        # Client für alle Sensorwerte
-        self.client_verbose = STVClient(
-            database_name="stv_airquality_course",
-            table_name="sensor_node_verbose",
-            data_columns=["no2", "co", "o3", "temperatur", "luftfeuchtigkeit"],
-            units={"no2": "µg/m³", "co": "mg/m³","o3": "µg/m³", "temperatur": "°C", "luftfeuchtigkeit": "%rH"},
-            descriptions={"no2": "Stickstoffdioxid", "co": "Kohlenmonoxid", "o3": "Ozon"},
-            minima={"no2": 0, "co": 0, "o3": 0, "luftfeuchtigkeit": 0},
-            decimal_places={"no2": 1, "co": 2, "o3": 1, "temperatur": 1, "luftfeuchtigkeit": 1},
-            print_stuff=False,
-        )
-        
+            Parameters: sensor_id: node name used for the upload, default name of the station
+                        spool_path: path to the sqlite file which holds the pending uploads
+                        config: station file with fans, sensors and upload targets
+                                (see station.py)
+                        ports: dict which maps sensor names to other serial ports than in the
+                               station file (e.g. simulated ports of simulator.py)
+        """
+        # fans, sensors and serial ports
+        self.station = Station(config, ports)
+        self._sensor_id = self.station.name if sensor_id is None else sensor_id
+
+        # one client per upload target of the station file, e.g. sensor_node with the
+        # NO2 value and sensor_node_verbose with all values. A target with a "collector"
+        # address sends the rows in batches to collector.py instead of the remote database.
+        self.clients = {}
+        targets = {}
+        for target, settings in self.station.config['upload'].items():
+            if 'collector' in settings:
+                from collector import CollectorTarget
+                channels = self.station.channels()
+                self.clients[target] = targets[target] = CollectorTarget(
+                    settings['collector'],
+                    {column: channels[channel] for column, channel in settings['columns'].items()})
+                continue
+
+            from stv_client import STVClient # loads the database driver
+            arguments = {key: value for key, value in settings.items()
+                         if key not in ('columns', 'max_age')}
+            client = STVClient(table_name=arguments.pop('table_name', target),
+                               data_columns=list(settings['columns']),
+                               print_stuff=False, **arguments)
+            self.clients[target] = client
+            targets[target] = STVTarget(client, settings.get('max_age'))
+
+        # uploads are spooled on disk and sent by a background thread, a slow or
+        # unreachable server never delays the measurements
+        self.spool = UploadSpool(spool_path)
+        self.uploader = Uploader(self.spool, targets)
+        self.uploader.start()
+
         print('Connected to airquality database')
 
+        # stages of measure()
+        self.pipeline = None
+
 
-    def measurement_cycle(self, vent_time=5, wait_time=2, iterations=5) -> dict:
+    def measurement_cycle(self, vent_time=None, wait_time=None, iterations=5, concurrent=True) -> dict:
         """
-            Description: ventilates measurement channel and reads out sensors
-            Parameters: vent_time: ventilation time
-                        wait_time: wait time after ventilation
+            Description: ventilates measurement channels and reads out sensors
+            Parameters: vent_time: ventilation time, default from the station file
+                        wait_time: wait time after ventilation, default from the station file
                         iterations: number of measurements that are averaged
-            Return: dict which holds the measured gas concentration, temperature and humidity
+                        concurrent: read all sensors in parallel instead of one after another
+            Return: dict which holds the converted gas concentration of every sensor,
+                    temperature and humidity
         """
+        return self.station.convert(
+            self.station.acquire(vent_time, wait_time, iterations, concurrent))
 
-        # ventilate channel
-        GPIO.output(27,True)
-        time.sleep(vent_time)
-        GPIO.output(27,False)
-        time.sleep(wait_time)
 
-        [con_o3, temp_o3, hum_o3] = self.ec_o3.read_bulk(iterations=iterations, delay=0.2)
-        [con_co, temp_co, hum_co] = self.ec_co.read_bulk(iterations=iterations, delay=0.2)
-        [con_no2, temp_no2, hum_no2] = self.ec_no2.read_bulk(iterations=iterations, delay=0.2)
-        
-        conv_o3 = 1.96
-        conv_co = 1.15
-        conv_no2 = 1.88
+    def measure(self, time_between_cycles = 30, policy = Scheduler.SKIP):
+        """
+            Description: measure gas concentration in a loop and spool the values for upload.
+                         Acquisition, conversion, upload and display run as separate stages
+                         (pipeline.py), a slow upload never delays the next cycle.
+            Parameters: time_between_cycles: period of the cycles in seconds
+                        policy: handling of cycles that start too late, Scheduler.SKIP waits for
+                                the next slot, Scheduler.CATCH_UP starts immediately
+        """
+        logging.info("Main    : Starting measurements")
 
-        values = {  self.ec_o3.sensor_type:(con_o3*conv_o3), # convert o3 values from ppb to µg/m³
-                    self.ec_no2.sensor_type:(con_no2*1000)*conv_no2, # convert no2 values from ppm to µg/m³
-                    self.ec_co.sensor_type:(con_co)*conv_co, # convert co values from ppm to mg/m³
-                    'temperature':(temp_o3 + temp_co + temp_no2)/3,
-                    'humidity':(hum_o3+ hum_no2+ hum_co)/3}
+        self.build_pipeline(time_between_cycles, policy).run()
 
-        return values
 
+    def build_pipeline(self, time_between_cycles, policy = Scheduler.SKIP, cycles = None,
+                       **cycle_parameters) -> Pipeline:
+        """
+            Description: stages acquisition -> conversion -> upload and display
+            Parameters: time_between_cycles, policy: see measure()
+                        cycles: number of cycles, default until stopped
+                        cycle_parameters: arguments of Station.acquire(), default times of the
+                                          station file and 5 iterations
+        """
+        def acquisition():
+            started_at = time.monotonic()
+            readings = self.station.acquire(**cycle_parameters)
+            metrics.CYCLE_DURATION.observe(time.monotonic() - started_at)
+            # the next cycle overwrites read_timings while this one is processed
+            return readings, time.time(), dict(self.station.read_timings)
 
-    def measure(self, time_between_cycles = 30):
+        # only the latest values are worth displaying
+        display = Stage('display', self._display, maxsize=1)
+        # the upload stage only writes to the spool, the Uploader thread sends the rows
+        upload = Stage('upload', self._upload, maxsize=1000)
+        conversion = Stage('conversion', self._convert, outputs=[upload, display])
+        source = Source('acquisition', acquisition, time_between_cycles,
+                        outputs=[conversion], policy=policy, cycles=cycles)
+        self.pipeline = Pipeline(source, [conversion, upload, display])
+        return self.pipeline
+
+
+    def _convert(self, cycle):
         """
-            Description: measure gas concentration in a loop and save measured values in database
+            Description: conversion and quality check stage, drops implausible cycles
         """
-        logging.info("Main    : Starting measurements")
+        readings, timestamp, read_timings = cycle
+        var = self.station.convert(readings)
+        problems = self.station.check(readings)
+        if problems:
+            metrics.QA_REJECTED.inc()
+            logging.warning(f"Cycle rejected: {', '.join(problems)}")
+            return None
+        return var, timestamp, read_timings
+
+
+    def _upload(self, cycle):
+        """
+            Description: upload stage, appends the values to the upload spool
+        """
+        var, timestamp, _ = cycle
+        for target, row in self.station.upload_rows(var).items():
+            self.spool.put(target, self._sensor_id, row, timestamp)
+        metrics.SPOOL_DEPTH.set(len(self.spool))
 
-        loop_forever=True
-        while loop_forever:
-            try:
-                execution_started_at = datetime.now().timestamp()
-
-                var = self.measurement_cycle(vent_time=5, wait_time=2, iterations=5)
-                self.client.insert_data(self._sensor_id, {"no2": var["NO2"]})
-                self.client_verbose.insert_data(self._sensor_id,
-                                                {"no2" : var["NO2"], "co" : var["CO"], "o3" : var["O3"],
-                                                 "temperatur" : var["temperature"],
-                                                 "luftfeuchtigkeit" : var["humidity"]})
-           
-                # make logging message
-                logging.info("New Measurement")
-                print("---")
-                print("|      NO2    : {0:.2f} µg/m³".format(var['NO2']))
-                print("|      O3     : {0:.2f} µg/m³".format(var['O3']))
-                print("|      CO     : {0:.2f} mg/m³".format(var['CO']))
-                print("| Temperature : {0:.1f} °C".format(var['temperature']))
-                print("|   Humidity  : {0:.1f} rH".format(var['humidity']))
-                print("---\n")
-
-                execution_ended_at = datetime.now().timestamp()
-                time_to_wait = time_between_cycles - (execution_ended_at - execution_started_at)
-                time_to_wait = 0 if time_to_wait < 0 else time_to_wait
-                time.sleep(time_to_wait)
-
-            except KeyboardInterrupt:
-                loop_forever = False
+
+    def _display(self, cycle):
+        """
+            Description: display stage, metrics and console output
+        """
+        var, timestamp, read_timings = cycle
+
+        for name, (started_at, finished_at) in read_timings.items():
+            metrics.SENSOR_READ_DURATION.labels(name).observe(finished_at - started_at)
+        units = {name: self.station.settings(name)['unit'] for name in self.station.sensors}
+        units.update({'temperature': '°C', 'humidity': '%rH'})
+        for name, unit in units.items():
+            if var[name] is not None:
+                metrics.LATEST_VALUE.labels(name, unit).set(var[name])
+
+        # make logging message
+        logging.info("New Measurement")
+        for name, (started_at, finished_at) in read_timings.items():
+            logging.info(f"{name} read from {datetime.fromtimestamp(started_at):%H:%M:%S.%f}"
+                         f" to {datetime.fromtimestamp(finished_at):%H:%M:%S.%f}")
+        print("---")
+        for name in self.station.sensors:
+            print("| {0:>11} : {1:.2f} {2}".format(name, var[name], units[name]))
+        if var['temperature'] is not None:
+            print("| Temperature : {0:.1f} °C".format(var['temperature']))
+            print("|   Humidity  : {0:.1f} rH".format(var['humidity']))
+        print("|   Uploads   : {} pending".format(len(self.spool)))
+        print("---")
+        print(self.pipeline.report())
+        print("---\n")
 
     def __del__(self):
         """
-            Description: Destructor; close db connection and cleanup GPIOs
+            Description: Destructor; stop uploads, close db connection and cleanup GPIOs
         """
-        del self.client
-        del self.client_verbose
-        GPIO.cleanup()
+        self.uploader.stop()
+        # an upload which is still running needs the spool, it closes with the process
+        if self.uploader.is_alive():
+            logging.warning('Upload still running, the spool is left open')
+        else:
+            self.spool.close()
+        self.clients.clear()
+        self.station.close()
 
 
 if __name__ == "__main__":
@@ -152,11 +262,14 @@ if __name__ == "__main__":
     format = "%(asctime)s: %(message)s"
     logging.basicConfig(format=format, level=logging.INFO, datefmt="%H:%M:%S")
 
+    # Prometheus metrics on http://<station>:8000/metrics
+    metrics.start_server(8000)
+
     ### Start of the measurements
     print('\n\nStart logging...')
 
-    # TODO: Adjust node name
-    measurement_obj = MeasureAirquality(sensor_id = "node 1")
+    # node name, ports and upload targets: config/web_station.json
+    measurement_obj = MeasureAirquality()
     measurement_obj.measure(time_between_cycles = 15)
 
     del measurement_obj